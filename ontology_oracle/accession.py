@@ -5,6 +5,10 @@
 import urllib2
 import utils, ontology
 
+url_uniprot = 'http://www.uniprot.org/uniprot/%s.txt'
+url_efetch = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?' \
+             'db=%s&id=%s&rettype=gb&retmode=text'
+
 class reference:
     def __init__(self):
         self.authors = ''
@@ -31,8 +35,89 @@ class reference:
             ret.append('Cited for: %s' % self.position)
         return '  '.join(ret)
 
+# line codes of the reference blocks of UniProt entries
+_reference_codes = {
+    'RN': 'number',
+    'RP': 'position',
+    'RC': 'comments',
+    'RX': 'cross_references',
+    'RG': 'group',
+    'RA': 'authors',
+    'RT': 'title',
+    'RL': 'location',
+}
+
+def _set_reference(ref, contents):
+    for code, value in contents.iteritems():
+        ref.set(_reference_codes[code], ' '.join(value))
+
+def iter_records(stream):
+    '''
+    Iterates over the records in a stream of concatenated flat-file records
+    (GenBank, UniProt), yielding the text of each record including its
+    terminating // line.  stream may be a string or any iterable of lines,
+    such as an open file (see utils.open_file for compressed files).
+    '''
+    if isinstance(stream, basestring):
+        stream = stream.splitlines(True)
+    current = []
+    for line in stream:
+        if line.startswith('//'):
+            current.append('//')
+            yield ''.join(current)
+            current = []
+        elif len(current) > 0 or not line.isspace():
+            current.append(line)
+
+def split_records(text):
+    '''
+    Splits a stream of concatenated flat-file records (GenBank, UniProt)
+    into individual records, each including its terminating // line.
+    '''
+    return list(iter_records(text))
+
+# local flat files (see flatfile.py) from which records are read before
+# resorting to downloading them, by database
+local_sources = {
+    'uniprot': [],
+    'ncbi:protein': [],
+}
+
+def local_record(db, id):
+    '''
+    Returns the text of the record for id from the local flat files of the
+    database, or None if none of them contains it.
+    '''
+    for index in local_sources.get(db, []):
+        record = index.get(id)
+        if record is not None:
+            return record
+    return None
+
+def iter_genbank(stream):
+    '''
+    Parses the GenBank protein records (such as the output of a batch
+    efetch, or a .gpff file) in a stream (see iter_records) one at a time,
+    yielding an accession for each.
+    '''
+    for record in iter_records(stream):
+        yield accession('ncbi:protein', None, record)
+
+def iter_uniprot(stream):
+    '''
+    Parses the UniProt entries in a stream (see iter_records) one at a
+    time, yielding an accession for each.
+    '''
+    for record in iter_records(stream):
+        yield accession('uniprot', None, record)
+
 class accession:
-    def __init__(self, db, id):
+    def __init__(self, db, id, record=None):
+        '''
+        Retrieves the record for id from db ('uniprot' or 'ncbi:protein') and
+        parses it.  If the record has already been retrieved (for instance,
+        in a batch), its text can be passed as record.
+        '''
         self.db = db
         self.id = id
         self.references = []
@@ -47,11 +132,20 @@ class accession:
         self.tigrfam = []
         self.smart = []
         self.interpro = []
+        self.db_xrefs = []
 
         if self.db == 'uniprot':
-            self._populate_from_uniprot()
+            self._populate_from_uniprot(record)
         elif self.db == 'ncbi:protein':
-            self._populate_from_entrez('protein')
+            self._populate_from_entrez('protein', record)
+
+        if self.id is None:
+            # parsed from a record that was retrieved in bulk; identify it
+            # by its primary accession number
+            if 'accession_numbers' in self.__dict__:
+                self.id = self.accession_numbers.split(';')[0].strip()
+            elif 'version' in self.__dict__:
+                self.id = self.version.split(' ')[0]
 
         # cleanup ontology data
         new_list = []
@@ -109,17 +203,35 @@ class accession:
         #elif refs[0] == 'KEGG':
         #elif refs[0] == 'PATRIC':
 
-        self._lookup_go_terms()
-
     def _parse_2char_code_style(self):
+        # a single pass over the lines; the text of the codes that span
+        # several lines is joined at the end
         contents = {}
+        xrefs = []
+        sequence = []
+        ref = None
+        ref_contents = None
         for line in self.record.split('\n'):
             code = line[0:2]
             text = line[5:]
-            if code in contents:
+            if code == '  ':
+                sequence.append(text)
+            elif code == 'DR':
+                xrefs.append(text)
+            elif code in _reference_codes:
+                if code == 'RN' or ref is None:
+                    if ref is not None:
+                        _set_reference(ref, ref_contents)
+                    ref = reference()
+                    ref_contents = {}
+                    self.references.append(ref)
+                ref_contents.setdefault(code, []).append(text)
+            elif code in contents:
                 contents[code].append(text)
             else:
                 contents[code] = [text]
+        if ref is not None:
+            _set_reference(ref, ref_contents)
 
         for key, value in contents.iteritems():
             if key == 'ID':
@@ -134,7 +246,7 @@ class accession:
                 self.gene_name = ' '.join(value)
                 if self.gene_name.startswith('Name='):
                     entries = self.gene_name.split(' ')
-                    self.gene = entries[0][5:]
+                    self.gene = entries[0][5:].rstrip(';')
             elif key == 'OS':
                 self.organism_species = ' '.join(value)
             elif key == 'OG':
@@ -145,44 +257,8 @@ class accession:
                 self.taxonomy_cross_reference = value[0]
             elif key == 'OH':
                 self.organism_host = value[0]
-            elif key == 'RN':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('number', ' '.join(value))
-            elif key == 'RP':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('position', ' '.join(value))
-            elif key == 'RC':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('comments', ' '.join(value))
-            elif key == 'RX':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('cross_references', ' '.join(value))
-            elif key == 'RG':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('group', ' '.join(value))
-            elif key == 'RA':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('authors', ' '.join(value))
-            elif key == 'RT':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('title', ' '.join(value))
-            elif key == 'RL':
-                if len(self.references) == 0:
-                    self.references.append(reference())
-                self.references[0].set('location', ' '.join(value))
             elif key == 'CC':
                 self.comments = ' '.join(value)
-            elif key == 'DR':
-                self.database_cross_references = ' '.join(value)
-                for entry in value:
-                    self._process_db_xref(entry)
             elif key == 'PE':
                 self.protein_existence = value[0]
             elif key == 'KW':
@@ -191,119 +267,142 @@ class accession:
                 self.feature_table_data = ' '.join(value)
             elif key == 'SQ':
                 self.sequence_data = value[0]
-                if '  ' in contents:
-                    self.sequence = ''.join(contents['  '])
-                self.sequence = self.sequence.replace(' ', '')
-
-    def _parse_genbank_line(self, line, keylen=12):
-        if line == '//':
-            return None, None
-        return (line[0:keylen].strip(), line[keylen:])
-
-    def _parse_genbank_stanza(self, pos, joinchar=' ', keylen=12):
-        lines = self.record.split('\n')
-        code, value = self._parse_genbank_line(lines[pos], keylen)
-        if code is None:
-            return (pos, '')
-        l = [value]
-        pos += 1
-        code, value = self._parse_genbank_line(lines[pos], keylen)
-        while code is not None and code == '':
-            l.append(value)
-            pos += 1
-            code, value = self._parse_genbank_line(lines[pos], keylen)
-        return (pos, joinchar.join(l))
-
-    def _extract_ontology_data(self):
-        # the features section is in genbank-style entries
-        if 'features' in self.__dict__:
-            features = self.features.split('\n')
-            note = None
-            for i in range(len(features)):
-                line = features[i].strip()
-                # some notes span multiple lines
-                if note is not None:
-                    note = '%s %s' % (note, line)
-                    if not note.endswith('"'):
-                        continue
-                if line.startswith('/note='):
-                    note = line
-                    if not note.endswith('"'):
-                        continue
-                if note is not None:
-                    # check for pfam, TIGR, smart, etc. entries in the notes
-                    note = note[6:].strip('"')
-                    vals = note.split(';')
-                    for val in vals:
-                        val = val.strip()
-                        if val.startswith('pfam'):
-                            self.pfam.append(val)
-                        elif val.startswith('TIGR'):
-                            self.tigrfam.append(val)
-                        if val.startswith('smart'):
-                            self.smart.append(val)
-                    note = None
-                if line.startswith('/EC_number='):
-                    vals = line.split('=')
-                    self.ec.append(vals[1].strip('"'))
-                if line.startswith('/gene='):
-                    vals = line.split('=')
-                    self.gene = vals[1].strip('"')
+                self.sequence = ''.join(sequence).replace(' ', '')
 
+        if len(xrefs) > 0:
+            self.database_cross_references = ' '.join(xrefs)
+            for entry in xrefs:
+                self._process_db_xref(entry)
+        # resolve the cross-references to GO terms once, for the whole entry
         self._lookup_go_terms()
 
+    def _process_qualifier(self, qualifier):
+        # handles a /name="value" qualifier in the features of a GenBank
+        # record
+        name, sep, value = qualifier[1:].partition('=')
+        value = value.strip('"')
+        if name == 'note':
+            # check for pfam, TIGR, smart, etc. entries in the notes
+            for val in value.split(';'):
+                val = val.strip()
+                if val.startswith('pfam'):
+                    self.pfam.append(val)
+                elif val.startswith('TIGR'):
+                    self.tigrfam.append(val)
+                elif val.startswith('smart'):
+                    self.smart.append(val)
+        elif name == 'EC_number':
+            self.ec.append(value)
+        elif name == 'gene':
+            self.gene = value
+        elif name == 'db_xref':
+            self.db_xrefs.append(value)
+
     def _parse_genbank_style(self):
-        lines = self.record.split('\n')
-        pos = 0
-        while pos < len(lines):
-            code, value = self._parse_genbank_line(lines[pos])
+        # a single pass over the lines: keywords occupy the first 12
+        # columns, and continuation lines leave them blank.  Within FEATURES
+        # and ORIGIN, every indented line belongs to the section; the
+        # qualifiers of the features (which may span several lines) are
+        # processed as soon as they are complete.
+        stanzas = {}
+        section = None
+        lines = []
+        qualifier = None
+        for line in self.record.split('\n'):
+            if line == '//':
+                break
+            if line[0:1] not in (' ', ''):
+                section = line[0:12].strip()
+                if section in ('FEATURES', 'ORIGIN'):
+                    lines = []
+                else:
+                    lines = [line[12:]]
+                stanzas[section] = lines
+            elif section in ('FEATURES', 'ORIGIN'):
+                lines.append(line[1:])
+                if section == 'ORIGIN':
+                    continue
+                text = line.strip()
+                if text.startswith('/') or line[5:6] != ' ':
+                    # a new qualifier or a new feature
+                    if qualifier is not None:
+                        self._process_qualifier(qualifier)
+                        qualifier = None
+                    if text.startswith('/'):
+                        qualifier = text
+                elif qualifier is not None:
+                    qualifier = '%s %s' % (qualifier, text)
+            else:
+                lines.append(line[12:])
+        if qualifier is not None:
+            self._process_qualifier(qualifier)
 
+        for code, lines in stanzas.iteritems():
             if code == 'LOCUS':
-                self.locus = value
-                pos += 1
+                self.locus = lines[0]
             elif code == 'DEFINITION':
-                pos, self.definition = self._parse_genbank_stanza(pos)
+                self.definition = ' '.join(lines)
             elif code == 'ACCESSION':
-                self.accession = value
-                pos += 1
+                self.accession = lines[0]
             elif code == 'VERSION':
-                self.version = value
-                pos += 1
+                self.version = lines[0]
             #elif code == 'DBLINK':
             #elif code == 'DBSOURCE':
             #elif code == 'KEYWORDS':
             #elif code == 'SOURCE':
             #elif code == 'REFERENCE':
             elif code == 'COMMENT':
-                pos, self.comment = self._parse_genbank_stanza(pos, '\n')
+                self.comment = '\n'.join(lines)
             elif code == 'FEATURES':
-                pos += 1
-                pos, self.features = self._parse_genbank_stanza(pos, '\n',
-                            keylen=1)
+                self.features = '\n'.join(lines)
             elif code == 'ORIGIN':
-                pos += 1
-                pos, self.sequence_data = self._parse_genbank_stanza(pos,
-                            '\n', keylen=1)
-                seq = [x[9:] for x in self.sequence_data.split('\n')]
+                self.sequence_data = '\n'.join(lines)
+                seq = [x[9:] for x in lines]
                 self.sequence = ''.join(seq).replace(' ', '')
-            else:
-                pos += 1
 
-        self._extract_ontology_data()
+        self._lookup_go_terms()
 
-    def _populate_from_uniprot(self):
-        url = 'http://www.uniprot.org/%s' % \
-                    urllib2.quote('uniprot/%s.txt' % self.id)
-        self.record = utils.download(url)
+    def _populate_from_uniprot(self, record=None):
+        if record is None:
+            record = local_record('uniprot', self.id)
+        if record is None:
+            url = url_uniprot % urllib2.quote(self.id)
+            record = utils.download(url)
+        self.record = record
         self._parse_2char_code_style()
 
-    def _populate_from_entrez(self, entrez_db):
-        url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?' \
-                    'db=%s&id=%s&rettype=gb&retmode=text' % (entrez_db,
-                    urllib2.quote(self.id))
-        self.record = utils.download(url)
+    def _populate_from_entrez(self, entrez_db, record=None):
+        if record is None:
+            record = local_record('ncbi:%s' % entrez_db, self.id)
+        if record is None:
+            url = url_efetch % (entrez_db, urllib2.quote(self.id))
+            record = utils.download(url)
+        self.record = record
         self._parse_genbank_style()
 
+    @property
+    def identifiers(self):
+        '''
+        The identifiers under which this record can be looked up: accession
+        numbers (with and without version) and GI number.
+        '''
+        ids = set([self.id])
+        if 'full_id' in self.__dict__:
+            ids.add(self.full_id.split(' ')[0])
+        if 'accession_numbers' in self.__dict__:
+            ids.update(x.strip() for x in self.accession_numbers.split(';'))
+        if 'accession' in self.__dict__:
+            ids.update(self.accession.split())
+        if 'version' in self.__dict__:
+            for entry in self.version.split():
+                if entry.startswith('GI:'):
+                    ids.add(entry[3:])
+                else:
+                    ids.add(entry)
+        ids.discard('')
+        ids.discard(None)
+        return ids
+
     def enrich_ontology(self, acc):
         '''
         Includes the ontology information from another accession into this
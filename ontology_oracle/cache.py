@@ -0,0 +1,242 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import os, time, zlib, sqlite3, hashlib, threading, urlparse, atexit
+
+# default time-to-live (in seconds) of cached responses, per host; None
+# means that responses from that host never expire
+day = 24 * 60 * 60
+default_ttls = {
+    'www.uniprot.org':          30 * day,
+    'eutils.ncbi.nlm.nih.gov':  30 * day,
+    'www.ebi.ac.uk':            90 * day,
+    'www.geneontology.org':     7 * day,
+    'geneontology.org':         7 * day,
+    'enzyme.expasy.org':        90 * day,
+}
+
+class response_cache:
+    """
+    Base class for persistent caches of downloaded documents, keyed by URL.
+    Subclasses implement _get, _put and _evict; this class takes care of
+    expiration, compression and hit/miss accounting.
+
+    default_ttl: time-to-live (seconds) for hosts not listed in ttls
+    ttls: dictionary of host -> time-to-live, overriding default_ttls
+    max_size: maximum size (bytes, compressed) of the cache; the least
+        recently used entries are evicted when it is exceeded
+    compression: zlib compression level of the stored documents
+    """
+    def __init__(self, default_ttl=30 * day, ttls=None,
+                 max_size=2 * 1024 * 1024 * 1024, compression=6):
+        self.default_ttl = default_ttl
+        self.ttls = dict(default_ttls)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self.compression = compression
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def ttl(self, url):
+        host = urlparse.urlparse(url).netloc.lower()
+        return self.ttls.get(host, self.default_ttl)
+
+    def get(self, url):
+        with self.lock:
+            entry = self._get(url)
+            if entry is not None:
+                stored, data = entry
+                ttl = self.ttl(url)
+                if ttl is None or time.time() - stored <= ttl:
+                    self.hits += 1
+                    return zlib.decompress(data)
+                self._delete(url)
+            self.misses += 1
+            return None
+
+    def put(self, url, data):
+        with self.lock:
+            self._put(url, zlib.compress(data, self.compression), time.time())
+            if self.size > self.max_size:
+                self.evictions += self._evict(self.max_size)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': self.size}
+
+    def __str__(self):
+        return 'hits: %d  misses: %d  evictions: %d  size: %d bytes' % \
+                    (self.hits, self.misses, self.evictions, self.size)
+
+class sqlite_cache(response_cache):
+    """
+    Stores the cached documents in a single SQLite database file.
+    """
+    def __init__(self, filename, **kwargs):
+        response_cache.__init__(self, **kwargs)
+        self.filename = os.path.expanduser(filename)
+        directory = os.path.dirname(self.filename)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # the connection is shared among threads; access is serialized by
+        # self.lock
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (' \
+                        'url TEXT PRIMARY KEY, data BLOB, size INTEGER, ' \
+                        'stored REAL, accessed REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ' \
+                        'ON responses (accessed)')
+        self.db.commit()
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) ' \
+                                    'FROM responses').fetchone()[0]
+        # the access times of cache hits (url -> time), written along with
+        # the next insertion rather than in a transaction of their own
+        self.accessed = {}
+        atexit.register(self.flush)
+
+    def _get(self, url):
+        row = self.db.execute('SELECT stored, data FROM responses ' \
+                              'WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        self.accessed[url] = time.time()
+        return (row[0], str(row[1]))
+
+    def _write_accessed(self):
+        # records the pending access times; the caller commits
+        if len(self.accessed) > 0:
+            self.db.executemany('UPDATE responses SET accessed = ? ' \
+                                'WHERE url = ?',
+                                [(t, url) for url, t in
+                                 self.accessed.iteritems()])
+            self.accessed = {}
+
+    def flush(self):
+        '''
+        Writes the access times of the cache hits since the last insertion
+        (they only matter to the eviction of the least recently used
+        entries).
+        '''
+        with self.lock:
+            self._write_accessed()
+            self.db.commit()
+
+    def _delete(self, url):
+        self.accessed.pop(url, None)
+        row = self.db.execute('SELECT size FROM responses WHERE url = ?',
+                              (url,)).fetchone()
+        if row is not None:
+            self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self.db.commit()
+            self.size -= row[0]
+
+    def _put(self, url, data, stored):
+        self._delete(url)
+        self._write_accessed()
+        self.db.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?)',
+                        (url, sqlite3.Binary(data), len(data), stored, stored))
+        self.db.commit()
+        self.size += len(data)
+
+    def _evict(self, max_size):
+        self._write_accessed()
+        evicted = 0
+        rows = self.db.execute('SELECT url, size FROM responses ' \
+                               'ORDER BY accessed').fetchall()
+        for url, size in rows:
+            if self.size <= max_size:
+                break
+            self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self.size -= size
+            evicted += 1
+        self.db.commit()
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM responses')
+            self.db.commit()
+            self.accessed = {}
+            self.size = 0
+
+class directory_cache(response_cache):
+    """
+    Stores each cached document as a separate file in a directory tree;
+    the files are named after the SHA-1 digest of the URL.  The
+    modification time of a file records when it was last accessed.
+    """
+    def __init__(self, directory, **kwargs):
+        response_cache.__init__(self, **kwargs)
+        self.directory = os.path.expanduser(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.size = sum(os.path.getsize(path) for path in self._files())
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                yield os.path.join(root, name)
+
+    def _path(self, url):
+        digest = hashlib.sha1(url).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _get(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            stored = f.readline()
+            stored_url = f.readline()
+            data = f.read()
+        if stored_url[:-1] != url:
+            return None
+        os.utime(path, None)
+        return (float(stored), data)
+
+    def _delete(self, url):
+        path = self._path(url)
+        if os.path.exists(path):
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+    def _put(self, url, data, stored):
+        self._delete(url)
+        path = self._path(url)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write('%f\n%s\n' % (stored, url))
+            f.write(data)
+        self.size += os.path.getsize(path)
+
+    def _evict(self, max_size):
+        evicted = 0
+        entries = sorted((os.path.getmtime(path), path)
+                         for path in self._files())
+        for accessed, path in entries:
+            if self.size <= max_size:
+                break
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            for path in list(self._files()):
+                os.remove(path)
+            self.size = 0
+
+def open_cache(location, **kwargs):
+    """
+    Opens a persistent cache; locations ending in .db, .sqlite or .sqlite3
+    are SQLite databases, anything else is treated as a directory.
+    """
+    if os.path.splitext(location)[1] in ('.db', '.sqlite', '.sqlite3'):
+        return sqlite_cache(location, **kwargs)
+    return directory_cache(location, **kwargs)
@@ -0,0 +1,149 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import numpy, pandas
+from ontology_table import _term_names
+
+# The functions below reduce and order the fold changes joined from
+# several tables (see ontology_table.join_tables) for large heatmaps:
+# DataFrames with a row per gene, a column of fold changes per table and
+# possibly a last column named 'annotation'.
+
+def _values(data):
+    # the fold changes, without the annotation column
+    if 'annotation' in data.columns:
+        return data.drop('annotation', axis=1).values.astype(numpy.float64)
+    return data.values.astype(numpy.float64)
+
+def most_variable(data, n):
+    '''
+    The n genes whose fold changes vary the most among the tables (by
+    variance, ignoring missing fold changes), in their original order.
+    '''
+    if len(data) <= n:
+        return data
+    values = _values(data)
+    # genes without any fold change rank last; leaving them out of nanvar
+    # also avoids its warning about empty rows
+    measured = ~numpy.isnan(values).all(axis=1)
+    variances = numpy.empty(len(values))
+    variances.fill(-numpy.inf)
+    variances[measured] = numpy.nanvar(values[measured], axis=1)
+    keep = numpy.sort(numpy.argsort(-variances, kind='mergesort')[:n])
+    return data.iloc[keep]
+
+def _linkage(values, method):
+    from scipy.cluster import hierarchy
+    # missing fold changes count as no change
+    return hierarchy.linkage(numpy.nan_to_num(values), method=method,
+                             metric='euclidean')
+
+def cluster_rows(data, method='average'):
+    '''
+    The genes ordered by hierarchical clustering of their fold changes
+    (scipy.cluster.hierarchy, with the specified linkage method), so that
+    genes regulated alike are next to each other.
+    '''
+    if len(data) < 3:
+        return data
+    from scipy.cluster import hierarchy
+    order = hierarchy.leaves_list(_linkage(_values(data), method))
+    return data.iloc[order]
+
+def collapse_clusters(data, clusters, method='average'):
+    '''
+    Replaces the genes by the mean fold changes of each of (at most)
+    clusters clusters of genes regulated alike; the rows are named by the
+    cluster number and the number of genes in it, and ordered as in
+    cluster_rows.
+    '''
+    values = _values(data)
+    columns = [c for c in data.columns if c != 'annotation']
+    if len(data) < 2:
+        return pandas.DataFrame(values, index=data.index, columns=columns)
+    from scipy.cluster import hierarchy
+    links = _linkage(values, method)
+    assignment = hierarchy.fcluster(links, clusters, criterion='maxclust')
+
+    # clusters numbered in the order of their first gene in the tree
+    order = hierarchy.leaves_list(links)
+    numbers = pandas.unique(assignment[order])
+    sizes = numpy.bincount(assignment)
+    with numpy.errstate(invalid='ignore'):
+        means = numpy.array([numpy.nanmean(values[assignment == c], axis=0)
+                             for c in numbers])
+    names = ['cluster %d (%d genes)' % (i + 1, sizes[c])
+             for i, c in enumerate(numbers)]
+    return pandas.DataFrame(means, index=pandas.Index(names, name='gene'),
+                            columns=columns)
+
+def collapse_terms(data, tables, kind='go-slim'):
+    '''
+    Replaces the genes by the mean fold changes of the genes with each
+    term of kind (GO slims by default), taking the terms of each gene from
+    the first of tables that has it; the rows are named by the name of
+    the term and the number of genes with it.
+    '''
+    values = _values(data)
+    columns = [c for c in data.columns if c != 'annotation']
+    genes = data.index.tolist()
+
+    # (gene, term) for every term of every gene
+    gene_ids = []
+    terms = []
+    found = numpy.zeros(len(genes), dtype=bool)
+    for table in tables:
+        matrix, features, table_terms = table.incidence(kind)
+        rows = numpy.array([table._positions.get(g, -1) if not f else -1
+                            for g, f in zip(genes, found)], dtype=numpy.int64)
+        present = numpy.nonzero(rows >= 0)[0]
+        found[present] = True
+        subset = matrix[rows[present]].tocoo()
+        gene_ids.append(present[subset.row])
+        terms.extend(table_terms[c] for c in subset.col.tolist())
+    gene_ids = numpy.concatenate(gene_ids) if len(gene_ids) > 0 else \
+                numpy.zeros(0, dtype=numpy.int64)
+    term_ids, unique_terms = pandas.factorize(terms)
+    unique_terms = unique_terms.tolist()
+
+    # terms x genes, times the fold changes and whether each is known
+    import scipy.sparse
+    membership = scipy.sparse.csr_matrix(
+                (numpy.ones(len(term_ids)), (term_ids, gene_ids)),
+                shape=(len(unique_terms), len(genes)))
+    known = ~numpy.isnan(values)
+    sums = membership.dot(numpy.where(known, values, 0.0))
+    counts = membership.dot(known.astype(numpy.float64))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    means[counts == 0] = numpy.nan
+
+    sizes = numpy.bincount(term_ids, minlength=len(unique_terms))
+    term_names = _term_names(unique_terms, kind)[0]
+    names = ['%s (%d genes)' % (name, size)
+             for name, size in zip(term_names, sizes)]
+    return pandas.DataFrame(means, index=pandas.Index(names, name='gene'),
+                            columns=columns)
+
+def arrange(data, tables=None, top=None, collapse=None, clusters=20,
+            cluster=False, method='average'):
+    '''
+    Reduces and orders the joined fold changes for a heatmap: keeps the
+    top most variable genes (see most_variable), collapses the genes into
+    'go-slim' rows (see collapse_terms; requires the tables the data was
+    joined from) or 'clusters' rows (see collapse_clusters), and orders
+    the rows by clustering them (see cluster_rows).  Returns the data and
+    whether its rows are in a meaningful order.
+    '''
+    if top is not None:
+        data = most_variable(data, top)
+    if collapse == 'go-slim':
+        data = collapse_terms(data, tables, 'go-slim')
+    elif collapse == 'clusters':
+        data = collapse_clusters(data, clusters, method)
+    elif collapse is not None:
+        raise Exception('unknown way of collapsing genes: %s' % collapse)
+    if cluster or collapse == 'go-slim':
+        data = cluster_rows(data, method)
+    return data, cluster or collapse is not None
@@ -0,0 +1,219 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import numpy, pandas
+
+class vocabulary:
+    '''
+    Interned strings (GO terms, EC numbers, Pfam families, ...) shared by
+    the term columns of a table; each string is referred to by its code,
+    the position at which it was first added.
+    '''
+    def __init__(self, terms=None):
+        self.terms = []
+        self.codes = {}
+        if terms is not None:
+            for term in terms:
+                self.code(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, code):
+        return self.terms[code]
+
+    def __contains__(self, term):
+        return term in self.codes
+
+    def code(self, term):
+        '''
+        The code of a string, which is added if it is not yet known.
+        '''
+        code = self.codes.get(term)
+        if code is None:
+            code = len(self.terms)
+            self.codes[term] = code
+            self.terms.append(term)
+        return code
+
+    def encode(self, terms):
+        return numpy.array([self.code(term) for term in terms],
+                           dtype=numpy.int32)
+
+    def lookup(self, terms):
+        '''
+        The codes of the strings, as an array; -1 for unknown strings
+        (which, unlike with encode, are not added).
+        '''
+        return numpy.array([self.codes.get(term, -1) for term in terms],
+                           dtype=numpy.int32)
+
+    def decode(self, codes):
+        terms = self.terms
+        return [terms[code] for code in codes]
+
+class term_column:
+    '''
+    A column holding a list of terms for each row of a table, stored
+    CSR-style: the codes (in a vocabulary) of the terms of all the rows in
+    one array, delimited by offsets, so that the codes of the terms of row
+    i are codes[offsets[i]:offsets[i + 1]].
+    '''
+    def __init__(self, vocab, offsets, codes):
+        self.vocabulary = vocab
+        self.offsets = offsets
+        self.codes = codes
+
+    @classmethod
+    def empty(cls, vocab, rows):
+        return cls(vocab, numpy.zeros(rows + 1, dtype=numpy.int64),
+                   numpy.zeros(0, dtype=numpy.int32))
+
+    @classmethod
+    def from_lists(cls, vocab, lists):
+        '''
+        Builds a column from a list of term lists, one per row; duplicate
+        terms within a row are kept only once.
+        '''
+        offsets = numpy.zeros(len(lists) + 1, dtype=numpy.int64)
+        codes = []
+        for i, terms in enumerate(lists):
+            seen = set()
+            for term in terms:
+                if term not in seen:
+                    seen.add(term)
+                    codes.append(vocab.code(term))
+            offsets[i + 1] = len(codes)
+        return cls(vocab, offsets, numpy.array(codes, dtype=numpy.int32))
+
+    @classmethod
+    def from_strings(cls, vocab, strings, separator=';'):
+        '''
+        Builds a column from strings of terms joined by separator, one per
+        row (anything other than a non-empty string, such as None or NaN,
+        for rows without terms).  All the strings are split at once;
+        duplicate terms within a row are kept only once, as in from_lists.
+        '''
+        strings = numpy.asarray(strings, dtype=object)
+        present = pandas.notnull(strings) & (strings != '')
+        strings = strings[present]
+        lengths = numpy.zeros(len(present), dtype=numpy.int64)
+        lengths[present] = [s.count(separator) + 1 for s in strings]
+        offsets = numpy.zeros(len(present) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=offsets[1:])
+        if len(strings) == 0:
+            return cls(vocab, offsets, numpy.zeros(0, dtype=numpy.int32))
+
+        terms = separator.join(strings).split(separator)
+        inverse, unique = pandas.factorize(terms)
+
+        # the first occurrence of each term in each row
+        row_ids = numpy.repeat(numpy.arange(len(lengths)), lengths)
+        repeated = pandas.Index(row_ids * len(unique) + inverse).duplicated()
+        if repeated.any():
+            inverse = inverse[~repeated]
+            numpy.cumsum(numpy.bincount(row_ids[~repeated],
+                                        minlength=len(lengths)),
+                         out=offsets[1:])
+
+        codes = vocab.encode(unique.tolist())[inverse]
+        return cls(vocab, offsets, codes)
+
+    @classmethod
+    def from_pairs(cls, vocab, rows, row_ids, codes):
+        '''
+        Builds a column of the specified number of rows from two parallel
+        arrays, of row numbers and of the codes of their terms; the terms
+        of each row are sorted by code and deduplicated.
+        '''
+        row_ids = numpy.asarray(row_ids, dtype=numpy.int64)
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        if len(codes) > 0:
+            keys = numpy.unique(row_ids * (codes.max() + 1) + codes)
+            row_ids = keys // (codes.max() + 1)
+            codes = keys % (codes.max() + 1)
+        offsets = numpy.zeros(rows + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(row_ids, minlength=rows),
+                     out=offsets[1:])
+        return cls(vocab, offsets, codes.astype(numpy.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.vocabulary.decode(
+                    self.codes[self.offsets[row]:self.offsets[row + 1]])
+
+    def row_codes(self, row):
+        return self.codes[self.offsets[row]:self.offsets[row + 1]]
+
+    def lengths(self):
+        return numpy.diff(self.offsets)
+
+    def row_ids(self):
+        '''
+        The row number of each element of codes.
+        '''
+        return numpy.repeat(numpy.arange(len(self), dtype=numpy.int64),
+                            self.lengths())
+
+    def _terms(self):
+        # the terms of all the rows, in one list
+        terms = numpy.empty(len(self.vocabulary), dtype=object)
+        terms[:] = self.vocabulary.terms
+        return terms[self.codes].tolist()
+
+    def tolists(self):
+        terms = self._terms()
+        offsets = self.offsets.tolist()
+        return [terms[start:end]
+                for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def joined(self, separator=';'):
+        '''
+        The terms of each row joined into a string, for all rows.
+        '''
+        terms = self._terms()
+        offsets = self.offsets.tolist()
+        return [separator.join(terms[start:end])
+                for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def set(self, row, terms):
+        '''
+        Replaces the terms of one row; this rewrites the whole column, so
+        columns should be built at once (with from_lists or from_pairs)
+        rather than row by row.
+        '''
+        new = []
+        for term in terms:
+            code = self.vocabulary.code(term)
+            if code not in new:
+                new.append(code)
+        start = self.offsets[row]
+        end = self.offsets[row + 1]
+        self.codes = numpy.concatenate((self.codes[:start],
+                                        numpy.array(new, dtype=numpy.int32),
+                                        self.codes[end:]))
+        self.offsets[row + 1:] += len(new) - (end - start)
+
+    def take(self, rows):
+        '''
+        A new column made of the specified rows, in order.
+        '''
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=offsets[1:])
+        positions = numpy.repeat(starts - offsets[:-1], lengths) + \
+                    numpy.arange(offsets[-1])
+        return term_column(self.vocabulary, offsets, self.codes[positions])
+
+    def rows_with(self, codes):
+        '''
+        The rows (in order) having any of the terms with the specified
+        codes.
+        '''
+        mask = numpy.in1d(self.codes, codes)
+        return numpy.unique(self.row_ids()[mask])
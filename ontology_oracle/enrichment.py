@@ -0,0 +1,101 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import numpy, pandas
+
+def hypergeometric_sf(selected, annotated, drawn, total):
+    '''
+    The probability of drawing at least selected annotated items when
+    drawing drawn items (without replacement) from total items, of which
+    annotated are annotated: the one-sided p-value of Fisher's exact test
+    for over-representation.  The arguments are arrays (broadcast against
+    each other) and the p-values of all of them are calculated at once.
+
+    scipy.stats.hypergeom.sf loops over its arguments in Python; here the
+    distinct argument tuples are found first, and the probabilities in
+    the tails of all of them are summed in one flat array.
+    '''
+    selected, annotated, drawn, total = \
+                numpy.broadcast_arrays(selected, annotated, drawn, total)
+    shape = selected.shape
+    if selected.size == 0:
+        return numpy.zeros(shape)
+    columns = [numpy.asarray(a, dtype=numpy.int64).ravel()
+               for a in (selected, annotated, drawn, total)]
+    # number the distinct tuples, one column at a time
+    inverse = numpy.zeros(len(columns[0]), dtype=numpy.int64)
+    for column in columns:
+        codes, uniques = pandas.factorize(column)
+        inverse, uniques = pandas.factorize(inverse * len(uniques) + codes)
+    # an occurrence of each distinct tuple
+    first = numpy.empty(len(uniques), dtype=numpy.int64)
+    first[inverse] = numpy.arange(len(inverse))
+    k, K, n, N = [column[first] for column in columns]
+
+    # the probabilities beyond 12 standard deviations from the mean are
+    # negligible, so the sums are cut off there; when k is below the
+    # mean, the shorter lower tail is summed and subtracted from 1
+    mean = n * K / numpy.maximum(N, 1).astype(numpy.float64)
+    sd = numpy.sqrt(mean * (N - K) * (N - n) /
+                    numpy.maximum(N * (N - 1.0), 1.0))
+    reach = numpy.ceil(12 * sd).astype(numpy.int64) + 20
+    lower = k <= mean
+    lo = numpy.where(lower,
+                     numpy.maximum(k - 1 - reach, n - (N - K)),
+                     k)
+    hi = numpy.where(lower, k - 1,
+                     numpy.minimum(k + reach, numpy.minimum(K, n)))
+    lo = numpy.maximum(lo, 0)
+    lengths = numpy.maximum(hi - lo + 1, 0)
+
+    # log(i!) for every count that can occur
+    from scipy.special import gammaln
+    log_factorial = gammaln(numpy.arange(N.max() + 1) + 1.0)
+    def log_choose(a, b):
+        return log_factorial[a] - log_factorial[b] - log_factorial[a - b]
+
+    starts = numpy.cumsum(lengths) - lengths
+    tail = numpy.repeat(numpy.arange(len(k)), lengths)
+    x = numpy.repeat(lo, lengths) + \
+        (numpy.arange(lengths.sum()) - numpy.repeat(starts, lengths))
+    K = K[tail]
+    N = N[tail]
+    n = n[tail]
+    pmf = numpy.exp(log_choose(K, x) + log_choose(N - K, n - x) -
+                    log_choose(N, n))
+
+    p = numpy.zeros(len(k))
+    summed = lengths > 0
+    if summed.any():
+        p[summed] = numpy.add.reduceat(pmf, starts[summed])
+    p[lower] = 1.0 - p[lower]
+    return numpy.clip(p, 0.0, 1.0)[inverse].reshape(shape)
+
+def benjamini_hochberg(pvalues):
+    '''
+    Adjusts p-values for multiple testing, controlling the false discovery
+    rate (Benjamini and Hochberg, 1995).  A two-dimensional array is
+    adjusted column by column; NaN p-values (untested) are ignored and
+    stay NaN.
+    '''
+    pvalues = numpy.asarray(pvalues, dtype=numpy.float64)
+    flat = pvalues.ndim == 1
+    if flat:
+        pvalues = pvalues[:, numpy.newaxis]
+
+    # NaN sorts last, so the tested p-values of each column come first
+    order = numpy.argsort(pvalues, axis=0, kind='mergesort')
+    ordered = numpy.take_along_axis(pvalues, order, axis=0)
+    tested = numpy.sum(~numpy.isnan(pvalues), axis=0)
+    ranks = numpy.arange(1, len(pvalues) + 1)[:, numpy.newaxis]
+    adjusted = ordered * tested / ranks.astype(numpy.float64)
+    # each adjusted p-value is the smallest of those at or above its rank
+    adjusted = numpy.fmin.accumulate(adjusted[::-1], axis=0)[::-1]
+    adjusted = numpy.minimum(adjusted, 1.0)
+
+    qvalues = numpy.empty_like(pvalues)
+    numpy.put_along_axis(qvalues, order, adjusted, axis=0)
+    if flat:
+        return qvalues[:, 0]
+    return qvalues
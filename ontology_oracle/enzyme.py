@@ -0,0 +1,115 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+def parent_number(number):
+    '''
+    The EC number of the class immediately above number (1.2.3.4 ->
+    1.2.3.-), or None for the top-level classes.
+    '''
+    nums = number.split('.')
+    if len(nums) != 4 or nums[1] == '-':
+        return None
+    if nums[3] != '-':
+        nums[3] = '-'
+    elif nums[2] != '-':
+        nums[2] = '-'
+    else:
+        nums[1] = '-'
+    return '.'.join(nums)
+
+def class_number(number, level):
+    '''
+    The EC number of the class at level (1 to 4) above or at number
+    (1.2.3.4 at level 2 -> 1.2.-.-), or None if number is not as specific
+    as level.
+    '''
+    nums = number.split('.')
+    if len(nums) != 4 or '-' in nums[:level]:
+        return None
+    return '.'.join(nums[:level] + ['-'] * (4 - level))
+
+class enzyme_db:
+    '''
+    The ENZYME database held in memory: the entries of enzyme.dat (by EC
+    number, in the flat-file format served by enzyme.expasy.org) and the
+    class names from enzclass.txt, with an index of the EC hierarchy.
+    '''
+    def __init__(self):
+        self.entries = {}
+        self.classes = {}
+        self._children = {}
+
+    @classmethod
+    def parse(cls, dat_lines, class_lines):
+        db = cls()
+
+        entry = []
+        number = None
+        for line in dat_lines:
+            line = line.rstrip('\r\n')
+            if line.startswith('//'):
+                if number is not None:
+                    db.entries[number] = '\n'.join(entry)
+                entry = []
+                number = None
+            elif line.startswith('ID   '):
+                number = line[5:].strip()
+                entry = [line]
+            elif number is not None:
+                entry.append(line)
+
+        # class lines start in the first column, with the number in the
+        # first nine: "1. 1. 1.-    With NAD(+) or NADP(+) as acceptor."
+        for line in class_lines:
+            line = line.rstrip('\r\n')
+            if len(line) < 10 or not line[0:1].isdigit():
+                continue
+            number = line[0:9].replace(' ', '')
+            if len(number.split('.')) != 4:
+                continue
+            db.classes[number] = line[9:].strip().rstrip('.')
+
+        for number in db.entries.keys() + db.classes.keys():
+            parent = parent_number(number)
+            if parent is not None:
+                db._children.setdefault(parent, []).append(number)
+        for children in db._children.itervalues():
+            children.sort()
+
+        return db
+
+    @classmethod
+    def load(cls, dat_filename, class_filename):
+        with open(dat_filename, 'r') as dat:
+            with open(class_filename, 'r') as classes:
+                return cls.parse(dat, classes)
+
+    def __len__(self):
+        return len(self.entries) + len(self.classes)
+
+    def __contains__(self, number):
+        return number in self.entries or number in self.classes
+
+    def entry(self, number):
+        '''
+        Returns the flat-file entry for an EC number; for classes, a minimal
+        entry with only the ID and DE (name) lines.  None if unknown.
+        '''
+        if number in self.entries:
+            return self.entries[number]
+        if number in self.classes:
+            return 'ID   %s\nDE   %s' % (number, self.classes[number])
+        return None
+
+    def children(self, number):
+        return self._children.get(number, [])
+
+    def descendants(self, number):
+        found = []
+        current = list(self.children(number))
+        while len(current) > 0:
+            child = current.pop()
+            found.append(child)
+            current.extend(self.children(child))
+        return found
@@ -0,0 +1,236 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import os, json, struct
+import numpy
+import utils
+
+class mapping_source:
+    '''
+    A mapping of external identifiers to GO terms, in the external2go
+    format published by the Gene Ontology consortium:
+
+        Pfam:PF00001 7tm_1 > GO:G protein-coupled receptor ... ; GO:0004930
+
+    kind: name of the mapping, as used with xref2go
+    url: where the mapping is published
+    local: local copy, used if the mapping cannot be downloaded
+    normalize: translates an identifier as found in an accession into the
+        form used in the mapping (without the prefix, e.g. PF00001)
+    '''
+    def __init__(self, kind, url, local, normalize=None):
+        self.kind = kind
+        self.url = url
+        self.local = local
+        self.normalize = normalize
+
+    def read(self):
+        try:
+            return utils.download(self.url)
+        except:
+            # open from the local cache
+            with open(self.local, 'r') as f:
+                return f.read()
+
+    def parse(self, text):
+        '''
+        Returns the mapping as a dictionary of identifier -> GO terms, and
+        the header lines that identify the version of the mapping.
+        '''
+        mapping = {}
+        header = []
+        for line in text.split('\n'):
+            if line.startswith('!'):
+                if 'date' in line.lower() or 'version' in line.lower():
+                    header.append(line[1:].strip())
+                continue
+            if line.strip() == '':
+                continue
+            entries = line.split(' ')
+            key = entries[0].split(':', 1)[-1]
+            mapping.setdefault(key, []).append(entries[-1])
+        return mapping, header
+
+def _normalize_ec(id):
+    if id.startswith('ec:') or id.startswith('EC:'):
+        return id[3:]
+    return id
+
+def _normalize_pfam(id):
+    for prefix in ('Pfam:PF', 'pfam', 'PFAM', 'PF'):
+        if id.startswith(prefix):
+            return 'PF%s' % id[len(prefix):]
+    return id
+
+def _normalize_smart(id):
+    if id.startswith('smart'):
+        return 'SM%s' % id[5:]
+    return id
+
+sources = {}
+
+def register_source(source):
+    '''
+    Adds (or replaces) a mapping; compiled stores that do not include it
+    are recompiled when next opened by the ontology module.
+    '''
+    sources[source.kind] = source
+
+register_source(mapping_source('ec',
+                'http://geneontology.org/external2go/ec2go',
+                'local_cache/ec2go.txt', _normalize_ec))
+register_source(mapping_source('pfam',
+                'http://geneontology.org/external2go/pfam2go',
+                'local_cache/pfam2go.txt', _normalize_pfam))
+register_source(mapping_source('tigrfam',
+                'http://geneontology.org/external2go/tigrfams2go',
+                'local_cache/tigrfam2go.txt'))
+register_source(mapping_source('smart',
+                'http://geneontology.org/external2go/smart2go',
+                'local_cache/smart2go.txt', _normalize_smart))
+register_source(mapping_source('interpro',
+                'http://geneontology.org/external2go/interpro2go',
+                'local_cache/interpro2go.txt'))
+
+class xref_store:
+    '''
+    All the external2go mappings, compiled into one set of arrays: the GO
+    terms are interned (one sorted array of IDs, referred to by index),
+    and each mapping is a sorted array of identifiers with CSR-style
+    offsets into an array of GO term indexes.  The arrays are written to a
+    single file (a JSON header followed by the raw arrays), which is
+    memory-mapped when opened, so opening a store costs milliseconds
+    regardless of the size of the mappings.
+    '''
+    magic = 'ONTOLOGY_ORACLE_XREF2GO\n'
+    format_version = 1
+
+    def __init__(self, arrays, info):
+        self.arrays = arrays
+        self.info = info
+
+    @property
+    def kinds(self):
+        return sorted(self.info['kinds'].keys())
+
+    @classmethod
+    def build(cls, mapping_sources=None):
+        '''
+        Downloads (or reads from the local copies) and compiles the
+        mappings; the store is kept in memory until saved.
+        '''
+        if mapping_sources is None:
+            mapping_sources = sources.values()
+        mappings = {}
+        info = {'format_version': cls.format_version, 'kinds': {}}
+        for source in mapping_sources:
+            mapping, header = source.parse(source.read())
+            mappings[source.kind] = mapping
+            info['kinds'][source.kind] = {'url': source.url,
+                                          'header': header}
+
+        terms = set()
+        for mapping in mappings.itervalues():
+            for go_terms in mapping.itervalues():
+                terms.update(go_terms)
+        go = numpy.array(sorted(terms), dtype=str)
+        go_index = dict((term, i) for i, term in enumerate(go.tolist()))
+
+        arrays = {'go': go}
+        for kind, mapping in mappings.iteritems():
+            keys = sorted(mapping.keys())
+            offsets = numpy.zeros(len(keys) + 1, dtype=numpy.int64)
+            values = []
+            for i, key in enumerate(keys):
+                codes = sorted(set(go_index[t] for t in mapping[key]))
+                values.extend(codes)
+                offsets[i + 1] = len(values)
+            arrays['%s.keys' % kind] = numpy.array(keys, dtype=str)
+            arrays['%s.offsets' % kind] = offsets
+            arrays['%s.values' % kind] = numpy.array(values,
+                                                     dtype=numpy.int32)
+
+        return cls(arrays, info)
+
+    def save(self, filename):
+        layout = {}
+        offset = 0
+        for name in sorted(self.arrays.keys()):
+            array = self.arrays[name]
+            layout[name] = [array.dtype.str, offset, len(array)]
+            offset += array.nbytes
+            offset += (-offset) % 16
+        info = dict(self.info)
+        info['arrays'] = layout
+        header = json.dumps(info)
+
+        data_start = len(self.magic) + 8 + len(header)
+        data_start += (-data_start) % 16
+        tmp = '%s.tmp' % filename
+        with open(tmp, 'wb') as f:
+            f.write(self.magic)
+            f.write(struct.pack('<Q', data_start))
+            f.write(header)
+            for name in sorted(layout.keys()):
+                f.seek(data_start + layout[name][1])
+                f.write(self.arrays[name].tobytes())
+        os.rename(tmp, filename)
+
+    @classmethod
+    def open(cls, filename):
+        '''
+        Opens a compiled store; returns None if the file was written by a
+        different version of this module.
+        '''
+        with open(filename, 'rb') as f:
+            if f.read(len(cls.magic)) != cls.magic:
+                return None
+            data_start = struct.unpack('<Q', f.read(8))[0]
+            header = f.read(data_start - len(cls.magic) - 8)
+        info = json.loads(header.rstrip('\0'))
+        if info.get('format_version') != cls.format_version:
+            return None
+
+        arrays = {}
+        for name, (dtype, offset, count) in info['arrays'].iteritems():
+            if count == 0:
+                arrays[name] = numpy.zeros(0, dtype=dtype)
+            else:
+                arrays[name] = numpy.memmap(filename, dtype=str(dtype),
+                                            mode='r',
+                                            offset=data_start + offset,
+                                            shape=(count,))
+        return cls(arrays, info)
+
+    def lookup(self, kind, ids):
+        '''
+        Returns the deduplicated list of GO terms associated with any of the
+        identifiers ids (a string or a list of strings) in the mapping kind.
+        '''
+        if isinstance(ids, basestring):
+            ids = [ids]
+        keys = self.arrays['%s.keys' % kind]
+        if len(ids) == 0 or len(keys) == 0:
+            return []
+        source = sources.get(kind)
+        if source is not None and source.normalize is not None:
+            ids = [source.normalize(x) for x in ids]
+        # identifiers longer than the stored keys cannot be in the mapping,
+        # and would be truncated by the conversion below
+        ids = [x for x in ids if len(x) <= keys.dtype.itemsize]
+        if len(ids) == 0:
+            return []
+
+        query = numpy.array(ids, dtype=keys.dtype)
+        pos = numpy.searchsorted(keys, query)
+        pos[pos >= len(keys)] = 0
+        pos = pos[keys[pos] == query]
+
+        offsets = self.arrays['%s.offsets' % kind]
+        values = self.arrays['%s.values' % kind]
+        codes = [values[offsets[p]:offsets[p + 1]] for p in pos]
+        if len(codes) == 0:
+            return []
+        codes = numpy.unique(numpy.concatenate(codes))
+        return self.arrays['go'][codes].tolist()
@@ -0,0 +1,289 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import os, mmap, zlib, gzip, struct, sqlite3, threading
+
+def _read_block(f):
+    '''
+    Reads one BGZF block (a gzip member with a BC extra subfield giving
+    its size) from f; returns (compressed size, data), or None at the end
+    of the file.  Raises ValueError if the member is not a BGZF block.
+    '''
+    header = f.read(12)
+    if len(header) == 0:
+        return None
+    if len(header) < 12 or header[0:4] != '\x1f\x8b\x08\x04':
+        raise ValueError('not a BGZF block')
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = f.read(xlen)
+    bsize = None
+    pos = 0
+    while pos + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        if extra[pos:pos + 2] == 'BC':
+            bsize = struct.unpack('<H', extra[pos + 4:pos + 6])[0]
+        pos += 4 + slen
+    if bsize is None:
+        raise ValueError('not a BGZF block')
+    rest = f.read(bsize + 1 - 12 - xlen)
+    data = zlib.decompress(rest[:-8], -15)
+    return (bsize + 1, data)
+
+def _is_bgzf(filename):
+    with open(filename, 'rb') as f:
+        try:
+            return _read_block(f) is not None
+        except ValueError:
+            return False
+
+def _is_gzip(filename):
+    with open(filename, 'rb') as f:
+        return f.read(2) == '\x1f\x8b'
+
+def _uniprot_ids(line):
+    if line.startswith('AC   '):
+        return [x.strip() for x in line[5:].split(';') if x.strip() != '']
+    if line.startswith('ID   '):
+        return [line[5:].split(' ')[0]]
+    return []
+
+def _genbank_ids(line):
+    if line.startswith('ACCESSION '):
+        return line[12:].split()
+    if line.startswith('VERSION '):
+        ids = []
+        for entry in line[12:].split():
+            if entry.startswith('GI:'):
+                ids.append(entry[3:])
+            else:
+                ids.append(entry)
+        return ids
+    return []
+
+_id_parsers = {
+    'uniprot': _uniprot_ids,
+    'genbank': _genbank_ids,
+}
+
+class flatfile_index:
+    '''
+    Random access to the records of a large local flat file (such as
+    uniprot_sprot.dat or a RefSeq .gpff), which may be plain, gzipped or
+    bgzipped.  The file is scanned once to build a persistent index of
+    accession -> (offset, length), stored in an SQLite file alongside it;
+    each lookup is then an index query and a read of a single record.
+
+    Offsets are in the uncompressed file.  Plain files are memory-mapped;
+    for bgzipped files, the index also records where each compressed
+    block starts, so only the blocks holding a record are decompressed.
+    Ordinary gzip files cannot be read from the middle, so they are
+    decompressed once into a copy next to the index.
+
+    format: 'uniprot' or 'genbank'
+    '''
+    index_version = 1
+
+    def __init__(self, filename, format='uniprot', index_filename=None):
+        if format not in _id_parsers:
+            raise Exception('unknown flat file format: %s' % format)
+        self.filename = filename
+        self.format = format
+        if index_filename is None:
+            index_filename = '%s.idx' % filename
+        self.index_filename = index_filename
+        self.lock = threading.Lock()
+
+        if _is_bgzf(filename):
+            self.compression = 'bgzf'
+        elif _is_gzip(filename):
+            self.compression = 'gzip'
+        else:
+            self.compression = None
+
+        self.db = sqlite3.connect(index_filename, check_same_thread=False)
+        if not self._current():
+            self._build()
+
+        self.blocks = None
+        self.data = None
+        self.file = None
+        if self.compression == 'bgzf':
+            self.blocks = self.db.execute('SELECT start, offset FROM blocks ' \
+                                          'ORDER BY start').fetchall()
+            self.file = open(filename, 'rb')
+        else:
+            path = filename
+            if self.compression == 'gzip':
+                path = self._decompressed_filename
+            self.file = open(path, 'rb')
+            if os.path.getsize(path) > 0:
+                self.data = mmap.mmap(self.file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+
+    @property
+    def _decompressed_filename(self):
+        return '%s.dat' % self.index_filename
+
+    def _source_info(self):
+        st = os.stat(self.filename)
+        return '%d:%d:%s:%d' % (st.st_size, int(st.st_mtime), self.format,
+                                self.index_version)
+
+    def _current(self):
+        try:
+            row = self.db.execute('SELECT value FROM meta WHERE key = ?',
+                                  ('source',)).fetchone()
+        except sqlite3.OperationalError:
+            return False
+        if row is None or row[0] != self._source_info():
+            return False
+        if self.compression == 'gzip' and \
+                    not os.path.exists(self._decompressed_filename):
+            return False
+        return True
+
+    def _chunks(self):
+        # the uncompressed contents of the file, in pieces; for bgzip
+        # files, also records the start of each block
+        if self.compression == 'bgzf':
+            with open(self.filename, 'rb') as f:
+                start = 0
+                offset = 0
+                while True:
+                    block = _read_block(f)
+                    if block is None:
+                        break
+                    size, data = block
+                    if len(data) > 0:
+                        self.db.execute('INSERT INTO blocks VALUES (?, ?)',
+                                        (start, offset))
+                    yield data
+                    start += len(data)
+                    offset += size
+        elif self.compression == 'gzip':
+            with gzip.open(self.filename, 'rb') as f:
+                with open(self._decompressed_filename, 'wb') as out:
+                    while True:
+                        data = f.read(1024 * 1024)
+                        if len(data) == 0:
+                            break
+                        out.write(data)
+                        yield data
+        else:
+            with open(self.filename, 'rb') as f:
+                while True:
+                    data = f.read(1024 * 1024)
+                    if len(data) == 0:
+                        break
+                    yield data
+
+    def _lines(self):
+        # (offset, line) for every line of the uncompressed file
+        offset = 0
+        partial = ''
+        for data in self._chunks():
+            lines = (partial + data).split('\n')
+            partial = lines.pop()
+            for line in lines:
+                yield offset, line
+                offset += len(line) + 1
+        if partial != '':
+            yield offset, partial
+
+    def _build(self):
+        self.db.execute('DROP TABLE IF EXISTS meta')
+        self.db.execute('DROP TABLE IF EXISTS records')
+        self.db.execute('DROP TABLE IF EXISTS blocks')
+        self.db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE records (id TEXT, offset INTEGER, ' \
+                        'length INTEGER)')
+        self.db.execute('CREATE TABLE blocks (start INTEGER PRIMARY KEY, ' \
+                        'offset INTEGER)')
+
+        parse_ids = _id_parsers[self.format]
+        start = None
+        ids = []
+        batch = []
+        for offset, line in self._lines():
+            if start is None:
+                if line.strip() == '':
+                    continue
+                start = offset
+            ids.extend(parse_ids(line))
+            if line.startswith('//'):
+                length = offset + len(line) - start
+                for id in set(ids):
+                    batch.append((id, start, length))
+                start = None
+                ids = []
+                if len(batch) >= 10000:
+                    self.db.executemany('INSERT INTO records VALUES ' \
+                                        '(?, ?, ?)', batch)
+                    batch = []
+        self.db.executemany('INSERT INTO records VALUES (?, ?, ?)', batch)
+
+        self.db.execute('CREATE INDEX records_id ON records (id)')
+        self.db.execute('INSERT INTO meta VALUES (?, ?)',
+                        ('source', self._source_info()))
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(DISTINCT offset) ' \
+                               'FROM records').fetchone()[0]
+
+    def __contains__(self, id):
+        return self.locate(id) is not None
+
+    def locate(self, id):
+        '''
+        Returns the (offset, length) of the record for an identifier, or
+        None if it is not in the file.
+        '''
+        with self.lock:
+            return self.db.execute('SELECT offset, length FROM records ' \
+                                   'WHERE id = ?', (id,)).fetchone()
+
+    def get(self, id):
+        '''
+        Returns the text of the record for an identifier (ending with its
+        // line), or None if it is not in the file.
+        '''
+        location = self.locate(id)
+        if location is None:
+            return None
+        offset, length = location
+        if self.data is not None:
+            return self.data[offset:offset + length]
+        return self._read_bgzf(offset, length)
+
+    def _read_bgzf(self, offset, length):
+        # find the last block starting at or before offset
+        lo = 0
+        hi = len(self.blocks)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.blocks[mid][0] <= offset:
+                lo = mid
+            else:
+                hi = mid
+        start, block_offset = self.blocks[lo]
+
+        pieces = []
+        needed = offset + length - start
+        with self.lock:
+            self.file.seek(block_offset)
+            while needed > 0:
+                block = _read_block(self.file)
+                if block is None:
+                    break
+                pieces.append(block[1])
+                needed -= len(block[1])
+        data = ''.join(pieces)
+        return data[offset - start:offset - start + length]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+        self.db.close()
@@ -0,0 +1,101 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+from collections import deque
+
+def _word_char(c):
+    return c.isalnum() or c == '_'
+
+class pattern_matcher:
+    '''
+    Finds which of many patterns occur in a text, in a single pass over
+    the text (the Aho-Corasick algorithm): the patterns are compiled into
+    a trie whose nodes have failure links to the longest proper suffix
+    that is also in the trie, and the output of each node lists the
+    patterns ending there.
+
+    ignore_case: patterns match regardless of case
+    whole_words: patterns only match at word boundaries (as \\b does in
+        regular expressions)
+    '''
+    def __init__(self, patterns, ignore_case=False, whole_words=False):
+        self.ignore_case = ignore_case
+        self.whole_words = whole_words
+        self.lengths = [len(p) for p in patterns]
+        # whether each pattern starts and ends with a word character; only
+        # then does whole_words require a boundary
+        self.word_start = [len(p) > 0 and _word_char(p[0]) for p in patterns]
+        self.word_end = [len(p) > 0 and _word_char(p[-1]) for p in patterns]
+
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for index, pattern in enumerate(patterns):
+            if len(pattern) == 0:
+                continue
+            if ignore_case:
+                pattern = pattern.lower()
+            node = 0
+            for c in pattern:
+                next = self.goto[node].get(c)
+                if next is None:
+                    next = len(self.goto)
+                    self.goto[node][c] = next
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = next
+            self.output[node] += (index,)
+
+        # breadth-first, so that the failure link of a node is complete
+        # before those of its children; each node's output also includes
+        # the output of the node its failure link points to
+        queue = deque(self.goto[0].values())
+        while len(queue) > 0:
+            node = queue.popleft()
+            for c, child in self.goto[node].iteritems():
+                queue.append(child)
+                state = self.fail[node]
+                while state != 0 and c not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(c, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def matches(self, text):
+        '''
+        Yields (position, pattern index) for every occurrence of a pattern
+        in text; position is where the occurrence starts.
+        '''
+        if self.ignore_case:
+            text = text.lower()
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        node = 0
+        for end, c in enumerate(text):
+            while node != 0 and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            if output[node]:
+                for index in output[node]:
+                    start = end - self.lengths[index] + 1
+                    if self.whole_words and not \
+                                self._at_boundaries(text, start, end, index):
+                        continue
+                    yield start, index
+
+    def _at_boundaries(self, text, start, end, index):
+        if self.word_start[index] and start > 0 and \
+                    _word_char(text[start - 1]):
+            return False
+        if self.word_end[index] and end + 1 < len(text) and \
+                    _word_char(text[end + 1]):
+            return False
+        return True
+
+    def find(self, text):
+        '''
+        The indexes of the patterns that occur in text, in order.
+        '''
+        return sorted(set(index for start, index in self.matches(text)))
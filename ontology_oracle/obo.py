@@ -0,0 +1,506 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import os, cPickle
+import numpy
+
+class obo_term:
+    def __init__(self, id):
+        self.id = id
+        self.name = ''
+        self.namespace = ''
+        self.definition = ''
+        self.synonyms = []
+        self.xrefs = []
+        self.alt_ids = []
+        self.isa = []
+        self.part_of = []
+        self.obsolete = False
+        self.replaced_by = []
+        self.consider = []
+        self.subsets = []
+
+class obo_ontology:
+    '''
+    An entire OBO-format ontology (such as go.obo) held in memory: the
+    terms, indexed by ID and alternate ID, and the is_a/part_of edges
+    among them.  The terms are stored column-wise (one list per attribute,
+    indexed by an integer code per term), which keeps the precompiled form
+    small and quick to load; term() assembles an obo_term on request.
+    '''
+    # version of the precompiled (pickled) form; bump when the layout of
+    # this class changes
+    compiled_version = 4
+
+    def __init__(self):
+        self.data_version = ''
+        self.ids = []
+        self.codes = {}
+        self.alt_ids = {}
+        # the alternate IDs of each term, by code (see _index_alt_ids)
+        self.term_alt_ids = {}
+        self.names = []
+        self.namespaces = []
+        self.definitions = []
+        # lists of synonyms and xrefs are joined by newlines
+        self.synonyms = []
+        self.xrefs = []
+        # parents, as lists of term codes
+        self.isa = []
+        self.part_of = []
+        self.obsolete = set()
+        self.replaced_by = {}
+        self.consider = {}
+        # the terms of each subset (such as goslim_generic), as sets of
+        # term codes
+        self.subsets = {}
+        # ancestor closures (see closure()) and reverse edges (see
+        # children_index()), by relations
+        self.closures = {}
+        self.children_indexes = {}
+
+    @classmethod
+    def parse(cls, lines):
+        '''
+        Builds the ontology from the lines of an OBO file (any iterable of
+        lines, such as an open file).
+        '''
+        terms = []
+        data_version = ''
+        term = None
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line.startswith('['):
+                term = None
+                if line == '[Term]':
+                    term = obo_term('')
+                    terms.append(term)
+                continue
+            if term is None:
+                if line.startswith('data-version: '):
+                    data_version = line[14:]
+                continue
+            if line.startswith('id: '):
+                term.id = line[4:]
+            elif line.startswith('name: '):
+                term.name = line[6:]
+            elif line.startswith('namespace: '):
+                term.namespace = line[11:]
+            elif line.startswith('def: '):
+                term.definition = line[5:].split('" [')[0].strip('"')
+            elif line.startswith('synonym: '):
+                term.synonyms.append(line[9:])
+            elif line.startswith('xref: '):
+                term.xrefs.append(line[6:])
+            elif line.startswith('alt_id: '):
+                term.alt_ids.append(line[8:])
+            elif line.startswith('is_a: '):
+                term.isa.append(line[6:].split('!')[0].strip())
+            elif line.startswith('relationship: part_of '):
+                term.part_of.append(line[22:].split('!')[0].strip())
+            elif line.startswith('is_obsolete: true'):
+                term.obsolete = True
+            elif line.startswith('replaced_by: '):
+                term.replaced_by.append(line[13:])
+            elif line.startswith('consider: '):
+                term.consider.append(line[10:])
+            elif line.startswith('subset: '):
+                term.subsets.append(line[8:].strip())
+
+        ont = cls()
+        ont.data_version = data_version
+        terms = [t for t in terms if t.id != '']
+        for code, term in enumerate(terms):
+            ont.ids.append(term.id)
+            ont.codes[term.id] = code
+        for code, term in enumerate(terms):
+            ont.names.append(term.name)
+            ont.namespaces.append(term.namespace)
+            ont.definitions.append(term.definition)
+            ont.synonyms.append('\n'.join(term.synonyms))
+            ont.xrefs.append('\n'.join(term.xrefs))
+            ont.isa.append([ont.codes[x] for x in term.isa if x in ont.codes])
+            ont.part_of.append([ont.codes[x] for x in term.part_of
+                                if x in ont.codes])
+            for alt_id in term.alt_ids:
+                ont.alt_ids[alt_id] = code
+            if term.obsolete:
+                ont.obsolete.add(code)
+            if len(term.replaced_by) > 0:
+                ont.replaced_by[code] = term.replaced_by
+            if len(term.consider) > 0:
+                ont.consider[code] = term.consider
+            for subset in term.subsets:
+                ont.subsets.setdefault(subset, set()).add(code)
+
+        ont._index_alt_ids()
+        return ont
+
+    def _index_alt_ids(self):
+        # the reverse of alt_ids, so that term() need not search it
+        self.term_alt_ids = {}
+        for alt_id, code in self.alt_ids.iteritems():
+            self.term_alt_ids.setdefault(code, []).append(alt_id)
+
+    @classmethod
+    def load(cls, filename, compile=True):
+        '''
+        Loads the ontology from an OBO file.  Unless compile is False, the
+        parsed ontology is also saved in a precompiled form alongside the
+        OBO file (filename.pkl), and subsequently loaded from there as long
+        as it is newer than the OBO file.
+        '''
+        compiled = '%s.pkl' % filename
+        if os.path.exists(compiled) and (not os.path.exists(filename) or
+                    os.path.getmtime(compiled) >= os.path.getmtime(filename)):
+            ont = cls.load_compiled(compiled)
+            if ont is not None:
+                return ont
+
+        with open(filename, 'r') as f:
+            ont = cls.parse(f)
+        if compile:
+            # store the is_a closure with the precompiled form as well
+            ont.closure()
+            try:
+                ont.save(compiled)
+            except IOError:
+                # not fatal; the OBO file will be parsed again next time
+                pass
+        return ont
+
+    @classmethod
+    def load_compiled(cls, filename):
+        with open(filename, 'rb') as f:
+            state = cPickle.load(f)
+        if state.get('compiled_version') != cls.compiled_version:
+            return None
+        ont = cls()
+        ont.__dict__.update(state['ontology'])
+        ont._index_alt_ids()
+        return ont
+
+    def save(self, filename):
+        # term_alt_ids is rebuilt when loaded
+        state = dict(self.__dict__)
+        del state['term_alt_ids']
+        with open(filename, 'wb') as f:
+            cPickle.dump({'compiled_version': self.compiled_version,
+                          'ontology': state}, f,
+                         cPickle.HIGHEST_PROTOCOL)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id):
+        return id in self.codes or id in self.alt_ids
+
+    def code(self, id):
+        '''
+        Returns the integer code of a term, given its ID or one of its
+        alternate IDs; None for unknown IDs.
+        '''
+        code = self.codes.get(id)
+        if code is None:
+            code = self.alt_ids.get(id)
+        return code
+
+    def primary_id(self, id):
+        '''
+        Translates an alternate ID into the ID of the term it was merged
+        into; returns None for unknown IDs.
+        '''
+        code = self.code(id)
+        if code is None:
+            return None
+        return self.ids[code]
+
+    def term(self, id):
+        code = self.code(id)
+        if code is None:
+            return None
+        term = obo_term(self.ids[code])
+        term.name = self.names[code]
+        term.namespace = self.namespaces[code]
+        term.definition = self.definitions[code]
+        if self.synonyms[code] != '':
+            term.synonyms = self.synonyms[code].split('\n')
+        if self.xrefs[code] != '':
+            term.xrefs = self.xrefs[code].split('\n')
+        term.alt_ids = list(self.term_alt_ids.get(code, []))
+        term.isa = [self.ids[x] for x in self.isa[code]]
+        term.part_of = [self.ids[x] for x in self.part_of[code]]
+        term.obsolete = code in self.obsolete
+        term.replaced_by = self.replaced_by.get(code, [])
+        term.consider = self.consider.get(code, [])
+        term.subsets = sorted([subset for subset, codes
+                               in self.subsets.iteritems() if code in codes])
+        return term
+
+    def subset(self, name):
+        '''
+        Returns the IDs of the terms in a subset (such as goslim_generic),
+        in the order of the OBO file; an empty list for unknown subsets.
+        '''
+        return [self.ids[code] for code in sorted(self.subsets.get(name, []))]
+
+    def _parents(self, code, relations):
+        parents = []
+        if 'is_a' in relations:
+            parents.extend(self.isa[code])
+        if 'part_of' in relations:
+            parents.extend(self.part_of[code])
+        return parents
+
+    def closure(self, relations=('is_a',)):
+        '''
+        Returns the ancestor closure of every term along the specified
+        relations: a closure_index holding, for each term code, the sorted
+        array of the codes of its ancestors, plus the depth of each term.
+        Computed once (in topological order) and kept.
+        '''
+        key = tuple(sorted(relations))
+        if key not in self.closures:
+            self.closures[key] = closure_index(self, relations)
+        return self.closures[key]
+
+    def children_index(self, relations=('is_a',)):
+        '''
+        Returns the reverse edges of the specified relations, as a
+        (offsets, codes) pair in CSR layout: the children of term code c
+        are codes[offsets[c]:offsets[c + 1]].
+        '''
+        key = tuple(sorted(relations))
+        if key not in self.children_indexes:
+            parents = []
+            children = []
+            for code in range(len(self.ids)):
+                for parent in self._parents(code, relations):
+                    parents.append(parent)
+                    children.append(code)
+            parents = numpy.array(parents, dtype=numpy.int32)
+            children = numpy.array(children, dtype=numpy.int32)
+            order = numpy.argsort(parents, kind='mergesort')
+            offsets = numpy.zeros(len(self.ids) + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(parents, minlength=len(self.ids)),
+                         out=offsets[1:])
+            self.children_indexes[key] = (offsets, children[order])
+        return self.children_indexes[key]
+
+    def children(self, id, relations=('is_a',)):
+        '''
+        Returns the IDs of the direct children of a term along the specified
+        relations.
+        '''
+        code = self.code(id)
+        if code is None:
+            return []
+        offsets, codes = self.children_index(relations)
+        return [self.ids[x] for x in codes[offsets[code]:offsets[code + 1]]]
+
+    def descendants(self, id, relations=('is_a',)):
+        '''
+        Returns the set of IDs of all descendants of a term, following the
+        specified relations ('is_a' and/or 'part_of').
+        '''
+        code = self.code(id)
+        if code is None:
+            return set()
+        ids = self.ids
+        return set([ids[x] for x in self.closure(relations).descendants(code)])
+
+    def descendants_of(self, ids, relations=('is_a',), include_self=True):
+        '''
+        Returns the set of IDs of all terms at or below any of the specified
+        terms (only below them, if include_self is False).
+        '''
+        codes = self.codes_of(ids)
+        codes = codes[codes >= 0]
+        rows, found = self.closure(relations).gather_descendants(codes)
+        if include_self:
+            found = numpy.concatenate([found, codes])
+        all_ids = self.ids
+        return set([all_ids[x] for x in numpy.unique(found)])
+
+    def codes_of(self, ids):
+        '''
+        Translates a sequence of IDs into an array of term codes; unknown
+        IDs are coded as -1.
+        '''
+        codes = [self.code(id) for id in ids]
+        return numpy.array([-1 if c is None else c for c in codes],
+                           dtype=numpy.int32)
+
+    def ancestors(self, id, relations=('is_a',)):
+        '''
+        Returns the set of IDs of all ancestors of a term, following the
+        specified relations ('is_a' and/or 'part_of').
+        '''
+        code = self.code(id)
+        if code is None:
+            return set()
+        ids = self.ids
+        return set([ids[x] for x in self.closure(relations).ancestors(code)])
+
+    def common_ancestors(self, id1, id2, relations=('is_a',)):
+        code1 = self.code(id1)
+        code2 = self.code(id2)
+        if code1 is None or code2 is None:
+            return set()
+        closure = self.closure(relations)
+        common = numpy.intersect1d(closure.ancestors(code1, True),
+                                   closure.ancestors(code2, True),
+                                   assume_unique=True)
+        return set([self.ids[x] for x in common])
+
+    def depth(self, id, relations=('is_a',)):
+        '''
+        Length of the longest path from a term to the root of its
+        namespace; None for unknown IDs.
+        '''
+        code = self.code(id)
+        if code is None:
+            return None
+        return int(self.closure(relations).depths[code])
+
+    def map_to_slims(self, ids, slims, relations=('is_a',)):
+        '''
+        Maps each of the specified terms to the slim terms (from the
+        sequence slims) among its ancestors, for all terms at once.
+        Returns a list with a set of slim IDs per term.
+        '''
+        closure = self.closure(relations)
+        mask = numpy.zeros(len(self.ids), dtype=bool)
+        slim_codes = self.codes_of(slims)
+        mask[slim_codes[slim_codes >= 0]] = True
+
+        rows, ancestors = closure.gather(self.codes_of(ids))
+        keep = mask[ancestors]
+        rows = rows[keep]
+        ancestors = ancestors[keep]
+
+        mapped = [set() for id in ids]
+        all_ids = self.ids
+        for row, code in zip(rows.tolist(), ancestors.tolist()):
+            mapped[row].add(all_ids[code])
+        return mapped
+
+class closure_index:
+    '''
+    Ancestor closure of an ontology along a set of relations.  The
+    ancestors of all terms are stored as one array of term codes, sorted
+    within each term and delimited by offsets (CSR layout): the ancestors
+    of term code c are codes[offsets[c]:offsets[c + 1]].
+    '''
+    def __init__(self, ont, relations=('is_a',)):
+        n = len(ont.ids)
+        parents = [ont._parents(code, relations) for code in range(n)]
+
+        # order the terms so that every term follows all of its parents
+        order = []
+        state = [0] * n     # 0: unvisited, 1: in progress, 2: done
+        for start in range(n):
+            if state[start] != 0:
+                continue
+            stack = [(start, iter(parents[start]))]
+            state[start] = 1
+            while len(stack) > 0:
+                code, it = stack[-1]
+                advanced = False
+                for parent in it:
+                    if state[parent] == 0:
+                        state[parent] = 1
+                        stack.append((parent, iter(parents[parent])))
+                        advanced = True
+                        break
+                if not advanced:
+                    state[code] = 2
+                    order.append(code)
+                    stack.pop()
+
+        closures = [None] * n
+        depths = numpy.zeros(n, dtype=numpy.int32)
+        for code in order:
+            anc = set()
+            depth = 0
+            for parent in parents[code]:
+                if closures[parent] is None:
+                    # a cycle; ignore the edge
+                    continue
+                anc.add(parent)
+                anc.update(closures[parent])
+                depth = max(depth, depths[parent] + 1)
+            closures[code] = anc
+            depths[code] = depth
+
+        lengths = numpy.array([len(c) for c in closures], dtype=numpy.int64)
+        self.offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=self.offsets[1:])
+        self.codes = numpy.empty(self.offsets[-1], dtype=numpy.int32)
+        for code, anc in enumerate(closures):
+            self.codes[self.offsets[code]:self.offsets[code + 1]] = \
+                        sorted(anc)
+        self.depths = depths
+        # descendant closure, built when first needed
+        self.desc_offsets = None
+        self.desc_codes = None
+
+    def ancestors(self, code, as_array=False):
+        anc = self.codes[self.offsets[code]:self.offsets[code + 1]]
+        if as_array:
+            return anc
+        return anc.tolist()
+
+    def _transpose(self):
+        # the descendant closure is the transpose of the ancestor closure
+        n = len(self.offsets) - 1
+        terms = numpy.repeat(numpy.arange(n, dtype=numpy.int32),
+                             numpy.diff(self.offsets))
+        order = numpy.argsort(self.codes, kind='mergesort')
+        self.desc_offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(self.codes, minlength=n),
+                     out=self.desc_offsets[1:])
+        self.desc_codes = terms[order]
+
+    def descendants(self, code, as_array=False):
+        if self.desc_offsets is None:
+            self._transpose()
+        desc = self.desc_codes[self.desc_offsets[code]:
+                               self.desc_offsets[code + 1]]
+        if as_array:
+            return desc
+        return desc.tolist()
+
+    def gather(self, codes):
+        '''
+        Collects the ancestors of many terms at once.  Returns two parallel
+        arrays: the position in codes of each term, and the code of each of
+        its ancestors.  Negative codes (unknown terms) have no ancestors.
+        '''
+        return _gather(self.offsets, self.codes, codes)
+
+    def gather_descendants(self, codes):
+        '''
+        Collects the descendants of many terms at once, like gather().
+        '''
+        if self.desc_offsets is None:
+            self._transpose()
+        return _gather(self.desc_offsets, self.desc_codes, codes)
+
+def _gather(offsets, values, codes):
+    codes = numpy.asarray(codes)
+    valid = codes >= 0
+    starts = numpy.zeros(len(codes), dtype=numpy.int64)
+    lengths = numpy.zeros(len(codes), dtype=numpy.int64)
+    starts[valid] = offsets[codes[valid]]
+    lengths[valid] = offsets[codes[valid] + 1] - starts[valid]
+
+    total = lengths.sum()
+    rows = numpy.repeat(numpy.arange(len(codes)), lengths)
+    # position of each gathered element: the start of its term's segment
+    # plus its index within the segment
+    seg_begin = numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    positions = numpy.repeat(starts, lengths) + \
+                (numpy.arange(total) - seg_begin)
+    return rows, values[positions]
@@ -2,7 +2,11 @@
 # MIT License
 # http://opensource.org/licenses/MIT
 
+import os, time, threading
 import utils
+from obo import obo_term, obo_ontology
+from enzyme import enzyme_db, parent_number
+from external2go import xref_store, sources as xref_sources
 from BeautifulSoup import BeautifulSoup, Tag
 
 class _go:
@@ -17,6 +21,33 @@ class _go:
         self._children = []
         self.namespace = ''
         self.slims = []
+        self.alt_ids = []
+        self.obsolete = False
+        self.replaced_by = []
+
+        if isinstance(obo, obo_term):
+            # from the locally loaded ontology (see load_go)
+            self._from_term(obo)
+        else:
+            self._from_obo(obo)
+
+        self.slims = list(set(self.ancestors).intersection(cache_go_slims))
+
+    def _from_term(self, term):
+        self.obo = []
+        self.id = term.id
+        self.name = term.name
+        self.definition = term.definition
+        self.synonyms = term.synonyms
+        self.xrefs = term.xrefs
+        self.isa = term.isa
+        self.namespace = term.namespace
+        self.alt_ids = term.alt_ids
+        self.obsolete = term.obsolete
+        self.replaced_by = term.replaced_by
+        self.ancestors = list(go_ontology.ancestors(term.id))
+
+    def _from_obo(self, obo):
         self.obo = obo.split('\n')
         for line in self.obo:
             if line.startswith('id: '):
@@ -33,24 +64,18 @@ class _go:
                 entries = line[6:].split('!')
                 self.isa.append(entries[0].strip())
 
-        current = []
-        current.extend(self.isa)
-        while len(current) > 0:
-            parent = go(current.pop(0))
-            if len(parent.isa) == 0:
-                self.namespace = parent.name
-            self.ancestors.append(parent.id)
-            current.extend(parent.isa)
-        self.ancestors = list(set(self.ancestors))
+        # the ancestors of the parents have already been determined
+        ancestors = set()
+        for isa in self.isa:
+            parent = go(isa)
+            ancestors.add(parent.id)
+            ancestors.update(parent.ancestors)
+            self.namespace = parent.namespace
+        self.ancestors = list(ancestors)
 
         if len(self.ancestors) == 0:
             self.namespace = self.name
 
-        for current in self.ancestors:
-            if current in cache_go_slims:
-                self.slims.append(current)
-        self.slims = list(set(self.slims))
-
     def print_ancestry(self):
         print '%s %s' % (self.id, self.name)
         for isa in self.isa:
@@ -66,6 +91,10 @@ class _go:
 
     @property
     def children(self):
+        if go_ontology is not None and self.id in go_ontology:
+            # the loaded ontology indexes the reverse is_a edges
+            return go_ontology.children(self.id)
+
         # this is nasty, but the children are not encoded in the OBO
         if len(self._children) == 0:
             file = utils.download('%smini' % (url_go_lookup[:-3] % self.id))
@@ -90,29 +119,101 @@ url_go_lookup = 'http://www.ebi.ac.uk/QuickGO/GTerm?id=%s&format=obo'
 cache_go = {}
 
 url_go_slims = 'http://www.geneontology.org/ontology/subsets/goslim_generic.obo'
+go_slim_subset = 'goslim_generic'
 cache_go_slims = []
 
 def _populate_go_slims():
     global cache_go_slims
 
-    if len(cache_go_slims) == 0:
+    if len(cache_go_slims) == 0 and go_ontology is not None:
+        # the slims are marked as a subset in the loaded ontology
+        cache_go_slims = go_ontology.subset(go_slim_subset)
+    elif len(cache_go_slims) == 0:
         file = utils.download(url_go_slims)
 
+        slims = []
         for line in file.split('\n'):
             if line.startswith('id: GO:'):
-                cache_go_slims.append(line[4:])
+                slims.append(line[4:])
+        cache_go_slims = slims
+
+url_go_obo = 'http://purl.obolibrary.org/obo/go.obo'
+local_go_obo = 'local_cache/go.obo'
+go_ontology = None
+
+def load_go(filename=None):
+    '''
+    Loads the entire gene ontology into memory, so that go() no longer
+    downloads each term separately.  filename may be a go.obo file or its
+    precompiled form (go.obo.pkl, written the first time go.obo is loaded);
+    if omitted, go.obo is downloaded once and kept as local_go_obo.  Terms
+    that are not in the loaded ontology are still downloaded.  The GO
+    slims are then taken from the ontology's goslim_generic subset, rather
+    than downloaded.
+    '''
+    global go_ontology, cache_go, cache_go_slims
+
+    if filename is None:
+        filename = local_go_obo
+        if not os.path.exists(filename) and \
+                    not os.path.exists('%s.pkl' % filename):
+            file = utils.download(url_go_obo, use_cache=False)
+            directory = os.path.dirname(filename)
+            if directory != '' and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(filename, 'w') as f:
+                f.write(file)
+
+    if filename.endswith('.pkl'):
+        ont = obo_ontology.load_compiled(filename)
+        if ont is None:
+            raise Exception('%s was compiled by a different version of ' \
+                            'the ontology oracle' % filename)
+    else:
+        ont = obo_ontology.load(filename)
+
+    go_ontology = ont
+    cache_go = {}
+    cache_go_slims = ont.subset(go_slim_subset)
+    return go_ontology
 
 def go(term):
     global cache_go
 
     if term not in cache_go:
         _populate_go_slims()
-        file = utils.download(url_go_lookup % term)
-        cache_go[term] = _go(file)
+        record = None
+        if go_ontology is not None:
+            record = go_ontology.term(term)
+        if record is not None:
+            cache_go[term] = _go(record)
+        else:
+            file = utils.download(url_go_lookup % term)
+            cache_go[term] = _go(file)
 
     return cache_go[term]
 
 
+def map_to_slims(terms):
+    '''
+    Maps each of the GO terms to the GO slims among its ancestors; returns
+    a list with a list of slims per term.  With the ontology loaded (see
+    load_go), all the terms are mapped at once from its ancestor closure.
+    '''
+    _populate_go_slims()
+    if go_ontology is None:
+        return [go(term).slims for term in terms]
+
+    mapped = go_ontology.map_to_slims(terms, cache_go_slims)
+    slims = []
+    for term, slim_set in zip(terms, mapped):
+        if term in go_ontology:
+            slims.append(list(slim_set))
+        else:
+            slims.append(go(term).slims)
+    return slims
+
+
 class _ec:
     def __init__(self, txt):
         self.id = ''
@@ -120,15 +221,20 @@ class _ec:
         self.synonyms = []
         self.reaction = ''
         self.txt = txt.split('\n')
+        # names and reactions may continue over several lines
+        names = []
+        reactions = []
         for line in self.txt:
             if line.startswith('ID  '):
-                self.id = line[5:]
+                self.id = line[5:].strip()
             elif line.startswith('DE  '):
-                self.name = line[5:].strip('.')
+                names.append(line[5:].strip())
             if line.startswith('AN '):
                 self.synonyms.append(line[5:].strip('.'))
             elif line.startswith('CA  '):
-                self.reaction = line[5:].strip('.')
+                reactions.append(line[5:].strip())
+        self.name = ' '.join(names).strip('.')
+        self.reaction = ' '.join(reactions).strip('.')
 
         nums = self.id.split('.')
         if nums[1] == '-':
@@ -154,26 +260,58 @@ class _ec:
 
     @property
     def parent(self):
-        nums = self.id.split('.')
-        if nums[1] == '-':
+        number = parent_number(self.id)
+        if number is None:
             return None
-        if nums[3] != '-':
-            nums[3] = '-'
-        elif nums[2] != '-':
-            nums[2] = '-'
-        else:
-            nums[1] = '-'
-        return ec('.'.join(nums))
+        return ec(number)
 
 url_ec_leaf_lookup = 'http://enzyme.expasy.org/EC/%s.txt'
 url_ec_lookup = 'http://enzyme.expasy.org/EC/%s'
 cache_ec = {}
 
+url_enzyme_dat = 'https://ftp.expasy.org/databases/enzyme/enzyme.dat'
+url_enzclass = 'https://ftp.expasy.org/databases/enzyme/enzclass.txt'
+local_enzyme_dat = 'local_cache/enzyme.dat'
+local_enzclass = 'local_cache/enzclass.txt'
+enzyme_database = None
+
+def load_enzyme(dat_filename=None, class_filename=None):
+    '''
+    Loads the ENZYME database (enzyme.dat and enzclass.txt) into memory, so
+    that ec() no longer downloads each EC number and its parent classes.
+    Files that are not specified are downloaded once and kept as
+    local_enzyme_dat and local_enzclass.  EC numbers that are not in the
+    loaded database are still downloaded.
+    '''
+    global enzyme_database, cache_ec
+
+    filenames = []
+    for filename, local, url in ((dat_filename, local_enzyme_dat,
+                                  url_enzyme_dat),
+                                 (class_filename, local_enzclass,
+                                  url_enzclass)):
+        if filename is None:
+            filename = local
+            if not os.path.exists(filename):
+                file = utils.download(url, use_cache=False)
+                directory = os.path.dirname(filename)
+                if directory != '' and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                with open(filename, 'w') as f:
+                    f.write(file)
+        filenames.append(filename)
+
+    enzyme_database = enzyme_db.load(filenames[0], filenames[1])
+    cache_ec = {}
+    return enzyme_database
+
 def ec(number):
     global cache_ec
 
     if number not in cache_ec:
-        if '-' in number:
+        if enzyme_database is not None and number in enzyme_database:
+            cache_ec[number] = _ec(enzyme_database.entry(number))
+        elif '-' in number:
             file = utils.download(url_ec_lookup % number)
             lines = ['ID   %s' % number]
             for line in file.split('\n'):
@@ -189,195 +327,82 @@ def ec(number):
     return cache_ec[number]
 
 
-url_ec2go = 'http://geneontology.org/external2go/ec2go'
-local_ec2go = 'local_cache/ec2go.txt'
-cache_ec2go = None
+# the external2go mappings, compiled into a single memory-mapped file (see
+# external2go.py); recompiled from the published mappings when older than
+# xref2go_max_age seconds
+local_xref2go = 'local_cache/external2go.bin'
+xref2go_max_age = 7 * 24 * 60 * 60
+xref2go_store = None
+
+# serializes the loading of the external2go mappings among threads
+_mapping_lock = threading.Lock()
+
+def compile_xref2go(filename=None):
+    '''
+    Downloads all the external2go mappings and compiles them into filename
+    (local_xref2go by default); returns the compiled store.
+    '''
+    global xref2go_store
+
+    if filename is None:
+        filename = local_xref2go
+    store = xref_store.build()
+    try:
+        directory = os.path.dirname(filename)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+        store.save(filename)
+        store = xref_store.open(filename)
+    except (IOError, OSError):
+        # not fatal; the mappings will be compiled again next time
+        pass
+    xref2go_store = store
+    return store
+
+def _open_xref2go():
+    global xref2go_store
+
+    if xref2go_store is None:
+        with _mapping_lock:
+            if xref2go_store is None:
+                store = None
+                if os.path.exists(local_xref2go):
+                    store = xref_store.open(local_xref2go)
+                    if store is not None and \
+                                set(store.kinds) != set(xref_sources.keys()):
+                        store = None
+                if store is None:
+                    store = compile_xref2go()
+                elif time.time() - os.path.getmtime(local_xref2go) > \
+                            xref2go_max_age:
+                    try:
+                        store = compile_xref2go()
+                    except:
+                        # keep using the outdated mappings
+                        pass
+                xref2go_store = store
+
+    return xref2go_store
+
+def xref2go(kind, ids):
+    '''
+    Returns the deduplicated list of GO terms associated with any of the
+    external identifiers ids (a string or a list of strings) of the given
+    kind: 'ec', 'pfam', 'tigrfam', 'smart' or 'interpro'.
+    '''
+    return _open_xref2go().lookup(kind, ids)
 
 def ec2go(ec):
-    global cache_ec2go
-    if cache_ec2go is None:
-        #print 'Building ontology mapping: EC numbers -> GO terms'
-        try:
-            file = utils.download(url_ec2go)
-        except:
-            # open from the local cache
-            with open(local_ec2go, 'r') as f:
-                file = f.read()
-
-        cache_ec2go = {}
-        for line in file.split('\n'):
-            if line.startswith('!') or line.strip() == '':
-                continue
-            entries = line.split(' ')
-            e = entries[0].split(':')
-            if e[1] not in cache_ec2go:
-                cache_ec2go[e[1]] = []
-            cache_ec2go[e[1]].append(entries[-1])
-
-    # accept either a string or a list of strings as a parameter
-    if isinstance(ec, basestring):
-        ec = [ec]
-
-    go_terms = []
-    for e in ec:
-        if e.startswith('ec:') or e.startswith('EC:'):
-            e = e[3:]
-
-        if e in cache_ec2go:
-            go_terms.extend(cache_ec2go[e])
-
-    return go_terms
-
-url_pfam2go = 'http://geneontology.org/external2go/pfam2go'
-local_pfam2go = 'local_cache/pfam2go.txt'
-cache_pfam2go = None
+    return xref2go('ec', ec)
 
 def pfam2go(pfam):
-    global cache_pfam2go
-    if cache_pfam2go is None:
-        #print 'Building ontology mapping: Pfams -> GO terms'
-        try:
-            file = utils.download(url_pfam2go)
-        except:
-            # open from the local cache
-            with open(local_pfam2go, 'r') as f:
-                file = f.read()
-
-        cache_pfam2go = {}
-        for line in file.split('\n'):
-            if line.startswith('!'):
-                continue
-            entries = line.split(' ')
-            if entries[0] not in cache_pfam2go:
-                cache_pfam2go[entries[0]] = []
-            cache_pfam2go[entries[0]].append(entries[-1])
-
-    # accept either a string or a list of strings as a parameter
-    if isinstance(pfam, basestring):
-        pfam = [pfam]
-
-    go_terms = []
-    for pf in pfam:
-        if pf.startswith('pfam'):
-            pf = 'Pfam:PF%s' % pf[4:]
-        elif pf.startswith('PFAM'):
-            pf = 'Pfam:PF%s' % pf[4:]
-        elif pf.startswith('PF'):
-            pf = 'Pfam:PF%s' % pf[2:]
-
-        if pf in cache_pfam2go:
-            go_terms.extend(cache_pfam2go[pf])
-
-    return go_terms
-
-url_tigrfam2go = 'http://geneontology.org/external2go/tigrfams2go'
-local_tigrfam2go = 'local_cache/tigrfam2go.txt'
-cache_tigrfam2go = None
+    return xref2go('pfam', pfam)
 
 def tigrfam2go(tigrfam):
-    global cache_tigrfam2go
-    if cache_tigrfam2go is None:
-        #print 'Building ontology mapping: TIGRFAMs -> GO terms'
-        try:
-            file = utils.download(url_tigrfam2go)
-        except:
-            # open from the local cache
-            with open(local_tigrfam2go, 'r') as f:
-                file = f.read()
-
-        cache_tigrfam2go = {}
-        for line in file.split('\n'):
-            if line.startswith('!') or line.strip() == '':
-                continue
-            entries = line.split(' ')
-            tf = entries[0].split(':')
-            if tf[1] not in cache_tigrfam2go:
-                cache_tigrfam2go[tf[1]] = []
-            cache_tigrfam2go[tf[1]].append(entries[-1])
-
-    # accept either a string or a list of strings as a parameter
-    if isinstance(tigrfam, basestring):
-        tigrfam = [tigrfam]
-
-    go_terms = []
-    for tf in tigrfam:
-        if tf in cache_tigrfam2go:
-            go_terms.extend(cache_tigrfam2go[tf])
-
-    return go_terms
-
-url_smart2go = 'http://geneontology.org/external2go/smart2go'
-local_smart2go = 'local_cache/smart2go.txt'
-cache_smart2go = None
+    return xref2go('tigrfam', tigrfam)
 
 def smart2go(smart):
-    global cache_smart2go
-    if cache_smart2go is None:
-        #print 'Building ontology mapping: SMART entries -> GO terms'
-        try:
-            file = utils.download(url_smart2go)
-        except:
-            # open from the local cache
-            with open(local_smart2go, 'r') as f:
-                file = f.read()
-
-        cache_smart2go = {}
-        for line in file.split('\n'):
-            if line.startswith('!') or line.strip() == '':
-                continue
-            entries = line.split(' ')
-            s = entries[0].split(':')
-            if s[1] not in cache_smart2go:
-                cache_smart2go[s[1]] = []
-            cache_smart2go[s[1]].append(entries[-1])
-
-    # accept either a string or a list of strings as a parameter
-    if isinstance(smart, basestring):
-        smart = [smart]
-
-    go_terms = []
-    for s in smart:
-        if s.startswith('smart'):
-            s = 'SM%s' % s[5:]
-
-        if s in cache_smart2go:
-            go_terms.extend(cache_smart2go[s])
-
-    return go_terms
-
-url_interpro2go = 'http://geneontology.org/external2go/interpro2go'
-local_interpro2go = 'local_cache/interpro2go.txt'
-cache_interpro2go = None
+    return xref2go('smart', smart)
 
 def interpro2go(interpro):
-    global cache_interpro2go
-    if cache_interpro2go is None:
-        #print 'Building ontology mapping: InterPro entries -> GO terms'
-        try:
-            file = utils.download(url_interpro2go)
-        except:
-            # open from the local cache
-            with open(local_interpro2go, 'r') as f:
-                file = f.read()
-
-        cache_interpro2go = {}
-        for line in file.split('\n'):
-            if line.startswith('!') or line.strip() == '':
-                continue
-            entries = line.split(' ')
-            s = entries[0].split(':')
-            if s[1] not in cache_interpro2go:
-                cache_interpro2go[s[1]] = []
-            cache_interpro2go[s[1]].append(entries[-1])
-
-    # accept either a string or a list of strings as a parameter
-    if isinstance(interpro, basestring):
-        interpro = [interpro]
-
-    go_terms = []
-    for i in interpro:
-        if i in cache_interpro2go:
-            go_terms.extend(cache_interpro2go[i])
-
-    return go_terms
-
+    return xref2go('interpro', interpro)
@@ -2,10 +2,117 @@
 # MIT License
 # http://opensource.org/licenses/MIT
 
-import math
-from utils import dataset, fold_change
-from services import mine_protein
-from ontology import go
+import os, cPickle
+import numpy, pandas
+from multiprocessing.pool import ThreadPool
+from utils import dataset, fold_change, fold_changes, DownloadError
+from services import mine_protein, prefetch_proteins
+from columns import vocabulary, term_column
+from tablefile import file_format, write_table, open_table
+from matcher import pattern_matcher
+from enrichment import hypergeometric_sf, benjamini_hochberg
+from enzyme import parent_number, class_number
+from obo import _gather
+import ontology
+from ontology import map_to_slims
+
+# the columns of a table holding lists of terms, and the attributes of the
+# rows that they correspond to
+term_columns = ['go', 'go-slim', 'ec', 'pfam', 'tigrfam', 'smart', 'interpro']
+_term_attributes = {
+    'go':       'go',
+    'go-slim':  'go_slims',
+    'ec':       'ec',
+    'pfam':     'pfam',
+    'tigrfam':  'tigrfam',
+    'smart':    'smart',
+    'interpro': 'interpro',
+}
+
+# the columns of the dumped tables holding lists of terms
+_dumped_term_columns = {
+    'go':       'go-term',
+    'go-slim':  'go-slim',
+    'ec':       'ec',
+    'pfam':     'pfam',
+    'tigrfam':  'tigrfam',
+    'smart':    'smart',
+    'interpro': 'interpro',
+}
+
+def _string_or_none(value):
+    if isinstance(value, basestring) and value != '':
+        return value
+    return None
+
+def _strings(column):
+    # the values of a column of strings, with None for missing values
+    values = numpy.array(column, dtype=object)
+    values[pandas.isnull(values) | (values == '')] = None
+    return values
+
+def _text(value):
+    # the byte string written for a value; unicode text is encoded as UTF-8
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def _expand_terms(terms, kind, relations):
+    # each of the terms followed by its ancestors (the classes above an EC
+    # number; the GO terms, or GO slims, above a GO term), as one list of
+    # terms and the position in terms of the term each one stands for
+    expanded = list(terms)
+    sources = range(len(terms))
+    if kind in ('go', 'go-slim'):
+        ont = ontology.go_ontology
+        if ont is None:
+            raise Exception('the gene ontology has not been loaded')
+        codes = ont.codes_of(terms)
+        expanded = [ont.ids[c] if c >= 0 else t for t, c in zip(terms, codes)]
+        positions, ancestors = ont.closure(relations).gather(codes)
+        if kind == 'go-slim':
+            ontology._populate_go_slims()
+            slims = ont.codes_of(ontology.cache_go_slims)
+            keep = numpy.in1d(ancestors, slims[slims >= 0])
+            positions = positions[keep]
+            ancestors = ancestors[keep]
+        expanded.extend(ont.ids[a] for a in ancestors.tolist())
+        sources.extend(positions.tolist())
+    elif kind == 'ec':
+        for i, number in enumerate(terms):
+            number = parent_number(number)
+            while number is not None:
+                expanded.append(number)
+                sources.append(i)
+                number = parent_number(number)
+    return expanded, numpy.array(sources, dtype=numpy.int64)
+
+def _term_names(terms, kind):
+    # the name and namespace of each of the (distinct) terms
+    if kind in ('go', 'go-slim'):
+        ont = ontology.go_ontology
+        codes = ont.codes_of(terms) if ont is not None else [-1] * len(terms)
+        names = []
+        namespaces = []
+        for term, code in zip(terms, codes):
+            if code >= 0:
+                names.append(ont.names[code])
+                namespaces.append(ont.namespaces[code])
+            else:
+                record = ontology.go(term)
+                names.append(record.name)
+                namespaces.append(record.namespace)
+        return names, namespaces
+    elif kind == 'ec':
+        names = []
+        for number in terms:
+            chain = []
+            while number is not None:
+                chain.insert(0, ontology.ec(number).name)
+                number = parent_number(number)
+            names.append(' :: '.join(chain))
+        return names, [None] * len(terms)
+    return list(terms), [None] * len(terms)
 
 class _feature_row:
     def __init__(self, feature, description, gene, protein_id):
@@ -29,15 +136,19 @@ class _feature_row:
         else:
             self.protein_id = None
 
-        self.expression_labels = []
-        self.expression = {}
-        self.foldchange_labels = []
-        self.foldchanges = {}
-        self.annotation_labels = []
-        self.annotation = {}
+        # identifies the row of the feature table, for checkpoints and
+        # updates (the gene may be filled in by retrieve_accession)
+        self.key = (self.feature, self.protein_id, self.gene)
+
+    def __getstate__(self):
+        # the accession, with its full record, is not needed once mined
+        state = dict(self.__dict__)
+        state.pop('acc', None)
+        return state
 
-    def retrieve_accession(self, organism, lookup_db):
-        self.acc = mine_protein(self.protein_id, lookup_db, self.gene, organism)
+    def retrieve_accession(self, organism, lookup_db, acc=None):
+        self.acc = mine_protein(self.protein_id, lookup_db, self.gene, organism,
+                                acc)
         if self.gene is None:
             if self.acc is not None and len(self.acc.gene) > 0:
                 self.gene = self.acc.gene
@@ -59,145 +170,234 @@ class _feature_row:
             self.smart = self.acc.smart
             self.interpro = self.acc.interpro
 
+def _write_checkpoint(filename, rows):
+    # checkpoints are a series of pickled lists of mined rows, appended as
+    # the rows are mined
+    with open(filename, 'ab') as f:
+        cPickle.dump(rows, f, cPickle.HIGHEST_PROTOCOL)
+
+def _read_checkpoint(filename):
+    # returns a dictionary of key -> mined row; a list that was only
+    # partially written (if the process was killed) is ignored
+    rows = {}
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                batch = cPickle.load(f)
+            except Exception:
+                # the end of the file, or a truncated list
+                break
+            for row in batch:
+                rows[row.key] = row
+    return rows
+
+def _terms_property(kind):
+    def get(self):
+        return self.table.terms[kind][self.row]
+    def set(self, terms):
+        self.table.terms[kind].set(self.row, terms if terms else [])
+        self.table._incidences = {}
+    return property(get, set)
+
+def _value_property(column):
+    def get(self):
+        return self.table.data[column].values[self.row]
+    def set(self, value):
+        self.table.data.at[self.row, column] = _string_or_none(value)
+        self.table._incidences = {}
+        if column in ('feature', 'gene'):
+            self.table.build_index()
+    return property(get, set)
+
+class _row_view(object):
+    '''
+    One row of an ontology_table, with the attributes of the rows that
+    tables used to be made of; values are read from (and written to) the
+    columns of the table.
+    '''
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    feature = _value_property('feature')
+    gene = _value_property('gene')
+    description = _value_property('description')
+    protein_id = _value_property('protein_id')
+
+    go = _terms_property('go')
+    go_slims = _terms_property('go-slim')
+    ec = _terms_property('ec')
+    pfam = _terms_property('pfam')
+    tigrfam = _terms_property('tigrfam')
+    smart = _terms_property('smart')
+    interpro = _terms_property('interpro')
+
+    def _values(self, prefix, labels):
+        values = {}
+        for label in labels:
+            value = self.table.data['%s:%s' % (prefix, label)].values[self.row]
+            if value is not None and value == value:
+                values[label] = value
+        return values
+
+    @property
+    def expression(self):
+        return self._values('expr', self.table.expression_labels)
+
+    @property
+    def expression_labels(self):
+        return [l for l in self.table.expression_labels
+                if l in self.expression]
+
+    @property
+    def foldchanges(self):
+        return self._values('foldchange', self.table.foldchanges)
+
+    @property
+    def foldchange_labels(self):
+        return [l for l in self.table.foldchanges if l in self.foldchanges]
+
+    @property
+    def annotation(self):
+        return self._values('annotation', self.table.annotation_labels)
+
+    @property
+    def annotation_labels(self):
+        return [l for l in self.table.annotation_labels
+                if l in self.annotation]
+
     def add_expression(self, label, value):
-        self.expression_labels.append(label)
-        self.expression[label] = value
+        self.table._column('expr', label)
+        self.table.data.at[self.row, 'expr:%s' % label] = value
 
     def calc_foldchange(self, from_label, to_label):
-        label = '%s:%s' % (from_label, to_label)
-        if from_label in self.expression_labels and \
-                    to_label in self.expression_labels:
-            self.foldchange_labels.append(label)
-            self.foldchanges[label] = fold_change(self.expression[from_label],
-                                                  self.expression[to_label])
+        expression = self.expression
+        if from_label in expression and to_label in expression:
+            label = '%s:%s' % (from_label, to_label)
+            self.table._column('foldchange', label)
+            self.table.data.at[self.row, 'foldchange:%s' % label] = \
+                        fold_change(expression[from_label],
+                                    expression[to_label])
 
     def add_annotation(self, label, value):
-        self.annotation_labels.append(label)
-        self.annotation[label] = value
+        self.table._column('annotation', label)
+        self.table.data.at[self.row, 'annotation:%s' % label] = value
 
     def csv(self, all_exprs, all_foldchanges, all_annotations):
-        ret = []
-        if self.gene:
-            ret.append(self.gene)
-            ret.append(self.feature)
-        else:
-            ret.append(self.feature)
-            ret.append('')
-        ret.append('"' + self.description + '"')
-        ret.append(';'.join(self.go))
-
-        if not self.go_slims:
-            self.go_slims = []
-            for term in self.go:
-                self.go_slims.extend(go(term).slims)
-            self.go_slims = list(set(self.go_slims))
-        ret.append(';'.join(self.go_slims))
-
-        ret.append(';'.join(self.ec))
-        ret.append(';'.join(self.pfam))
-        ret.append(';'.join(self.tigrfam))
-        ret.append(';'.join(self.smart))
-        ret.append(';'.join(self.interpro))
-        for label in all_exprs:
-            if label in self.expression_labels:
-                ret.append(str(self.expression[label]))
-            else:
-                ret.append('')
-        for label in all_foldchanges:
-            if label in self.foldchange_labels:
-                ret.append(str(self.foldchanges[label]))
-            else:
-                ret.append('')
-        for label in all_annotations:
-            if label in self.annotation_labels:
-                ret.append('"%s"' % str(self.annotation[label]))
-            else:
-                ret.append('')
+        return self.table._csv_lines([self.row], all_exprs, all_foldchanges,
+                                     all_annotations)[0]
+
+class _row_list:
+    '''
+    The rows of an ontology_table, as a sequence of _row_views.
+    '''
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table.data)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [_row_view(self.table, i)
+                    for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if row < 0 or row >= len(self):
+            raise IndexError('row index out of range')
+        return _row_view(self.table, row)
+
+    def __iter__(self):
+        for row in xrange(len(self)):
+            yield _row_view(self.table, row)
 
-        return ','.join(ret)
+class _row_index:
+    '''
+    The rows of an ontology_table by feature (locus tag) and gene name.
+    '''
+    def __init__(self, table):
+        self.table = table
+
+    def __contains__(self, name):
+        return name in self.table._positions
+
+    def __getitem__(self, name):
+        return _row_view(self.table, self.table._positions[name])
+
+    def get(self, name, default=None):
+        if name in self.table._positions:
+            return self[name]
+        return default
+
+    def __len__(self):
+        return len(self.table._positions)
+
+    def __iter__(self):
+        return iter(self.table._positions)
+
+    def keys(self):
+        return self.table._positions.keys()
 
 class ontology_table:
+    '''
+    The annotation of the features of a genome, with expression data,
+    fold changes and other annotations for each feature.
+
+    The table is stored by column: data is a DataFrame with the feature,
+    gene, description and protein_id of each row and one column per
+    expression label ('expr:label'), fold change ('foldchange:label') and
+    annotation ('annotation:label'); terms holds a term_column (see
+    columns.py) for each of term_columns, sharing one vocabulary.  The
+    rows are also available as objects (feat_rows, and index, by feature
+    and gene name), which read and write the columns.
+
+    When a table is built from a feature table, the mined rows can be
+    saved to a checkpoint file every checkpoint_every rows (and when
+    mining fails); with resume, the rows saved in the checkpoint are not
+    mined again.  With update_from, the filename of a table dumped from an
+    earlier version of the feature table, only the features that are new
+    or whose accession or gene changed are mined.
+
+    A table written by dump can be loaded again with filename; columns
+    then restricts the columns read from it to the identifying ones and
+    those specified, as named in the file (e.g. ['go-slim',
+    'foldchange:a:b']).  A table loaded with only some of its columns
+    should not be dumped over the original.
+    '''
     def __init__(self, organism=None, feature_table=None, locus_col=None,
                  gene_col=None, lookup_db=None, label_col=None,
                  accession_col=None, description_col=None,
-                 locus_tag_prefix=None, progress=True, filename = None):
+                 locus_tag_prefix=None, progress=True, filename = None,
+                 workers=1, columns=None, checkpoint=None, resume=False,
+                 update_from=None, checkpoint_every=100):
 
         self.expression_labels = []
         self.foldchanges = []
         self.annotation_labels = []
+        self.vocabulary = vocabulary()
+        # matrices built by incidence, with what they were built from
+        self._incidences = {}
 
         if filename is not None:
-            # build the table from an existing file
-            self.feat_rows = []
-            self.feat_tab = dataset(filename, 'csv')
-            firstrow = True
-            for row in self.feat_tab.rows:
-                feat = _feature_row(row['locus'], row['product'],
-                                    row['feature'], '')
-
-                if isinstance(row['go-term'], basestring):
-                    feat.go = row['go-term'].split(';')
-                else:
-                    feat.go = []
-
-                if isinstance(row['go-slim'], basestring):
-                    feat.go_slims = row['go-slim'].split(';')
-                else:
-                    feat.go_slims = []
-
-                if isinstance(row['ec'], basestring):
-                    feat.ec = row['ec'].split(';')
-                else:
-                    feat.ec = []
-
-                if isinstance(row['pfam'], basestring):
-                    feat.pfam = row['pfam'].split(';')
-                else:
-                    feat.pfam = []
-
-                if isinstance(row['tigrfam'], basestring):
-                    feat.tigrfam = row['tigrfam'].split(';')
-                else:
-                    feat.tigrfam = []
-
-                if isinstance(row['smart'], basestring):
-                    feat.smart = row['smart'].split(';')
-                else:
-                    feat.smart = []
-
-                if isinstance(row['interpro'], basestring):
-                    feat.interpro = row['interpro'].split(';')
-                else:
-                    feat.interpro = []
-
-                for col in self.feat_tab.colnames:
-                    if col.startswith('expr:'):
-                        label = ':'.join(col.split(':')[1:])
-                        if firstrow:
-                            self.expression_labels.append(label)
-                        if isinstance(row[col], float) and \
-                                    not math.isnan(row[col]):
-                            feat.expression_labels.append(label)
-                            feat.expression[label] = row[col]
-                    elif col.startswith('foldchange:'):
-                        label = ':'.join(col.split(':')[1:])
-                        if firstrow:
-                            self.foldchanges.append(label)
-                        if isinstance(row[col], float) and \
-                                    not math.isnan(row[col]):
-                            feat.foldchange_labels.append(label)
-                            feat.foldchanges[label] = row[col]
-                    elif col.startswith('annotation:'):
-                        label = ':'.join(col.split(':')[1:])
-                        if firstrow:
-                            self.annotation_labels.append(label)
-                        if isinstance(row[col], basestring) and row[col] != '':
-                            feat.annotation_labels.append(label)
-                            feat.annotation[label] = row[col]
-
-                self.feat_rows.append(feat)
-                firstrow = False
-            self.build_index()
+            # build the table from an existing file; only the identifying
+            # columns and those in columns are read, but the names of all
+            # the columns of the file are kept in file_columns
+            self.file_columns = []
+            wanted = None
+            if columns is not None:
+                wanted = set(['feature', 'locus', 'product', 'accession'])
+                wanted.update([_dumped_term_columns.get(c, c)
+                               for c in columns])
+            if file_format(filename) is not None:
+                self._load_binary(filename, wanted)
+                return
+            def use(col):
+                # (pandas may ask more than once about a column)
+                if col not in self.file_columns:
+                    self.file_columns.append(col)
+                return wanted is None or col in wanted
+            self.feat_tab = dataset(filename, 'csv', usecols=use)
+            self._load(self.feat_tab.data)
             return
 
         if not organism or not feature_table or not locus_col or \
@@ -209,78 +409,836 @@ class ontology_table:
         self.feat_tab = dataset(feature_table, 'tab-delimited')
         #index = self.feat_tab.index([locus_col, gene_col], accession_col)
 
-        self.feat_rows = []
-        finished = 0
+        features = []
         for row in self.feat_tab.rows:
             if isinstance(row[accession_col], basestring):
-                feature = _feature_row(row[label_col], row[description_col],
-                                       row[gene_col], row[accession_col])
+                features.append(_feature_row(row[label_col],
+                                             row[description_col],
+                                             row[gene_col],
+                                             row[accession_col]))
+
+        # rows that need not be mined again
+        done = {}
+        if update_from is not None:
+            done.update(self._unchanged_rows(update_from, features))
+        if checkpoint is not None:
+            if resume and os.path.exists(checkpoint):
+                done.update(_read_checkpoint(checkpoint))
+            elif os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        remaining = [f for f in features if f.key not in done]
+        if progress and len(done) > 0:
+            print '%d of %d records already mined' % \
+                        (len(features) - len(remaining), len(features))
 
-                feature.retrieve_accession(organism, lookup_db)
+        # the features are mined in chunks of checkpoint_every rows, and the
+        # records of each chunk are retrieved in batches, rather than one
+        # request apiece; if that fails, mine_protein retrieves them one by
+        # one.  With several workers, the features of a chunk are mined
+        # concurrently (the request rate to each database is limited in
+        # utils.download); the results are in the order of the feature table
+        pool = None
+        if workers > 1:
+            pool = ThreadPool(workers)
 
-                self.feat_rows.append(feature)
-            finished += 1
-            if progress and (finished % 10) == 0:
-                print 'finished %4d records' % finished
+        def mine_chunks():
+            for start in range(0, len(remaining), checkpoint_every):
+                chunk = remaining[start:start + checkpoint_every]
+                try:
+                    prefetched = prefetch_proteins(
+                                [f.protein_id for f in chunk], lookup_db)
+                except DownloadError:
+                    prefetched = {}
 
+                def mine(feature):
+                    feature.retrieve_accession(organism, lookup_db,
+                                        prefetched.get(feature.protein_id))
+                    return feature
+
+                if pool is not None:
+                    for feature in pool.imap(mine, chunk):
+                        yield feature
+                else:
+                    for feature in chunk:
+                        yield mine(feature)
+        mined = mine_chunks()
+
+        # the mined rows are saved to the checkpoint every checkpoint_every
+        # rows, and when mining fails, so that a build can be resumed
+        unsaved = []
+        finished = 0
+        try:
+            for feature in mined:
+                done[feature.key] = feature
+                unsaved.append(feature)
+                if checkpoint is not None and \
+                            len(unsaved) >= checkpoint_every:
+                    _write_checkpoint(checkpoint, unsaved)
+                    unsaved = []
+                finished += 1
+                if progress and (finished % 10) == 0:
+                    print 'finished %4d records' % finished
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if checkpoint is not None and len(unsaved) > 0:
+                _write_checkpoint(checkpoint, unsaved)
+
+        self._set_rows([done[f.key] for f in features])
+
+    def _unchanged_rows(self, filename, features):
+        # the rows of a dumped table for the features whose accession and
+        # gene have not changed, by key
+        previous = ontology_table(filename=filename)
+        rows = {}
+        for feature in features:
+            row = previous.index.get(feature.feature)
+            if row is None or row.feature != feature.feature:
+                continue
+            if row.protein_id is None or row.protein_id != feature.protein_id:
+                continue
+            if feature.gene is not None and row.gene != feature.gene:
+                continue
+            unchanged = _feature_row(feature.feature, feature.description,
+                                     row.gene, feature.protein_id)
+            unchanged.key = feature.key
+            for kind in term_columns:
+                setattr(unchanged, _term_attributes[kind],
+                        previous.terms[kind][row.row])
+            rows[feature.key] = unchanged
+        return rows
+
+    def _set_rows(self, rows):
+        # builds the columns from mined _feature_rows
+        self.data = pandas.DataFrame({
+                'feature':     [f.feature for f in rows],
+                'gene':        [f.gene for f in rows],
+                'description': [f.description for f in rows],
+                'protein_id':  [f.protein_id for f in rows]},
+                columns=['feature', 'gene', 'description', 'protein_id'])
+        self.terms = {}
+        for kind in term_columns:
+            attribute = _term_attributes[kind]
+            self.terms[kind] = term_column.from_lists(self.vocabulary,
+                        [getattr(f, attribute) or [] for f in rows])
         self.build_index()
 
+    def _load(self, table):
+        # builds the columns from a dumped table
+        columns = {
+            'feature':     _strings(table['locus']),
+            'gene':        _strings(table['feature']),
+            'description': _strings(table['product']),
+        }
+        if 'accession' in table:
+            columns['protein_id'] = _strings(table['accession'])
+        else:
+            # dumped before accessions were included
+            columns['protein_id'] = numpy.array([None] * len(table),
+                                                dtype=object)
+        order = ['feature', 'gene', 'description', 'protein_id']
+        for col in table.columns:
+            prefix, _, label = col.partition(':')
+            if prefix == 'expr':
+                self.expression_labels.append(label)
+            elif prefix == 'foldchange':
+                self.foldchanges.append(label)
+            elif prefix == 'annotation':
+                self.annotation_labels.append(label)
+                columns[col] = _strings(table[col])
+                order.append(col)
+                continue
+            else:
+                continue
+            columns[col] = pandas.to_numeric(table[col], errors='coerce') \
+                                .values.astype(numpy.float64)
+            order.append(col)
+        self.data = pandas.DataFrame(columns, columns=order)
+
+        self.terms = {}
+        for kind in term_columns:
+            col = _dumped_term_columns[kind]
+            if col in table:
+                self.terms[kind] = term_column.from_strings(self.vocabulary,
+                                                            table[col].values)
+            else:
+                self.terms[kind] = term_column.empty(self.vocabulary,
+                                                     len(table))
+        self.build_index()
+
+    def _load_binary(self, filename, wanted):
+        # builds the columns from a table dumped in a binary format; only
+        # the columns in wanted (all if None) are read
+        store = open_table(filename)
+        meta = store.meta
+        self.file_columns = ['feature', 'locus', 'product', 'accession']
+        self.file_columns.extend([_dumped_term_columns[kind]
+                                  for kind in term_columns
+                                  if kind in meta['terms']])
+        labels = [('expr', self.expression_labels,
+                   meta['expression_labels']),
+                  ('foldchange', self.foldchanges, meta['foldchanges']),
+                  ('annotation', self.annotation_labels,
+                   meta['annotation_labels'])]
+
+        columns = {}
+        order = ['feature', 'gene', 'description', 'protein_id']
+        for col in order:
+            columns[col] = _strings(store.column(col))
+        for prefix, table_labels, stored_labels in labels:
+            for label in stored_labels:
+                col = '%s:%s' % (prefix, label)
+                self.file_columns.append(col)
+                if wanted is not None and col not in wanted:
+                    continue
+                table_labels.append(label)
+                if prefix == 'annotation':
+                    columns[col] = _strings(store.column(col))
+                else:
+                    # converted only if stored with another dtype; the
+                    # DataFrame copies the columns into one block anyway
+                    columns[col] = numpy.asarray(store.column(col),
+                                                 dtype=numpy.float64)
+                order.append(col)
+        self.data = pandas.DataFrame(columns, columns=order)
+
+        kinds = [kind for kind in term_columns if kind in meta['terms'] and
+                 (wanted is None or _dumped_term_columns[kind] in wanted)]
+        if len(kinds) > 0:
+            self.vocabulary = vocabulary(store.vocabulary())
+        self.terms = {}
+        for kind in term_columns:
+            if kind in kinds:
+                # copied, since term columns are updated in place
+                offsets, codes = store.terms(kind)
+                self.terms[kind] = term_column(self.vocabulary,
+                            numpy.array(offsets, dtype=numpy.int64),
+                            numpy.array(codes, dtype=numpy.int32))
+            else:
+                self.terms[kind] = term_column.empty(self.vocabulary,
+                                                     len(self.data))
+        self.build_index()
+
+    def __getattr__(self, name):
+        # tables loaded from binary files only get a feat_tab (the table
+        # as read from a CSV file) if it is asked for
+        if name == 'feat_tab' and 'data' in self.__dict__:
+            self.feat_tab = dataset(self._frame())
+            return self.feat_tab
+        raise AttributeError(name)
+
+    def _frame(self):
+        # the table as a DataFrame with the columns of a dumped table
+        genes = self.data['gene'].values
+        features = self.data['feature'].values
+        named = numpy.array([bool(g) for g in genes])
+        frame = pandas.DataFrame({
+                'feature': numpy.where(named, genes, features),
+                'locus': numpy.where(named, features, None),
+                'product': self.data['description'].values,
+                'accession': self.data['protein_id'].values},
+                columns=['feature', 'locus', 'product', 'accession'])
+        for kind in term_columns:
+            frame[_dumped_term_columns[kind]] = \
+                        [x if x != '' else numpy.nan
+                         for x in self.terms[kind].joined()]
+        for col in self.data.columns[4:]:
+            frame[col] = self.data[col].values
+        return frame
+
+    def _column(self, prefix, label):
+        # adds an empty expression, fold change or annotation column, if
+        # there is not one for the label already
+        labels = {'expr': self.expression_labels,
+                  'foldchange': self.foldchanges,
+                  'annotation': self.annotation_labels}[prefix]
+        col = '%s:%s' % (prefix, label)
+        if label not in labels:
+            labels.append(label)
+        if col not in self.data:
+            if prefix == 'annotation':
+                self.data[col] = numpy.array([None] * len(self.data),
+                                             dtype=object)
+            else:
+                self.data[col] = numpy.nan
+        return col
+
+    @property
+    def feat_rows(self):
+        return _row_list(self)
+
+    def __len__(self):
+        return len(self.data)
+
     def build_index(self):
-        self.index = {}
-        for feat in self.feat_rows:
-            self.index[feat.feature] = feat
-            if feat.gene:
-                self.index[feat.gene] = feat
+        # the rows have changed, so the incidence matrices are out of date
+        self._incidences = {}
+        self._positions = {}
+        for row, (feature, gene) in enumerate(zip(self.data['feature'],
+                                                  self.data['gene'])):
+            if feature is not None:
+                self._positions[feature] = row
+            if gene:
+                self._positions[gene] = row
+        self.index = _row_index(self)
+
+    def map_go_slims(self):
+        '''
+        Determines the GO slims of all rows at once, rather than row by row.
+        '''
+        go = self.terms['go']
+        slims = self.terms['go-slim']
+        todo = (slims.lengths() == 0) & (go.lengths() > 0)
+        if not todo.any():
+            return
+
+        row_ids = go.row_ids()
+        keep = todo[row_ids]
+        row_ids = row_ids[keep]
+        terms, inverse = numpy.unique(go.codes[keep], return_inverse=True)
+
+        # the codes of the slims of each of the GO terms, CSR-style
+        mapped = map_to_slims(self.vocabulary.decode(terms.tolist()))
+        offsets = numpy.zeros(len(terms) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum([len(m) for m in mapped])
+        codes = self.vocabulary.encode([s for m in mapped for s in m])
+
+        positions, slim_codes = _gather(offsets, codes, inverse)
+        if len(slim_codes) == 0:
+            # (the terms have no slims among their ancestors)
+            return
+        self.terms['go-slim'] = term_column.from_pairs(self.vocabulary,
+                    len(self),
+                    numpy.concatenate((slims.row_ids(), row_ids[positions])),
+                    numpy.concatenate((slims.codes, slim_codes)))
+        self._incidences = {}
+
+    def annotated_under(self, terms, relations=('is_a',)):
+        '''
+        Returns the rows annotated with any of the specified GO terms or
+        any of their descendants.  Requires the gene ontology to be loaded
+        (see ontology.load_go).
+        '''
+        if ontology.go_ontology is None:
+            raise Exception('the gene ontology has not been loaded')
+        if isinstance(terms, basestring):
+            terms = [terms]
+        below = ontology.go_ontology.descendants_of(terms, relations)
+        codes = self.vocabulary.lookup(list(below))
+        rows = self.terms['go'].rows_with(codes[codes >= 0])
+        return [_row_view(self, row) for row in rows.tolist()]
+
+    def incidence(self, kind='go', propagate=False, relations=('is_a',)):
+        '''
+        The terms of kind (one of term_columns) of all the features, as a
+        sparse matrix (scipy.sparse CSR) with a row per feature and a
+        column per term, holding 1 where a feature has a term; with
+        propagate, features also have the ancestors of their terms (see
+        enrichment).  Returns the matrix, the features of its rows and the
+        terms of its columns.  For 'go-slim', the GO slims of the rows
+        without any are mapped from their GO terms first (see
+        map_go_slims).
+
+        The matrix is kept until the terms or the rows change, and shared
+        by callers, so it should not be modified.  Sums over features, such
+        as the number of up-regulated features with each term, are products
+        with the matrix: matrix.T.dot(up).
+        '''
+        if kind == 'go-slim':
+            # mined rows have no GO slims until they are mapped (which dump
+            # also does)
+            self.map_go_slims()
+        key = (kind, propagate, tuple(relations))
+        column = self.terms.get(kind)
+        # the methods that change the rows or the terms clear the cache;
+        # the terms and the ontology are also checked, as they can be
+        # replaced directly
+        built_from = (column, column.codes if column is not None else None,
+                      ontology.go_ontology if propagate else None)
+        cached = self._incidences.get(key)
+        if cached is not None and \
+                    all(a is b for a, b in zip(cached[0], built_from)):
+            return cached[1]
+        result = self._build_incidence(kind, propagate, relations)
+        self._incidences[key] = (built_from, result)
+        return result
+
+    def _build_incidence(self, kind, propagate, relations):
+        import scipy.sparse
+        if kind not in term_columns:
+            raise Exception('unknown kind of terms: %s' % kind)
+        column = self.terms[kind]
+        row_ids = column.row_ids()
+        used, columns = numpy.unique(column.codes, return_inverse=True)
+        terms = self.vocabulary.decode(used.tolist())
+        if propagate:
+            expanded, sources = _expand_terms(terms, kind, relations)
+            expanded_columns, terms = pandas.factorize(expanded)
+            terms = terms.tolist()
+            order = numpy.argsort(sources, kind='mergesort')
+            offsets = numpy.zeros(len(used) + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(sources, minlength=len(used)),
+                         out=offsets[1:])
+            positions, columns = _gather(offsets, expanded_columns[order],
+                                         columns)
+            row_ids = row_ids[positions]
+
+        width = max(len(terms), 1)
+        keys = numpy.unique(row_ids * width + columns)
+        matrix = scipy.sparse.csr_matrix(
+                    (numpy.ones(len(keys), dtype=numpy.int32),
+                     (keys // width, keys % width)),
+                    shape=(len(self), len(terms)))
+        return matrix, self.data['feature'].tolist(), terms
+
+    def enrichment(self, foldchange_labels, kind='go', threshold=1.0,
+                   direction='up', propagate=False, relations=('is_a',),
+                   min_selected=1):
+        '''
+        Tests every term of kind ('go', 'go-slim', 'ec', 'pfam' or another
+        of term_columns) for over-representation among the features whose
+        fold change (for each of foldchange_labels) is at least threshold
+        (direction 'up'), at most -threshold ('down') or either ('both'),
+        with a one-sided Fisher's exact (hypergeometric) test, adjusted for
+        multiple testing by the Benjamini-Hochberg procedure.  The features
+        tested against are those with the fold change and any term of
+        kind.  With propagate, features are also counted under the
+        ancestors of their terms (the GO terms or GO slims above their GO
+        terms, which requires the gene ontology to be loaded, or the
+        classes above their EC numbers).
+
+        All the terms and fold changes are tested at once, from a sparse
+        matrix of the terms of the features.  Returns a DataFrame with a
+        row for each fold change and term with at least min_selected
+        selected features: foldchange, term, annotated (features with the
+        term), selected (selected features with the term), universe,
+        total_selected, expected, pvalue and qvalue, ordered by fold change
+        and p-value.
+        '''
+        if isinstance(foldchange_labels, basestring):
+            foldchange_labels = [foldchange_labels]
+        for label in foldchange_labels:
+            if label not in self.foldchanges:
+                raise Exception('Fold change label %s not in table' % label)
+        if direction not in ('up', 'down', 'both'):
+            raise Exception('unknown direction: %s' % direction)
+
+        matrix, features, terms = self.incidence(kind, propagate, relations)
+        values = numpy.column_stack([self.data['foldchange:%s' % label].values
+                                     for label in foldchange_labels])
+        annotated = numpy.diff(matrix.indptr) > 0
+        measured = ~numpy.isnan(values) & annotated[:, numpy.newaxis]
+        with numpy.errstate(invalid='ignore'):
+            if direction == 'up':
+                selected = values >= threshold
+            elif direction == 'down':
+                selected = values <= -threshold
+            else:
+                selected = numpy.abs(values) >= threshold
+        selected &= measured
+
+        # terms x fold changes
+        transposed = matrix.T.tocsr()
+        term_counts = transposed.dot(measured.astype(numpy.int32))
+        selected_counts = transposed.dot(selected.astype(numpy.int32))
+        universe = measured.sum(axis=0)
+        total_selected = selected.sum(axis=0)
+
+        pvalues = hypergeometric_sf(selected_counts, term_counts,
+                                    total_selected, universe)
+        pvalues[term_counts == 0] = numpy.nan
+        qvalues = benjamini_hochberg(pvalues)
+
+        term_ids, label_ids = numpy.nonzero((term_counts > 0) &
+                                            (selected_counts >= min_selected))
+        result = pandas.DataFrame({
+                'foldchange': numpy.array(foldchange_labels,
+                                          dtype=object)[label_ids],
+                'term': numpy.array(terms, dtype=object)[term_ids],
+                'annotated': term_counts[term_ids, label_ids],
+                'selected': selected_counts[term_ids, label_ids],
+                'universe': universe[label_ids],
+                'total_selected': total_selected[label_ids],
+                'expected': term_counts[term_ids, label_ids] *
+                            total_selected[label_ids] /
+                            numpy.maximum(universe[label_ids], 1).astype(float),
+                'pvalue': pvalues[term_ids, label_ids],
+                'qvalue': qvalues[term_ids, label_ids],
+                '_order': label_ids},
+                columns=['foldchange', 'term', 'annotated', 'selected',
+                         'universe', 'total_selected', 'expected', 'pvalue',
+                         'qvalue', '_order'])
+        result = result.sort_values(['_order', 'pvalue'], kind='mergesort')
+        del result['_order']
+        return result.reset_index(drop=True)
+
+    def regulation_summary(self, foldchange_label, kind='go-slim',
+                           level=None, threshold=0.0):
+        '''
+        The number of features with each term of kind that are up-regulated
+        (fold change above threshold) and down-regulated (below
+        -threshold).  kind may be any of term_columns ('go-slim', the
+        default, first maps the GO slims of the rows without any, as
+        incidence does); with level, 'go'
+        counts the features under the GO terms at that depth (which
+        requires the gene ontology to be loaded), and 'ec' the features
+        in the EC classes at that level (1 to 4; 2 by default).
+
+        Returns a DataFrame with the term, its name (for EC classes, the
+        names of the classes down to it, joined by ' :: '), its namespace,
+        and the up and down counts, for the terms with any.  Each
+        distinct term is named once, from the loaded gene ontology or
+        ENZYME database when there is one.
+        '''
+        if foldchange_label not in self.foldchanges:
+            raise Exception('Fold change label %s not in table' %
+                            foldchange_label)
+        if kind == 'ec' and level is None:
+            level = 2
+
+        if kind == 'go' and level is not None:
+            matrix, features, terms = self.incidence('go', propagate=True)
+            ont = ontology.go_ontology
+            codes = ont.codes_of(terms)
+            depths = numpy.where(codes >= 0,
+                                 ont.closure().depths[codes], -1)
+            keep = numpy.nonzero(depths == level)[0]
+            matrix = matrix[:, keep]
+            terms = [terms[i] for i in keep.tolist()]
+        elif kind == 'ec':
+            import scipy.sparse
+            matrix, features, numbers = self.incidence('ec')
+            # numbers x classes
+            classes = [class_number(n, level) for n in numbers]
+            known = numpy.array([c is not None for c in classes], dtype=bool)
+            class_ids, terms = pandas.factorize(
+                        [c for c in classes if c is not None])
+            terms = terms.tolist()
+            mapping = scipy.sparse.csr_matrix(
+                        (numpy.ones(len(class_ids), dtype=numpy.int32),
+                         (numpy.nonzero(known)[0], class_ids)),
+                        shape=(len(numbers), len(terms)))
+            matrix = (matrix.dot(mapping) > 0).astype(numpy.int32)
+        else:
+            matrix, features, terms = self.incidence(kind)
+
+        values = self.data['foldchange:%s' % foldchange_label].values
+        with numpy.errstate(invalid='ignore'):
+            up = (values > threshold).astype(numpy.int32)
+            down = (values < -threshold).astype(numpy.int32)
+        transposed = matrix.T.tocsr()
+        up_counts = transposed.dot(up)
+        down_counts = transposed.dot(down)
+        counted = numpy.nonzero((up_counts > 0) | (down_counts > 0))[0]
+        terms = [terms[i] for i in counted.tolist()]
+
+        names, namespaces = _term_names(terms, kind)
+        return pandas.DataFrame({'term': terms, 'name': names,
+                                 'namespace': namespaces,
+                                 'up': up_counts[counted],
+                                 'down': down_counts[counted]},
+                                columns=['term', 'name', 'namespace', 'up',
+                                         'down'])
+
+    def _csv_lines(self, rows, exprs, foldchanges, annotations):
+        # the rows (all if rows is None) in the format of dump
+        data = self.data
+        if rows is None:
+            rows = numpy.arange(len(data))
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+
+        features = data['feature'].values[rows].tolist()
+        genes = data['gene'].values[rows].tolist()
+        cells = [[g if g else (f or '') for f, g in zip(features, genes)],
+                 [(f or '') if g else '' for f, g in zip(features, genes)],
+                 ['"%s"' % _text(d or '')
+                  for d in data['description'].values[rows].tolist()],
+                 [p or '' for p in data['protein_id'].values[rows].tolist()]]
+        for kind in term_columns:
+            column = self.terms[kind]
+            if len(rows) != len(column):
+                column = column.take(rows)
+            cells.append(column.joined())
+
+        def numbers(col):
+            if col not in data:
+                return [''] * len(rows)
+            return ['' if v != v else str(v)
+                    for v in data[col].values[rows].tolist()]
+        cells.extend([numbers('expr:%s' % x) for x in exprs])
+        cells.extend([numbers('foldchange:%s' % x) for x in foldchanges])
+
+        for label in annotations:
+            col = 'annotation:%s' % label
+            if col not in data:
+                cells.append([''] * len(rows))
+            else:
+                cells.append(['' if v is None else '"%s"' % _text(v)
+                              for v in data[col].values[rows].tolist()])
+
+        return [','.join(line) for line in zip(*cells)]
+
+    def dump(self, filename, format='csv'):
+        '''
+        Writes the table to a file, as CSV or in one of the binary formats
+        of tablefile.py ('npz', 'parquet' or 'hdf5').  In the binary
+        formats, the lists of terms are stored as arrays of codes into one
+        vocabulary, and columns can be read individually when the table is
+        loaded again.
+        '''
+        self.map_go_slims()
+        if format != 'csv':
+            columns = {}
+            for col in self.data.columns:
+                values = self.data[col].values
+                if values.dtype == object:
+                    values = numpy.array([None if v is None else _text(v)
+                                          for v in values], dtype=object)
+                columns[col] = values
+            terms = dict((kind, (self.terms[kind].offsets,
+                                 self.terms[kind].codes))
+                         for kind in term_columns)
+            meta = {'format_version': 1, 'rows': len(self),
+                    'expression_labels': self.expression_labels,
+                    'foldchanges': self.foldchanges,
+                    'annotation_labels': self.annotation_labels}
+            write_table(filename, format, meta, columns, terms,
+                        self.vocabulary.terms)
+            return
 
-    def dump(self, filename):
         outfile = open(filename, 'w')
-        cols = ['feature', 'locus', 'product', 'go-term', 'go-slim', 'ec',
-                'pfam', 'tigrfam', 'smart', 'interpro']
+        cols = ['feature', 'locus', 'product', 'accession', 'go-term',
+                'go-slim', 'ec', 'pfam', 'tigrfam', 'smart', 'interpro']
         cols.extend([('"expr:%s"' % x) for x in self.expression_labels])
         cols.extend([('"foldchange:%s"' % x) for x in self.foldchanges])
         cols.extend([('"annotation:%s"' % x) for x in self.annotation_labels])
 
         outfile.write('%s\n' % ','.join(cols))
 
-        for f in self.feat_rows:
-            outfile.write('%s\n' % f.csv(self.expression_labels,
-                                      self.foldchanges, self.annotation_labels))
+        for line in self._csv_lines(None, self.expression_labels,
+                                    self.foldchanges, self.annotation_labels):
+            outfile.write('%s\n' % line)
 
         outfile.close()
 
     def add_RNAseq_values(self, filename, label, locus_col, value_col):
-        if label in self.expression_labels:
-            raise Exception('Expression data label %s already in table' % label)
-        expr_data = dataset(filename, 'csv')
-        self.expression_labels.append(label)
-        for row in expr_data.rows:
-            if isinstance(row[locus_col], basestring):
-                if row[locus_col] in self.index:
-                    self.index[row[locus_col]].add_expression(label,
-                                                         row[value_col])
+        self.add_RNAseq_matrix(filename, locus_col, [value_col], [label])
 
-    def calc_foldchange(self, from_label, to_label):
+    def add_RNAseq_matrix(self, filename, locus_col, value_cols=None,
+                          labels=None, chunksize=None):
+        '''
+        Adds several columns of expression data from one CSV file, such as
+        a matrix with a column of values for each sample.
+
+        value_cols: the columns to add (by default, all but locus_col)
+        labels: the expression label of each of value_cols (by default,
+            the names of the columns)
+        chunksize: if given, the file is read this many rows at a time
+            rather than all at once, to bound the memory used by very
+            large matrices
+        '''
+        if value_cols is None:
+            header = pandas.read_csv(filename, nrows=0).columns
+            value_cols = [c for c in header if c != locus_col]
+            if not isinstance(filename, basestring):
+                filename.seek(0)
+        if labels is None:
+            labels = value_cols
+        if len(labels) != len(value_cols):
+            raise Exception('%d labels given for %d value columns' %
+                            (len(labels), len(value_cols)))
+        for label in labels:
+            if label in self.expression_labels:
+                raise Exception('Expression data label %s already in table' %
+                                label)
+
+        dtype = dict((c, numpy.float64) for c in value_cols)
+        dtype[locus_col] = object
+        reader = pandas.read_csv(filename, usecols=[locus_col] + value_cols,
+                                 dtype=dtype, chunksize=chunksize)
+        if chunksize is None:
+            reader = [reader]
+
+        # the feature or gene name of each row, and the row itself
+        names = pandas.Index(self._positions.keys())
+        rows = numpy.array(self._positions.values(), dtype=numpy.int64)
+
+        values = numpy.empty((len(self.data), len(value_cols)))
+        values[:] = numpy.nan
+        for chunk in reader:
+            found = names.get_indexer(chunk[locus_col].values)
+            matched = found >= 0
+            values[rows[found[matched]]] = chunk[value_cols].values[matched]
+
+        for j, label in enumerate(labels):
+            self.data[self._column('expr', label)] = values[:, j]
+        self._incidences = {}
+
+    def _expression(self, label):
+        col = 'expr:%s' % label
+        if col not in self.data:
+            return numpy.empty(len(self.data)) * numpy.nan
+        return self.data[col].values
+
+    def calc_foldchange(self, from_label, to_label, log2=True,
+                        round_values=0.01):
         label = '%s:%s' % (from_label, to_label)
         if label in self.foldchanges:
             raise Exception('Fold change label %s already in table' % label)
-        self.foldchanges.append(label)
-        for row in self.feat_rows:
-            row.calc_foldchange(from_label, to_label)
+        col = self._column('foldchange', label)
+        self.data[col] = fold_changes(self._expression(from_label),
+                                      self._expression(to_label),
+                                      log2, round_values)
+
+    def calc_foldchanges(self, pairs=None, labels=None, all_pairs=False,
+                         log2=True, round_values=0.01):
+        '''
+        Calculates many fold changes at once: one for each (from label, to
+        label) of pairs or, with all_pairs, from each expression label (or
+        each of labels) to every other one.  Fold changes that are already
+        in the table are skipped; returns the labels of those added.
+        '''
+        if all_pairs:
+            if labels is None:
+                labels = self.expression_labels
+            pairs = [(a, b) for a in labels for b in labels if a != b]
+        pairs = [(a, b) for i, (a, b) in enumerate(pairs)
+                 if '%s:%s' % (a, b) not in self.foldchanges and
+                    (a, b) not in pairs[:i]]
+        if len(pairs) == 0:
+            return []
+
+        if all_pairs:
+            # the logarithm of each expression column is taken only once
+            matrix = numpy.column_stack([self._expression(l) for l in labels])
+            changes = fold_changes(matrix, matrix, log2, round_values,
+                                   all_pairs=True)
+            position = dict((l, i) for i, l in enumerate(labels))
+            changes = changes[:, [position[a] for a, b in pairs],
+                              [position[b] for a, b in pairs]]
+        else:
+            frm = numpy.column_stack([self._expression(a) for a, b in pairs])
+            to = numpy.column_stack([self._expression(b) for a, b in pairs])
+            changes = fold_changes(frm, to, log2, round_values)
+
+        added = ['%s:%s' % pair for pair in pairs]
+        for i, label in enumerate(added):
+            self.data['foldchange:%s' % label] = changes[:, i]
+        self.foldchanges.extend(added)
+        return added
 
     def add_annotation(self, filename, label, value_col, locus_col=None,
-                       product_col=None):
+                       product_col=None, ignore_case=False,
+                       whole_words=False):
+        '''
+        Adds a column of annotations from a CSV file.  Each row of the file
+        annotates the feature with the locus tag or gene name in locus_col
+        or, when that is empty, every feature whose description contains
+        the product in product_col (optionally regardless of case, or only
+        as whole words).  When several rows apply to a feature, the last
+        one wins.
+        '''
         if label in self.annotation_labels:
             raise Exception('Annotation label %s already in table' % label)
-        annot_data = dataset(filename, 'csv')
-        self.annotation_labels.append(label)
-        for row in annot_data.rows:
-            if locus_col and isinstance(row[locus_col], basestring):
-                if row[locus_col] in self.index:
-                    self.index[row[locus_col]].add_annotation(label,
-                                                         row[value_col])
-            elif product_col and isinstance(row[product_col], basestring):
-                for tab_row in self.feat_rows:
-                    if tab_row.description and \
-                                row[product_col] in tab_row.description:
-                        row[product_col].add_annotation(label, row[value_col])
+        annot_data = dataset(filename, 'csv').data
+        col = self._column('annotation', label)
+        values = self.data[col].values.copy()
+        annotations = annot_data[value_col].tolist()
+        loci = annot_data[locus_col] if locus_col else [None] * len(annot_data)
+        products = annot_data[product_col] if product_col else \
+                    [None] * len(annot_data)
+
+        # (annotation row, table row) for every annotation that applies
+        applied = []
+        patterns = []
+        pattern_rows = []
+        for i, (locus, product) in enumerate(zip(loci, products)):
+            if locus_col and isinstance(locus, basestring):
+                if locus in self._positions:
+                    applied.append((i, self._positions[locus]))
+            elif product_col and isinstance(product, basestring):
+                patterns.append(product)
+                pattern_rows.append(i)
+
+        if len(patterns) > 0:
+            # all the products are searched for at once, in one pass over
+            # each description
+            matcher = pattern_matcher(patterns, ignore_case, whole_words)
+            for row, description in enumerate(self.data['description']):
+                if description:
+                    for index in matcher.find(description):
+                        applied.append((pattern_rows[index], row))
+
+        for i, row in sorted(applied):
+            values[row] = annotations[i]
+        self.data[col] = values
+        self._incidences = {}
+
+def join_tables(tables, foldchange_labels, titles=None, annotation=None,
+                clip=None, exclude_zeroes=False):
+    '''
+    Joins the fold changes of several tables by gene: returns a DataFrame
+    with a row for each gene (its name, or its locus tag if it has none)
+    in any of the tables, and a column for each table (titled as in
+    titles, or by the fold change label) holding its fold change
+    foldchange_labels[i], or NaN if it has none.
+
+    annotation: only the genes annotated with this label in any of the
+        tables are included, and an 'annotation' column holds the
+        annotation from the first table that has one (None if none does)
+    clip: fold changes are limited to -clip to clip
+    exclude_zeroes: the genes whose fold changes are all zero (or
+        missing) are left out
+    '''
+    if titles is None:
+        titles = list(foldchange_labels)
+
+    # the gene of each row of each table, and the rows to include
+    keys = []
+    included = []
+    for table in tables:
+        genes = table.data['gene'].values
+        named = numpy.array([bool(g) for g in genes], dtype=bool)
+        table_keys = numpy.where(named, genes, table.data['feature'].values)
+        include = numpy.array([k is not None for k in table_keys], dtype=bool)
+        if annotation is not None:
+            include &= pandas.notnull(_annotations(table, annotation))
+        keys.append(table_keys)
+        included.append(include)
+    genes = pandas.unique(numpy.concatenate(
+                [k[i] for k, i in zip(keys, included)]))
+
+    values = numpy.empty((len(genes), len(tables)))
+    values[:] = numpy.nan
+    annotations = numpy.array([None] * len(genes), dtype=object)
+    for i, (table, table_keys) in enumerate(zip(tables, keys)):
+        # as with the index of a table, the last row of a gene is used
+        index = pandas.Index(table_keys)
+        last = ~index.duplicated(keep='last')
+        positions = index[last].get_indexer(genes)
+        found = positions >= 0
+        rows = numpy.nonzero(last)[0][positions]
+        column = table.data['foldchange:%s' % foldchange_labels[i]].values
+        values[found, i] = column[rows[found]]
+        if annotation is not None:
+            table_annotations = _annotations(table, annotation)
+            fill = found & pandas.isnull(annotations)
+            annotations[fill] = table_annotations[rows[fill]]
+
+    if clip is not None:
+        values = numpy.clip(values, -clip, clip)
+    frame = pandas.DataFrame(values, index=pandas.Index(genes, name='gene'),
+                             columns=titles)
+    if annotation is not None:
+        frame['annotation'] = annotations
+    if exclude_zeroes:
+        with numpy.errstate(invalid='ignore'):
+            frame = frame[(numpy.nan_to_num(values) != 0).any(axis=1)]
+    return frame
 
+def _annotations(table, label):
+    # the annotations of every row of a table, with None where missing
+    col = 'annotation:%s' % label
+    if col not in table.data:
+        return numpy.array([None] * len(table.data), dtype=object)
+    return _strings(table.data[col].values)
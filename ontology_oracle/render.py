@@ -0,0 +1,171 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import os, subprocess
+
+# where the R scripts of the plotting tools are installed
+helpers = '/opt/ontology_oracle/plotting/helpers'
+
+class render_server:
+    '''
+    An R process (helpers/render_server) that renders any number of plots,
+    so that R and its plotting libraries are loaded once rather than for
+    every plot.  The data of each plot is written to it over a pipe.
+    '''
+    marker = 'render_server: '
+
+    def __init__(self, script=None):
+        if script is None:
+            script = os.path.join(helpers, 'render_server')
+        self.proc = subprocess.Popen([script], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+
+    def render(self, plot, header, rows, args):
+        '''
+        Renders a plot ('tornado' or 'heatmap') of the rows (lists of the
+        strings of each field, as read by R's read.table) under the column
+        names in header; args are the arguments of gen_tornado or
+        gen_heatmap after the input file.  Raises an Exception if the plot
+        could not be rendered.
+        '''
+        write = self.proc.stdin.write
+        write('%s\t%d\t%s\n' % (plot, len(rows), '\t'.join(args)))
+        write('%s\n' % '\t'.join(header))
+        for row in rows:
+            write('%s\n' % '\t'.join(row))
+        self.proc.stdin.flush()
+
+        # anything else that R writes to its output is passed on
+        while True:
+            line = self.proc.stdout.readline()
+            if line == '':
+                raise Exception('the R render server exited')
+            if line.startswith(self.marker):
+                break
+            print line.rstrip('\n')
+        result = line[len(self.marker):].strip()
+        if result != 'ok':
+            raise Exception('R could not render %s: %s' %
+                            (args[1], result[len('error '):]))
+
+    def close(self):
+        self.proc.stdin.close()
+        return self.proc.wait()
+
+root_namespaces = ('molecular_function', 'biological_process',
+                   'cellular_component')
+
+def tornado_plots(table, foldchange_label, type='go-slim'):
+    '''
+    The tornado plots of the regulation of the terms of a table for a
+    fold change: a list of (filename suffix, entries, facet), where each
+    entry is a (name, upregulated, downregulated, namespace) tuple.  type
+    is 'go-slim', 'go-slim-groups' (a plot for each GO namespace) or 'ec'.
+    '''
+    if type in ('go-slim', 'go-slim-groups'):
+        summary = table.regulation_summary(foldchange_label, 'go-slim')
+        entries = [(e.name, e.up, e.down, e.namespace)
+                   for e in summary.itertuples()
+                   if e.name not in root_namespaces]
+        if type == 'go-slim':
+            return [('', entries, True)]
+        plots = []
+        for category in root_namespaces:
+            cat_list = [x for x in entries if x[3] == category]
+            if len(cat_list) > 0:
+                plots.append(('_%s' % category, cat_list, False))
+        return plots
+    elif type == 'ec':
+        summary = table.regulation_summary(foldchange_label, 'ec', level=2)
+        return [('', [(e.name, e.up, e.down, 'NA')
+                      for e in summary.itertuples()], False)]
+    raise Exception('unknown type of tornado plot: %s' % type)
+
+def render_tornado(server, entries, filebase, format='png', sort='quantity',
+                   facet=False):
+    '''
+    Renders a tornado plot of entries (see tornado_plots) into
+    filebase.format; returns the filename.
+    '''
+    # sort by upregulation
+    entries = sorted(entries, reverse=True, key=lambda x: x[1] + x[2])
+    rows = []
+    for entry in entries:
+        rows.append(['"%s"' % entry[0], 'upregulated', '%d' % entry[1],
+                     str(entry[3])])
+        rows.append(['"%s"' % entry[0], 'downregulated', '%d' % -entry[2],
+                     str(entry[3])])
+
+    width = int(400 + (len(entries) * 15))
+    height = 720
+    if format == 'svg':
+        width /= 100.0
+        height = 7
+
+    filename = '%s.%s' % (filebase, format)
+    args = [format, filename, sort, str(width), str(height)]
+    if facet:
+        args.append('facet')
+    server.render('tornado', ['term', 'regulation', 'value', 'namespace'],
+                  rows, args)
+    return filename
+
+# heatmaps of more genes than this are drawn as a single raster layer,
+# one pixel (rather than a labelled tile) per gene, so that the time to
+# render them and the size of the file stay bounded
+raster_features = 300
+max_raster_pixels = 1200
+
+def render_heatmap(server, data, filebase, format='png',
+                   orientation='vertical', ordered=False, raster=None):
+    '''
+    Renders a heatmap of the fold changes in data (as returned by
+    ontology_table.join_tables), faceted by its annotation column if it
+    has one, into filebase.format; returns the filename.
+
+    ordered: keep the genes in the order of data (e.g. as clustered by
+        clustering.cluster_rows), rather than sorted by name
+    raster: draw the heatmap as a raster without gene labels; by default,
+        when there are more than raster_features genes
+    '''
+    annotated = 'annotation' in data.columns
+    samples = len(data.columns) - (1 if annotated else 0)
+    features = len(data)
+    if raster is None:
+        raster = features > raster_features
+
+    if raster:
+        extent = min(features, max_raster_pixels)
+    if orientation == 'vertical':
+        width = 360 + samples * 22
+        height = 240 + (extent if raster else features * 18)
+    elif orientation == 'horizontal':
+        width = 300 + (extent if raster else features * 22)
+        height = 120 + samples * 30
+    else:
+        raise Exception('unknown orientation: %s' % orientation)
+    if format == 'svg':
+        width /= 100.0
+        height /= 100.0
+
+    header = ['gene'] + [str(c) for c in data.columns[:samples]]
+    columns = [['"%s"' % gene for gene in data.index.tolist()]]
+    for i in range(samples):
+        columns.append(['NA' if value != value else repr(value)
+                        for value in data.iloc[:, i].tolist()])
+    if annotated:
+        header.append('annotation')
+        columns.append(['"%s"' % value if value is not None else 'NA'
+                        for value in data['annotation'].tolist()])
+
+    filename = '%s.%s' % (filebase, format)
+    args = [format, filename, str(width), str(height), orientation]
+    if annotated:
+        args.append('facet')
+    if ordered:
+        args.append('ordered')
+    if raster:
+        args.append('raster')
+    server.render('heatmap', header, zip(*columns), args)
+    return filename
@@ -2,9 +2,49 @@
 # MIT License
 # http://opensource.org/licenses/MIT
 
-import json
+import json, copy
 from urllib2 import quote
 import utils, accession
+from flatfile import flatfile_index
+
+url_uniprot_batch = 'http://www.uniprot.org/uniprot/?query=%s&format=txt'
+
+def _match_records(ids, records, in_order=False):
+    '''
+    Associates the accessions parsed from a batch of records with the IDs
+    that were requested; returns a dictionary of ID -> accession.  IDs
+    that are not among the identifiers of any record are left out.
+
+    in_order: the records are returned in the order of the IDs; if none
+        of the identifiers are recognized (for example, if the records
+        omit the GI numbers) but there is a record for every ID, they are
+        associated by position
+    '''
+    found = {}
+    for acc in records:
+        for identifier in acc.identifiers:
+            found[identifier] = acc
+
+    matched = {}
+    for requested in ids:
+        if requested in found:
+            matched[requested] = found[requested]
+    if in_order and len(matched) == 0 and len(records) == len(ids) and \
+                len(set(id(acc) for acc in records)) == len(records):
+        matched = dict(zip(ids, records))
+
+    # a record requested under several IDs is copied for each of them
+    assigned = set()
+    for requested in ids:
+        acc = matched.get(requested)
+        if acc is None:
+            continue
+        if id(acc) in assigned:
+            acc = copy.copy(acc)
+            matched[requested] = acc
+        assigned.add(id(acc))
+        acc.id = requested
+    return matched
 
 class uniprot:
     @classmethod
@@ -19,11 +59,47 @@ class uniprot:
     def accession(self, id):
         return accession.accession('uniprot', id)
 
+    @classmethod
+    def accessions(self, ids, batch_size=100):
+        '''
+        Retrieves many UniProt entries, with a single query per batch of
+        accession numbers.  Returns a list of accessions in the same order
+        as ids; None indicates an ID for which no entry was returned.
+        '''
+        ids = list(ids)
+        matched = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            query = ' OR '.join(['accession:%s' % x for x in batch])
+            url = url_uniprot_batch % quote(query)
+            # the entries are returned in the order of the search engine,
+            # so they are only matched by (primary or secondary) accession
+            records = list(accession.iter_uniprot(utils.download(url)))
+            matched.update(_match_records(batch, records))
+        return [matched.get(id) for id in ids]
+
 class ncbi:
     @classmethod
     def protein_accession(self, id):
         return accession.accession('ncbi:protein', id)
 
+    @classmethod
+    def protein_accessions(self, ids, batch_size=200):
+        '''
+        Retrieves many protein records, with a single efetch request per
+        batch of IDs.  Returns a list of accessions in the same order as
+        ids; None indicates an ID for which no record was returned.
+        '''
+        ids = list(ids)
+        matched = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            url = accession.url_efetch % ('protein',
+                        ','.join([quote(x) for x in batch]))
+            records = list(accession.iter_genbank(utils.download(url)))
+            matched.update(_match_records(batch, records, in_order=True))
+        return [matched.get(id) for id in ids]
+
     @classmethod
     def protein_search(self, term):
         # this returns GI numbers rather than accessions
@@ -38,16 +114,84 @@ class ncbi:
         return None
 
 
-def mine_protein(accession, database, gene_name=None, organism=None):
-    acc = None
+def use_local_database(filename, database, index_filename=None):
+    '''
+    Reads the records of a database from a local flat file (such as
+    uniprot_sprot.dat for 'uniprot' or a RefSeq .gpff for 'ncbi'; plain,
+    gzipped or bgzipped) before resorting to downloading them.  The file
+    is indexed the first time it is used; the index is kept alongside it
+    (or in index_filename).  Combined with utils.set_offline(), whole
+    tables can be built without network access.
+    '''
     if database == 'ncbi':
-        acc = ncbi.protein_accession(accession)
+        index = flatfile_index(filename, 'genbank', index_filename)
+        accession.local_sources['ncbi:protein'].append(index)
     elif database == 'uniprot':
-        acc = uniprot.accession(accession)
+        index = flatfile_index(filename, 'uniprot', index_filename)
+        accession.local_sources['uniprot'].append(index)
+    else:
+        raise Exception('unknown database: %s' % database)
+    return index
+
+def prefetch_proteins(ids, database, batch_size=None):
+    '''
+    Retrieves the records for many accessions in batches, in preparation
+    for mine_protein; returns a dictionary of ID -> accession.  Records
+    available from local flat files are read from there.  batch_size
+    defaults to that of ncbi.protein_accessions or uniprot.accessions.
+    '''
+    db = {'ncbi': 'ncbi:protein', 'uniprot': 'uniprot'}.get(database)
+    found = {}
+    remaining = []
+    for id in set([id for id in ids if id]):
+        record = accession.local_record(db, id)
+        if record is not None:
+            found[id] = accession.accession(db, id, record)
+        else:
+            remaining.append(id)
+
+    if utils.offline:
+        return found
+
+    batch = {} if batch_size is None else {'batch_size': batch_size}
+    accs = []
+    if database == 'ncbi':
+        accs = ncbi.protein_accessions(remaining, **batch)
+    elif database == 'uniprot':
+        accs = uniprot.accessions(remaining, **batch)
+    for id, acc in zip(remaining, accs):
+        if acc is not None:
+            found[id] = acc
+
+    return found
+
+def mine_protein(accession, database, gene_name=None, organism=None,
+                 acc=None):
+    '''
+    Retrieves the accession from the database ('ncbi' or 'uniprot') and
+    supplements its ontology data with that from the other database.  If
+    the accession has already been retrieved (see prefetch_proteins), it
+    can be passed as acc.
+    '''
+    if acc is None:
+        try:
+            if database == 'ncbi':
+                acc = ncbi.protein_accession(accession)
+            elif database == 'uniprot':
+                acc = uniprot.accession(accession)
+        except utils.DownloadError:
+            if not utils.offline:
+                raise
+            # not in the local databases
+            acc = None
 
     if acc is None:
         return None
 
+    if utils.offline:
+        # the other database can only be searched online
+        return acc
+
     if gene_name is None:
         # see if the gene name is in the accession
         if len(acc.gene) > 0:
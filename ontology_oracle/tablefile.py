@@ -0,0 +1,244 @@
+# Copyright (c) 2015 Michael Strosaker
+# MIT License
+# http://opensource.org/licenses/MIT
+
+import json, struct, zipfile
+import numpy
+
+# binary formats in which tables can be stored, and the first bytes of
+# their files
+formats = ['npz', 'parquet', 'hdf5']
+_magic = {
+    'npz':      'PK\x03\x04',
+    'parquet':  'PAR1',
+    'hdf5':     '\x89HDF\r\n\x1a\n',
+}
+
+def file_format(filename):
+    '''
+    The binary format in which a table is stored (see formats), or None
+    for other files (such as CSV).  File objects are not recognized.
+    '''
+    if not isinstance(filename, basestring):
+        return None
+    with open(filename, 'rb') as f:
+        start = f.read(8)
+    for format, magic in _magic.iteritems():
+        if start.startswith(magic):
+            return format
+    return None
+
+def _load_meta(text):
+    # JSON strings are unicode; the rest of the tables are byte strings
+    def encode(value):
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        elif isinstance(value, list):
+            return [encode(v) for v in value]
+        elif isinstance(value, dict):
+            return dict((encode(k), encode(v)) for k, v in value.iteritems())
+        return value
+    return encode(json.loads(text))
+
+def _string_array(values):
+    # None is stored as an empty string
+    return numpy.array([v if v is not None else '' for v in values],
+                       dtype=str)
+
+def write_table(filename, format, meta, columns, terms, vocabulary):
+    '''
+    Stores a table in one of the binary formats.
+
+    meta: dictionary (JSON-serializable) describing the table
+    columns: dictionary of name -> array of numbers or strings (None for
+        missing strings), all of the same length
+    terms: dictionary of name -> (offsets, codes) of the ragged columns
+        of terms (see columns.term_column)
+    vocabulary: the strings that the codes of the terms refer to
+    '''
+    if format not in formats:
+        raise Exception('unknown table format: %s' % format)
+    meta = dict(meta)
+    meta['columns'] = sorted(columns.keys())
+    meta['terms'] = sorted(terms.keys())
+    if format == 'npz':
+        _write_npz(filename, meta, columns, terms, vocabulary)
+    elif format == 'parquet':
+        _write_parquet(filename, meta, columns, terms, vocabulary)
+    elif format == 'hdf5':
+        _write_hdf5(filename, meta, columns, terms, vocabulary)
+
+def open_table(filename):
+    '''
+    Opens a table stored in one of the binary formats; the returned reader
+    reads each column only when asked for it (with npz files, numeric
+    columns are memory-mapped rather than read).
+    '''
+    format = file_format(filename)
+    if format == 'npz':
+        return _npz_reader(filename)
+    elif format == 'parquet':
+        return _parquet_reader(filename)
+    elif format == 'hdf5':
+        return _hdf5_reader(filename)
+    raise Exception('%s is not a table in a binary format' % filename)
+
+def _write_npz(filename, meta, columns, terms, vocabulary):
+    arrays = {'meta': numpy.array(json.dumps(meta)),
+              'vocabulary': _string_array(vocabulary)}
+    for name, values in columns.iteritems():
+        values = numpy.asarray(values)
+        if values.dtype == object:
+            values = _string_array(values)
+        arrays['column:%s' % name] = values
+    for name, (offsets, codes) in terms.iteritems():
+        arrays['terms:%s:offsets' % name] = offsets
+        arrays['terms:%s:codes' % name] = codes
+    # uncompressed, so that the arrays can be memory-mapped
+    with open(filename, 'wb') as f:
+        numpy.savez(f, **arrays)
+
+class _npz_reader:
+    def __init__(self, filename):
+        self.filename = filename
+        # the data offset, dtype and shape of each (uncompressed) array
+        self.arrays = {}
+        with zipfile.ZipFile(filename) as z:
+            infos = z.infolist()
+        with open(filename, 'rb') as f:
+            for info in infos:
+                if info.compress_type != zipfile.ZIP_STORED or \
+                            not info.filename.endswith('.npy'):
+                    continue
+                f.seek(info.header_offset)
+                header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH',
+                                                          header[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = numpy.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran, dtype = \
+                                numpy.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran, dtype = \
+                                numpy.lib.format.read_array_header_2_0(f)
+                self.arrays[info.filename[:-4]] = (f.tell(), dtype, shape)
+        self.meta = _load_meta(str(self._array('meta')))
+
+    def _array(self, name):
+        offset, dtype, shape = self.arrays[name]
+        if dtype.hasobject or len(shape) == 0 or shape[0] == 0:
+            with open(self.filename, 'rb') as f:
+                f.seek(offset)
+                count = int(numpy.prod(shape))
+                data = f.read(count * dtype.itemsize)
+            return numpy.frombuffer(data, dtype=dtype).reshape(shape)
+        return numpy.memmap(self.filename, dtype=dtype, mode='r',
+                            offset=offset, shape=shape)
+
+    def column(self, name):
+        return self._array('column:%s' % name)
+
+    def terms(self, name):
+        return (self._array('terms:%s:offsets' % name),
+                self._array('terms:%s:codes' % name))
+
+    def vocabulary(self):
+        return self._array('vocabulary').tolist()
+
+def _write_hdf5(filename, meta, columns, terms, vocabulary):
+    import h5py
+    with h5py.File(filename, 'w') as f:
+        f.attrs['meta'] = json.dumps(meta)
+        f.create_dataset('vocabulary', data=_string_array(vocabulary))
+        for name, values in columns.iteritems():
+            values = numpy.asarray(values)
+            if values.dtype == object:
+                values = _string_array(values)
+            f.create_dataset('column:%s' % name, data=values)
+        for name, (offsets, codes) in terms.iteritems():
+            f.create_dataset('terms:%s:offsets' % name, data=offsets)
+            f.create_dataset('terms:%s:codes' % name, data=codes)
+
+class _hdf5_reader:
+    def __init__(self, filename):
+        import h5py
+        self.file = h5py.File(filename, 'r')
+        self.meta = _load_meta(self.file.attrs['meta'])
+
+    def _array(self, name):
+        dataset = self.file[name]
+        if dataset.shape[0] == 0:
+            return numpy.zeros(0, dtype=dataset.dtype)
+        return dataset[...]
+
+    def column(self, name):
+        return self._array('column:%s' % name)
+
+    def terms(self, name):
+        return (self._array('terms:%s:offsets' % name),
+                self._array('terms:%s:codes' % name))
+
+    def vocabulary(self):
+        return self._array('vocabulary').tolist()
+
+def _write_parquet(filename, meta, columns, terms, vocabulary):
+    import pyarrow, pyarrow.parquet
+    names = []
+    arrays = []
+    for name in sorted(columns.keys()):
+        values = numpy.asarray(columns[name])
+        if values.dtype == object:
+            arrays.append(pyarrow.array(values.tolist(),
+                                        type=pyarrow.string()))
+        else:
+            arrays.append(pyarrow.array(values))
+        names.append('column:%s' % name)
+    for name in sorted(terms.keys()):
+        offsets, codes = terms[name]
+        arrays.append(pyarrow.ListArray.from_arrays(
+                    pyarrow.array(offsets.astype(numpy.int32)),
+                    pyarrow.array(codes.astype(numpy.int32))))
+        names.append('terms:%s' % name)
+    meta = dict(meta)
+    meta['vocabulary'] = list(vocabulary)
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    table = table.replace_schema_metadata({'ontology_oracle':
+                                           json.dumps(meta)})
+    pyarrow.parquet.write_table(table, filename)
+
+class _parquet_reader:
+    def __init__(self, filename):
+        import pyarrow.parquet
+        self.file = pyarrow.parquet.ParquetFile(filename)
+        self.meta = _load_meta(
+                    self.file.metadata.metadata['ontology_oracle'])
+
+    def _read(self, name):
+        return self.file.read(columns=[name]).column(0)
+
+    def column(self, name):
+        values = self._read('column:%s' % name).to_pandas().values
+        if values.dtype == object:
+            values = numpy.array([str(v) if v is not None else None
+                                  for v in values], dtype=object)
+        return values
+
+    def terms(self, name):
+        offsets = [numpy.zeros(1, dtype=numpy.int64)]
+        codes = []
+        for chunk in self._read('terms:%s' % name).chunks:
+            chunk_offsets = numpy.asarray(chunk.offsets.to_pandas(),
+                                          dtype=numpy.int64)
+            chunk_codes = numpy.asarray(chunk.values.to_pandas(),
+                                        dtype=numpy.int32)
+            start = chunk_offsets[0]
+            offsets.append(chunk_offsets[1:] - start +
+                           sum(len(c) for c in codes))
+            codes.append(chunk_codes[start:chunk_offsets[-1]])
+        return (numpy.concatenate(offsets),
+                numpy.concatenate(codes) if len(codes) > 0 else
+                            numpy.zeros(0, dtype=numpy.int32))
+
+    def vocabulary(self):
+        return self.meta['vocabulary']
@@ -2,7 +2,97 @@
 # MIT License
 # http://opensource.org/licenses/MIT
 
-import sys, time, urllib2, pandas, math
+import os, io, sys, time, gzip, threading, urlparse, urllib2, pandas, math
+import numpy
+from cache import open_cache
+
+# persistent cache of downloaded documents (see cache.py); set with
+# set_cache(), or by pointing the ONTOLOGY_ORACLE_CACHE environment variable
+# at a cache directory or SQLite file
+cache = None
+
+def set_cache(location=None, **kwargs):
+    '''
+    Enables the persistent download cache.  location may be the path of a
+    cache directory or SQLite file, or an already constructed cache object;
+    None disables caching.  Keyword arguments (default_ttl, ttls, max_size,
+    compression) are passed to the cache constructor.
+    '''
+    global cache
+    if location is None or not isinstance(location, basestring):
+        cache = location
+    else:
+        cache = open_cache(location, **kwargs)
+    return cache
+
+if os.environ.get('ONTOLOGY_ORACLE_CACHE'):
+    set_cache(os.environ['ONTOLOGY_ORACLE_CACHE'])
+
+class _token_bucket:
+    '''
+    Limits the rate of requests to a host; shared among all threads.
+    '''
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # reserve a token, even if it will only be available later
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+# maximum requests per second to each host; NCBI allows 3 per second
+# without an API key and 10 with one
+ncbi_host = 'eutils.ncbi.nlm.nih.gov'
+ncbi_api_key = None
+rate_limits = {
+    ncbi_host:              3,
+    'www.uniprot.org':      10,
+    'www.ebi.ac.uk':        10,
+    'enzyme.expasy.org':    10,
+}
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def set_rate_limit(host, rate):
+    with _buckets_lock:
+        rate_limits[host] = rate
+        if host in _buckets:
+            del _buckets[host]
+
+def set_ncbi_api_key(key):
+    '''
+    Sets the API key included in requests to the NCBI E-utilities, which
+    raises the allowed request rate.
+    '''
+    global ncbi_api_key
+    ncbi_api_key = key
+    if key:
+        set_rate_limit(ncbi_host, 10)
+    else:
+        set_rate_limit(ncbi_host, 3)
+
+if os.environ.get('NCBI_API_KEY'):
+    set_ncbi_api_key(os.environ['NCBI_API_KEY'])
+
+def _throttle(host):
+    with _buckets_lock:
+        if host not in _buckets:
+            if host not in rate_limits:
+                return
+            _buckets[host] = _token_bucket(rate_limits[host])
+        bucket = _buckets[host]
+    bucket.acquire()
 
 class DownloadError(Exception):
     def __init__(self, value, tries):
@@ -14,14 +104,36 @@ class DownloadError(Exception):
             s.append('(%s tries)' % self.tries)
         return ' '.join(s)
 
-def download(url, tries=2):
+# when set, nothing is downloaded: download() only serves documents from
+# the cache, and raises DownloadError for anything else
+offline = False
+
+def set_offline(value=True):
+    global offline
+    offline = value
+
+def download(url, tries=2, use_cache=True):
+    if use_cache and cache is not None:
+        f = cache.get(url)
+        if f is not None:
+            return f
+
+    if offline:
+        raise DownloadError('Offline: %s is not available locally' % url, 1)
+
+    host = urlparse.urlparse(url).netloc.lower()
+    request_url = url
+    if host == ncbi_host and ncbi_api_key:
+        request_url = '%s&api_key=%s' % (url, ncbi_api_key)
+
     n_tries = 0
     #print url
 
     while True:
         n_tries += 1
+        _throttle(host)
         try:
-            response = urllib2.urlopen(url)
+            response = urllib2.urlopen(request_url)
             break
         except urllib2.HTTPError as e:
             if n_tries >= tries:
@@ -43,8 +155,23 @@ def download(url, tries=2):
                 time.sleep(3)
 
     f = response.read()
+    if use_cache and cache is not None:
+        cache.put(url, f)
     return f
 
+def open_file(filename):
+    '''
+    Opens a file for reading, transparently decompressing gzip (and bgzip)
+    files.
+    '''
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+    if magic == '\x1f\x8b':
+        # GzipFile.readline is slow; buffering it speeds up iterating
+        # over the lines several times
+        return io.BufferedReader(gzip.open(filename, 'rb'))
+    return open(filename, 'r')
+
 def fold_change(frm, to, log2=True, round_values=0.01):
     """
     Calculates the fold change of "to" as compared to "frm" (from).
@@ -53,6 +180,10 @@ def fold_change(frm, to, log2=True, round_values=0.01):
     round_values: specifies what value should be added to "fr" and "to" prior
         to calculating the fold change to account for biases
         (see: http://bioinfo.aizeonpublishers.net/content/2013/6/285-292.html)
+
+    If both values are 0 (after adding round_values), there is no change (0
+    with log2, 1 otherwise); if only "frm" is 0, the fold change is Inf; if
+    only "to" is 0, it is -Inf with log2 and 0 otherwise.
     """
     frm = frm + round_values
     to = to + round_values
@@ -64,20 +195,58 @@ def fold_change(frm, to, log2=True, round_values=0.01):
     elif frm == 0:
         return float('Inf')
     elif to == 0:
-        return -float('Inf')
+        if log2:
+            return -float('Inf')
+        return 0.0
 
     if log2:
         return math.log(to, 2) - math.log(frm, 2)
-    return to / fr
+    return float(to) / frm
+
+def fold_changes(frm, to, log2=True, round_values=0.01, all_pairs=False):
+    """
+    Calculates fold changes as fold_change does, for whole arrays (or table
+    columns) of expression values at once; returns an array.  Missing
+    values (NaN) give NaN.
+
+    all_pairs: frm and to are matrices with one column per condition; the
+        fold changes from every condition of frm to every condition of to
+        are calculated, and returned indexed [row, frm column, to column].
+        With the same matrix as frm and to, this gives every pairwise
+        contrast of the conditions in one call.
+    """
+    frm = numpy.asarray(frm, dtype=numpy.float64) + round_values
+    to = numpy.asarray(to, dtype=numpy.float64) + round_values
+    if all_pairs:
+        if frm.ndim == 1:
+            frm = frm[:, numpy.newaxis]
+        if to.ndim == 1:
+            to = to[:, numpy.newaxis]
+        frm = frm[:, :, numpy.newaxis]
+        to = to[:, numpy.newaxis, :]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if log2:
+            # log2(0) is -Inf, so a 0 in to gives -Inf and a 0 in frm Inf
+            changes = numpy.log2(to) - numpy.log2(frm)
+        else:
+            changes = to / frm
+    unchanged = (frm == 0) & (to == 0)
+    if unchanged.any():
+        changes = numpy.where(unchanged, 0.0 if log2 else 1.0, changes)
+    return changes
 
 class dataset:
-    def __init__(self, location, format='csv'):
+    def __init__(self, location, format='csv', **kwargs):
+        # any additional arguments (such as usecols) are passed to pandas
         self.location = location
         self.format = format
-        if format == 'csv':
-            self.data = pandas.read_csv(location, sep=',')
+        if isinstance(location, pandas.DataFrame):
+            self.data = location
+        elif format == 'csv':
+            self.data = pandas.read_csv(location, sep=',', **kwargs)
         elif format.startswith('tab'):
-            self.data = pandas.read_table(location)
+            self.data = pandas.read_table(location, **kwargs)
         self.colnames = self.data.columns.values
 
     @property
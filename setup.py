@@ -38,10 +38,14 @@ setup(
                   ('/opt/ontology_oracle/plotting', [
                       'plotting/ontology_tornado',
                       'plotting/heatmap',
+                      'plotting/render_batch',
                   ]),
                   ('/opt/ontology_oracle/plotting/helpers', [
                       'plotting/helpers/gen_tornado',
                       'plotting/helpers/gen_heatmap',
+                      'plotting/helpers/render_server',
+                      'plotting/helpers/tornado.R',
+                      'plotting/helpers/heatmap.R',
                   ]),
                  ],
 )
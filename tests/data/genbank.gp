@@ -0,0 +1,37 @@
+LOCUS       WP_003240137             380 aa            linear   BCT 18-MAY-2023
+DEFINITION  DNA polymerase III subunit beta [Bacillus subtilis].
+ACCESSION   WP_003240137
+VERSION     WP_003240137.1  GI:489341256
+KEYWORDS    RefSeq.
+SOURCE      Bacillus subtilis
+  ORGANISM  Bacillus subtilis
+            Bacteria; Bacillati; Bacillota; Bacilli; Bacillales; Bacillaceae;
+            Bacillus.
+COMMENT     REFSEQ: This record represents a single, non-redundant, protein
+            sequence which may be annotated on many different RefSeq
+            genomes from the same, or different, species.
+FEATURES             Location/Qualifiers
+     source          1..380
+                     /organism="Bacillus subtilis"
+                     /db_xref="taxon:1423"
+     Protein         1..380
+                     /product="DNA polymerase III subunit beta"
+                     /EC_number="2.7.7.7"
+                     /calculated_mol_wt=41933
+     Region          1..121
+                     /region_name="PolIIIb_N"
+                     /note="DNA polymerase III beta subunit, N-terminal
+                     domain; pfam00712"
+                     /db_xref="CDD:459912"
+     Region          2..378
+                     /region_name="dnan"
+                     /note="DNA polymerase III, beta subunit; TIGR00663"
+                     /db_xref="CDD:273205"
+     CDS             1..380
+                     /gene="dnaN"
+                     /coded_by="NZ_CP053102.1:1939..3081"
+                     /transl_table=11
+ORIGIN      
+        1 mkfviergvl lsaldklnsv aeegiiehgd pfkldlkgak vevstqtlqn
+       51 ggarvsrdfq sgrtvl
+//
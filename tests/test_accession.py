@@ -0,0 +1,116 @@
+import unittest, os
+from ontology_oracle import accession, ontology, external2go
+
+data = os.path.join(os.path.dirname(__file__), 'data')
+
+class fixed_source(external2go.mapping_source):
+    # a mapping given as text, rather than downloaded
+    def __init__(self, kind, text):
+        external2go.mapping_source.__init__(self, kind, None, None,
+                external2go.sources[kind].normalize)
+        self.text = text
+
+    def read(self):
+        return self.text
+
+mappings = {
+    'ec': 'EC:1.1.1.1 > GO:alcohol dehydrogenase (NAD+) activity ; '
+          'GO:0004022\n'
+          'EC:2.7.7.7 > GO:DNA-directed DNA polymerase activity ; '
+          'GO:0003887\n',
+    'pfam': 'Pfam:PF00107 ADH_zinc_N > GO:oxidoreductase activity ; '
+            'GO:0016491\n'
+            'Pfam:PF00712 DNA_pol3_beta > GO:DNA polymerase III complex ; '
+            'GO:0009360\n',
+    'tigrfam': 'JCVI_TIGRFAMS:TIGR00663 dnan > GO:DNA replication ; '
+               'GO:0006260\n',
+    'smart': '',
+    'interpro': 'InterPro:IPR013149 ADH-like_C > GO:oxidoreductase '
+                'activity ; GO:0016491\n',
+}
+
+class parser_test(unittest.TestCase):
+    def setUp(self):
+        # the GO terms of the cross-references come from small mappings
+        self.store = ontology.xref2go_store
+        ontology.xref2go_store = external2go.xref_store.build(
+                    [fixed_source(kind, text)
+                     for kind, text in mappings.iteritems()])
+
+    def tearDown(self):
+        ontology.xref2go_store = self.store
+
+class test_uniprot(parser_test):
+    def test_entry(self):
+        with open(os.path.join(data, 'uniprot.txt')) as f:
+            entries = list(accession.iter_uniprot(f))
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry.id, 'P00330')
+        self.assertEqual(entry.identifiers,
+                         set(['P00330', 'D6VZT4', 'Q03503', 'ADH1_YEAST']))
+        self.assertEqual(entry.gene, 'ADH1')
+        self.assertEqual(entry.sequence, 'MSIPETQKGVIFYESHGKLEYKDIPVPKPK'
+                                         'ANELLINVKYSGVCHTDLHAWHGDWPLPVK')
+        self.assertTrue(entry.description.startswith(
+                        'RecName: Full=Alcohol dehydrogenase 1'))
+        self.assertEqual(entry.organism_species, 'Saccharomyces cerevisiae '
+                         '(strain ATCC 204508 / S288c) (Baker\'s yeast).')
+        self.assertEqual(sorted(entry.pfam), ['pfam00107', 'pfam08240'])
+        self.assertEqual(sorted(entry.interpro), ['IPR013149', 'IPR013154'])
+        # the GO cross-references, and those mapped from Pfam and InterPro
+        self.assertEqual(sorted(entry.go), ['GO:0004022', 'GO:0008270',
+                                            'GO:0016491'])
+        self.assertEqual(len(entry.references), 2)
+        first, second = entry.references
+        self.assertEqual(first.number, '[1]')
+        self.assertEqual(first.authors, 'Bennetzen J.L., Hall B.D.')
+        self.assertEqual(first.title, '"The primary structure of the '
+                         'Saccharomyces cerevisiae gene for alcohol '
+                         'dehydrogenase."')
+        self.assertEqual(second.location,
+                         'Eur. J. Biochem. 72:425-442(1977).')
+
+    def test_several_entries(self):
+        with open(os.path.join(data, 'uniprot.txt')) as f:
+            text = f.read()
+        entries = list(accession.iter_uniprot(text + text))
+        self.assertEqual([e.id for e in entries], ['P00330', 'P00330'])
+        record = accession.accession('uniprot', 'P00330', text)
+        self.assertEqual(record.go, entries[1].go)
+
+class test_genbank(parser_test):
+    def test_record(self):
+        with open(os.path.join(data, 'genbank.gp')) as f:
+            records = list(accession.iter_genbank(f))
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record.id, 'WP_003240137.1')
+        self.assertEqual(record.identifiers,
+                         set(['WP_003240137', 'WP_003240137.1', '489341256']))
+        self.assertEqual(record.definition,
+                         'DNA polymerase III subunit beta [Bacillus subtilis].')
+        self.assertEqual(record.gene, 'dnaN')
+        self.assertEqual(record.sequence, 'mkfviergvllsaldklnsvaeegiiehgd'
+                         'pfkldlkgakvevstqtlqnggarvsrdfqsgrtvl')
+        self.assertEqual(record.ec, ['2.7.7.7'])
+        # the pfam entry is on the second line of its note
+        self.assertEqual(record.pfam, ['pfam00712'])
+        self.assertEqual(record.tigrfam, ['TIGR00663'])
+        self.assertEqual(record.db_xrefs, ['taxon:1423', 'CDD:459912',
+                                           'CDD:273205'])
+        self.assertEqual(sorted(record.go), ['GO:0003887', 'GO:0006260',
+                                             'GO:0009360'])
+        self.assertTrue(record.comment.startswith('REFSEQ: This record'))
+
+    def test_several_records(self):
+        with open(os.path.join(data, 'genbank.gp')) as f:
+            text = f.read()
+        records = list(accession.iter_genbank(text * 3))
+        self.assertEqual(len(records), 3)
+        record = accession.accession('ncbi:protein', 'WP_003240137', text)
+        self.assertEqual(record.id, 'WP_003240137')
+        self.assertEqual(record.sequence, records[2].sequence)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest, os, shutil, tempfile, time, zlib, random
+from ontology_oracle.cache import sqlite_cache, directory_cache, open_cache, \
+                                  day
+
+def document(size, seed):
+    # incompressible data, so that the stored size is predictable
+    generator = random.Random(seed)
+    return ''.join(chr(generator.randint(0, 255)) for i in range(size))
+
+class cache_test(object):
+    # the tests common to both kinds of cache; subclasses define location
+    # and entry_size
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.caches = []
+
+    def tearDown(self):
+        # write the pending access times now, rather than at exit, when the
+        # database is gone
+        for cache in self.caches:
+            if isinstance(cache, sqlite_cache):
+                cache.flush()
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        cache = open_cache(os.path.join(self.directory, self.location),
+                           **kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def test_round_trip(self):
+        cache = self.open()
+        text = 'ID   P00330\n' * 500 + '\x00\xff//\n'
+        cache.put('http://www.uniprot.org/uniprot/P00330.txt', text)
+        self.assertEqual(cache.get('http://www.uniprot.org/uniprot/'
+                                   'P00330.txt'), text)
+        # stored compressed
+        self.assertTrue(cache.size < len(text) / 10)
+        self.assertEqual(cache.get('http://www.uniprot.org/uniprot/'
+                                   'Q03503.txt'), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # and kept when the cache is opened again
+        reopened = self.open()
+        self.assertEqual(reopened.size, cache.size)
+        self.assertEqual(reopened.get('http://www.uniprot.org/uniprot/'
+                                      'P00330.txt'), text)
+
+    def test_ttl(self):
+        cache = self.open(default_ttl=day, ttls={'never.example.org': None})
+        self.assertEqual(cache.ttl('http://WWW.EBI.AC.UK/x'), 90 * day)
+        self.assertEqual(cache.ttl('http://other.example.org/x'), day)
+        old = time.time() - 2 * day
+        for url in ('http://other.example.org/a', 'http://www.ebi.ac.uk/a',
+                    'http://never.example.org/a'):
+            # as if stored two days ago
+            cache._put(url, zlib.compress(url), old)
+        cache.put('http://other.example.org/b', 'b')
+
+        self.assertEqual(cache.get('http://other.example.org/a'), None)
+        self.assertEqual(cache.get('http://www.ebi.ac.uk/a'),
+                         'http://www.ebi.ac.uk/a')
+        self.assertEqual(cache.get('http://never.example.org/a'),
+                         'http://never.example.org/a')
+        self.assertEqual(cache.get('http://other.example.org/b'), 'b')
+        # the expired entry is removed
+        self.assertEqual(cache._get('http://other.example.org/a'), None)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_lru_eviction(self):
+        documents = dict((name, document(2000, seed))
+                         for seed, name in enumerate('abcd'))
+        # room for three of the documents
+        cache = self.open(max_size=int(self.entry_size(2000) * 3.5))
+        for name in 'abc':
+            cache.put('http://example.org/%s' % name, documents[name])
+            time.sleep(0.01)
+        self.assertEqual(cache.get('http://example.org/a'), documents['a'])
+        time.sleep(0.01)
+        cache.put('http://example.org/d', documents['d'])
+
+        # b was the least recently used
+        self.assertEqual(cache.evictions, 1)
+        self.assertTrue(cache.size <= cache.max_size)
+        for name in 'acd':
+            self.assertEqual(cache.get('http://example.org/%s' % name),
+                             documents[name])
+        self.assertEqual(cache.get('http://example.org/b'), None)
+
+    def test_clear(self):
+        cache = self.open()
+        cache.put('http://example.org/a', 'a')
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.get('http://example.org/a'), None)
+
+class test_sqlite_cache(cache_test, unittest.TestCase):
+    location = 'cache.db'
+
+    def entry_size(self, size):
+        return len(zlib.compress(document(size, 0), 6))
+
+    def test_kind(self):
+        self.assertTrue(isinstance(self.open(), sqlite_cache))
+
+    def test_flush(self):
+        cache = self.open()
+        cache.put('http://example.org/a', 'a')
+        cache.db.execute('UPDATE responses SET accessed = 0')
+        cache.db.commit()
+        cache.get('http://example.org/a')
+        cache.flush()
+        accessed = cache.db.execute('SELECT accessed FROM responses') \
+                        .fetchone()[0]
+        self.assertTrue(accessed > 0)
+
+class test_directory_cache(cache_test, unittest.TestCase):
+    location = 'cache'
+
+    def entry_size(self, size):
+        # with the header of the stored time and URL
+        return len(zlib.compress(document(size, 0), 6)) + \
+               len('%f\nhttp://example.org/a\n' % time.time())
+
+    def test_kind(self):
+        self.assertTrue(isinstance(self.open(), directory_cache))
+
+if __name__ == '__main__':
+    unittest.main()
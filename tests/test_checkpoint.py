@@ -0,0 +1,77 @@
+import unittest, os, shutil, tempfile
+from ontology_oracle import ontology_table as table_module
+from ontology_oracle.ontology_table import ontology_table
+from ontology_oracle.utils import DownloadError
+
+features_tab = os.path.join(os.path.dirname(__file__), 'data', 'features.tab')
+
+class fake_accession:
+    # what mine_protein returns, with one GO term named after the accession
+    def __init__(self, id):
+        self.gene = ''
+        self.go = ['GO:%s' % id]
+        self.ec = []
+        self.pfam = []
+        self.tigrfam = []
+        self.smart = []
+        self.interpro = []
+
+class test_resume(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'checkpoint')
+        self.services = (table_module.mine_protein,
+                         table_module.prefetch_proteins)
+        table_module.mine_protein = self.mine_protein
+        table_module.prefetch_proteins = self.prefetch_proteins
+        # the accessions mined, and that on which mining fails
+        self.mined = []
+        self.fail_on = None
+
+    def tearDown(self):
+        table_module.mine_protein, table_module.prefetch_proteins = \
+                    self.services
+        shutil.rmtree(self.directory)
+
+    def mine_protein(self, accession, database, gene_name=None,
+                     organism=None, acc=None):
+        if accession == self.fail_on:
+            raise DownloadError(accession, 2)
+        self.mined.append(accession)
+        return fake_accession(accession)
+
+    def prefetch_proteins(self, ids, database, batch_size=None):
+        # the batch retrieval fails, so the records are retrieved one by one
+        raise DownloadError(ids, 2)
+
+    def build(self, resume):
+        return ontology_table('Bacillus subtilis', features_tab, 'locus_tag',
+                              'gene', 'ncbi', 'locus_tag',
+                              'product_accession', 'name', 'TPR_',
+                              progress=False, checkpoint=self.checkpoint,
+                              resume=resume, checkpoint_every=3)
+
+    def test_resume(self):
+        accessions = ['WP_00000%04d.1' % i for i in range(10)]
+        self.fail_on = accessions[7]
+        self.assertRaises(DownloadError, self.build, False)
+        self.assertEqual(self.mined, accessions[:7])
+
+        # the rows mined before the failure are not mined again
+        self.mined = []
+        self.fail_on = None
+        table = self.build(True)
+        self.assertEqual(self.mined, accessions[7:])
+        self.assertEqual(len(table), 10)
+        self.assertEqual(table.terms['go'].tolists(),
+                         [['GO:%s' % a] for a in accessions])
+        self.assertEqual(table.feat_rows[1].gene, 'dnaN')
+        self.assertEqual(table.feat_rows[2].gene, 'TPR_0002')
+
+        # without resume, the checkpoint is discarded
+        self.mined = []
+        self.build(False)
+        self.assertEqual(self.mined, accessions)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest, warnings
+import numpy, pandas
+from scipy.cluster import hierarchy
+from ontology_oracle.clustering import most_variable, cluster_rows, \
+                                       collapse_clusters, arrange
+
+def joined(rows, samples=4, seed=0):
+    # fold changes as returned by join_tables
+    values = numpy.random.RandomState(seed).randn(rows, samples)
+    return pandas.DataFrame(values,
+                            index=pandas.Index(['gene%d' % i
+                                                for i in range(rows)],
+                                               name='gene'),
+                            columns=['s%d' % i for i in range(samples)])
+
+class test_clustering(unittest.TestCase):
+    def test_most_variable(self):
+        data = joined(50)
+        data.iloc[3, 0] = numpy.nan
+        top = most_variable(data, 10)
+        variances = numpy.nanvar(data.values, axis=1)
+        expected = sorted(numpy.argsort(-variances)[:10])
+        self.assertEqual(top.index.tolist(),
+                         data.index[expected].tolist())
+
+    def test_most_variable_missing_rows(self):
+        data = joined(20)
+        data.iloc[[2, 5, 11]] = numpy.nan
+        data.iloc[4] = 1.0
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            top = most_variable(data, 18)
+        # the rows without fold changes rank below the constant row
+        self.assertEqual(top.index.tolist(),
+                         [g for i, g in enumerate(data.index)
+                          if i not in (5, 11)])
+
+    def test_most_variable_more_than_rows(self):
+        data = joined(5)
+        self.assertEqual(most_variable(data, 10).index.tolist(),
+                         data.index.tolist())
+
+    def test_leaf_order(self):
+        data = joined(40)
+        data.iloc[7, 2] = numpy.nan
+        links = hierarchy.linkage(numpy.nan_to_num(data.values),
+                                  method='average', metric='euclidean')
+        expected = data.index[hierarchy.leaves_list(links)].tolist()
+        self.assertEqual(cluster_rows(data).index.tolist(), expected)
+
+    def test_leaf_order_few_rows(self):
+        for rows in (1, 2):
+            data = joined(rows)
+            self.assertEqual(cluster_rows(data).index.tolist(),
+                             data.index.tolist())
+
+    def test_collapsed_groups(self):
+        data = joined(60)
+        links = hierarchy.linkage(data.values, method='average',
+                                  metric='euclidean')
+        assignment = hierarchy.fcluster(links, 6, criterion='maxclust')
+        collapsed = collapse_clusters(data, 6)
+        self.assertEqual(len(collapsed), len(set(assignment)))
+
+        # every cluster of scipy is one row, with the mean of its genes
+        expected = {}
+        for cluster in set(assignment):
+            members = data.values[assignment == cluster]
+            expected[len(members), tuple(numpy.round(members.mean(axis=0),
+                                                     10))] = True
+        for name, row in collapsed.iterrows():
+            size = int(name.split('(')[1].split(' ')[0])
+            key = (size, tuple(numpy.round(row.values, 10)))
+            self.assertTrue(key in expected, name)
+
+    def test_collapse_single_row(self):
+        data = joined(1)
+        collapsed = collapse_clusters(data, 6)
+        self.assertEqual(collapsed.shape, (1, 4))
+
+    def test_arrange(self):
+        data = joined(30)
+        data['annotation'] = 'a'
+        arranged, ordered = arrange(data, top=100, collapse='clusters',
+                                    clusters=4)
+        self.assertTrue(ordered)
+        self.assertFalse('annotation' in arranged.columns)
+        self.assertTrue(len(arranged) <= 4)
+
+        arranged, ordered = arrange(data)
+        self.assertFalse(ordered)
+        self.assertTrue(arranged is data)
+        self.assertRaises(Exception, arrange, data, collapse='bogus')
+
+if __name__ == '__main__':
+    unittest.main()
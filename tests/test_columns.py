@@ -0,0 +1,18 @@
+import unittest
+from ontology_oracle.columns import vocabulary, term_column
+
+class test_term_column(unittest.TestCase):
+    def test_from_strings(self):
+        strings = ['GO:1;GO:1', '', None, float('nan'),
+                   'GO:2;GO:1;GO:2;GO:3', 'GO:3']
+        column = term_column.from_strings(vocabulary(), strings)
+        # duplicates within a row are dropped, keeping the order
+        expected = [['GO:1'], [], [], [], ['GO:2', 'GO:1', 'GO:3'], ['GO:3']]
+        self.assertEqual(column.tolists(), expected)
+        lists = [s.split(';') if isinstance(s, str) and s else []
+                 for s in strings]
+        self.assertEqual(term_column.from_lists(vocabulary(), lists)
+                         .tolists(), expected)
+
+if __name__ == '__main__':
+    unittest.main()
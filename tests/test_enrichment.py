@@ -0,0 +1,154 @@
+import unittest, os
+import numpy
+from scipy.stats import hypergeom
+from ontology_oracle.enrichment import hypergeometric_sf, benjamini_hochberg
+from ontology_oracle import ontology
+from ontology_oracle.obo import obo_ontology
+from ontology_oracle.ontology_table import ontology_table
+
+data = os.path.join(os.path.dirname(__file__), 'data')
+table_csv = os.path.join(data, 'table.csv')
+
+def manual_bh(pvalues):
+    # the Benjamini-Hochberg procedure, one p-value at a time
+    tested = [(p, i) for i, p in enumerate(pvalues) if p == p]
+    tested.sort()
+    m = len(tested)
+    qvalues = [float('nan')] * len(pvalues)
+    smallest = 1.0
+    for rank in range(m, 0, -1):
+        p, i = tested[rank - 1]
+        smallest = min(smallest, p * m / float(rank))
+        qvalues[i] = smallest
+    return qvalues
+
+class test_hypergeometric(unittest.TestCase):
+    def test_against_scipy(self):
+        cases = []
+        for N in (1, 10, 57, 400):
+            for K in sorted(set([0, 1, N / 3, N])):
+                for n in sorted(set([0, 1, N / 2, N])):
+                    for k in range(max(0, n - (N - K)), min(K, n) + 1):
+                        cases.append((k, K, n, N))
+        cases.append((900, 2000, 5000, 20000))
+        cases.append((30, 2000, 5000, 20000))
+        k, K, n, N = numpy.array(cases).T
+        expected = hypergeom.sf(k - 1, N, K, n)
+        numpy.testing.assert_allclose(hypergeometric_sf(k, K, n, N),
+                                      expected, rtol=1e-9, atol=1e-300)
+
+    def test_broadcast(self):
+        k = numpy.array([[0, 1], [2, 3]])
+        p = hypergeometric_sf(k, 5, 4, 20)
+        self.assertEqual(p.shape, (2, 2))
+        numpy.testing.assert_allclose(p, hypergeom.sf(k - 1, 20, 5, 4))
+        self.assertEqual(hypergeometric_sf([], [], [], []).shape, (0,))
+
+class test_benjamini_hochberg(unittest.TestCase):
+    def test_against_manual(self):
+        pvalues = numpy.random.RandomState(3).uniform(0, 0.1, 30)
+        pvalues[[2, 5, 6]] = pvalues[1]
+        numpy.testing.assert_allclose(benjamini_hochberg(pvalues),
+                                      manual_bh(pvalues.tolist()))
+
+    def test_nan_and_columns(self):
+        pvalues = numpy.random.RandomState(4).uniform(0, 1, (12, 3))
+        pvalues[[0, 4], 1] = numpy.nan
+        pvalues[:, 2] = numpy.nan
+        qvalues = benjamini_hochberg(pvalues)
+        for column in range(3):
+            numpy.testing.assert_allclose(qvalues[:, column],
+                                          manual_bh(pvalues[:, column]
+                                                    .tolist()))
+
+class test_table_enrichment(unittest.TestCase):
+    def test_against_counts(self):
+        table = ontology_table(filename=table_csv)
+        values = table.data['foldchange:a:b'].values
+        terms = table.terms['pfam'].tolists()
+        for direction in ('up', 'down', 'both'):
+            result = table.enrichment('a:b', kind='pfam', threshold=1.0,
+                                      direction=direction)
+            measured = [i for i in range(len(table))
+                        if values[i] == values[i] and len(terms[i]) > 0]
+            if direction == 'up':
+                selected = [i for i in measured if values[i] >= 1.0]
+            elif direction == 'down':
+                selected = [i for i in measured if values[i] <= -1.0]
+            else:
+                selected = [i for i in measured if abs(values[i]) >= 1.0]
+
+            # every term of a measured feature is tested, but only those
+            # with a selected feature are reported
+            tested = sorted(set(t for i in measured for t in terms[i]))
+            counts = {}
+            for term in tested:
+                annotated = len([i for i in measured if term in terms[i]])
+                hits = len([i for i in selected if term in terms[i]])
+                counts[term] = (annotated, hits)
+            pvalues = [hypergeom.sf(counts[t][1] - 1, len(measured),
+                                    counts[t][0], len(selected))
+                       for t in tested]
+            qvalues = dict(zip(tested, manual_bh(pvalues)))
+            pvalues = dict(zip(tested, pvalues))
+
+            reported = [t for t in tested if counts[t][1] > 0]
+            self.assertEqual(sorted(result.term), reported)
+            for row in result.itertuples():
+                self.assertEqual((row.annotated, row.selected, row.universe,
+                                  row.total_selected),
+                                 counts[row.term] + (len(measured),
+                                                     len(selected)))
+                self.assertAlmostEqual(row.pvalue, pvalues[row.term])
+                self.assertAlmostEqual(row.qvalue, qvalues[row.term])
+
+class test_unmapped_slims(unittest.TestCase):
+    def setUp(self):
+        # a small ontology with the terms of the table; the GO slims are
+        # its goslim_generic subset
+        self.loaded = (ontology.go_ontology, ontology.cache_go_slims)
+        ontology.go_ontology = obo_ontology.load(os.path.join(data, 'go.obo'),
+                                                 compile=False)
+        ontology.cache_go_slims = []
+
+    def tearDown(self):
+        ontology.go_ontology, ontology.cache_go_slims = self.loaded
+
+    def test_enrichment(self):
+        # like a freshly mined table, with GO terms but no GO slims yet
+        table = ontology_table(filename=table_csv,
+                               columns=['go', 'foldchange:a:b'])
+        self.assertEqual(table.terms['go-slim'].lengths().sum(), 0)
+        full = ontology_table(filename=table_csv)
+        matrix, features, terms = table.incidence('go-slim')
+        expected = full.terms['go-slim'].tolists()
+        for row in range(len(table)):
+            self.assertEqual(sorted(terms[c] for c in matrix[row].indices),
+                             sorted(expected[row]))
+
+        result = table.enrichment('a:b', kind='go-slim', direction='both')
+        expected = full.enrichment('a:b', kind='go-slim', direction='both')
+        self.assertTrue(len(result) > 0)
+        self.assertEqual(result.to_dict('records'),
+                         expected.to_dict('records'))
+
+    def test_regulation_summary(self):
+        table = ontology_table(filename=table_csv,
+                               columns=['go', 'foldchange:a:b'])
+        summary = table.regulation_summary('a:b')
+        full = ontology_table(filename=table_csv)
+        values = full.data['foldchange:a:b'].values
+        slims = full.terms['go-slim'].tolists()
+        expected = {}
+        for row in range(len(full)):
+            for slim in slims[row]:
+                up, down = expected.get(slim, (0, 0))
+                expected[slim] = (up + int(values[row] > 0),
+                                  down + int(values[row] < 0))
+        self.assertEqual(dict((row.term, (row.up, row.down))
+                              for row in summary.itertuples()), expected)
+        self.assertEqual(summary.name[summary.term == 'GO:0016301'].tolist(),
+                         ['kinase activity'])
+
+if __name__ == '__main__':
+    unittest.main()
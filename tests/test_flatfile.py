@@ -0,0 +1,114 @@
+import unittest, os, shutil, tempfile, gzip, zlib, struct
+from ontology_oracle.flatfile import flatfile_index
+from ontology_oracle.accession import split_records
+
+data = os.path.join(os.path.dirname(__file__), 'data')
+
+def bgzip(text, filename, block_size=1000):
+    # writes text as BGZF blocks of block_size bytes (so that records span
+    # several blocks), followed by the empty end-of-file block
+    with open(filename, 'wb') as f:
+        chunks = [text[i:i + block_size]
+                  for i in range(0, len(text), block_size)]
+        for chunk in chunks + ['']:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            deflated = compressor.compress(chunk) + compressor.flush()
+            f.write('\x1f\x8b\x08\x04' + struct.pack('<I', 0) + '\x00\xff' +
+                    struct.pack('<HccHH', 6, 'B', 'C', 2,
+                                12 + 6 + len(deflated) + 8 - 1))
+            f.write(deflated)
+            f.write(struct.pack('<II', zlib.crc32(chunk) & 0xffffffff,
+                                len(chunk)))
+
+class index_test(object):
+    # the same lookups in a plain, gzipped and bgzipped copy of a flat
+    # file; subclasses define filename, format and expected (identifier ->
+    # number of the record)
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.indexes = []
+        with open(os.path.join(data, self.filename)) as f:
+            self.text = f.read()
+        self.records = split_records(self.text)
+
+    def tearDown(self):
+        for index in self.indexes:
+            index.close()
+        shutil.rmtree(self.directory)
+
+    def copy(self, compression):
+        path = os.path.join(self.directory, self.filename)
+        if compression is None:
+            shutil.copy(os.path.join(data, self.filename), path)
+        elif compression == 'gzip':
+            path += '.gz'
+            with gzip.open(path, 'wb') as f:
+                f.write(self.text)
+        else:
+            path += '.bgz'
+            bgzip(self.text, path)
+            # still readable as an ordinary gzip file
+            with gzip.open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.text)
+        return path
+
+    def open(self, path):
+        index = flatfile_index(path, self.format)
+        self.indexes.append(index)
+        return index
+
+    def check(self, compression):
+        path = self.copy(compression)
+        index = self.open(path)
+        self.assertEqual(index.compression, compression)
+        self.assertEqual(len(index), len(self.records))
+        for id, number in self.expected.iteritems():
+            self.assertTrue(id in index)
+            self.assertEqual(index.get(id), self.records[number])
+        self.assertFalse('P99999' in index)
+        self.assertEqual(index.get('P99999'), None)
+
+        # opened again, the index is used as it is
+        built = os.path.getmtime(index.index_filename)
+        reopened = self.open(path)
+        self.assertEqual(os.path.getmtime(reopened.index_filename), built)
+        for id, number in self.expected.iteritems():
+            self.assertEqual(reopened.get(id), self.records[number])
+
+    def test_plain(self):
+        self.check(None)
+
+    def test_gzip(self):
+        self.check('gzip')
+
+    def test_bgzf(self):
+        self.check('bgzf')
+
+    def test_changed_file(self):
+        path = self.copy(None)
+        self.open(path)
+        # the index is rebuilt when the file changes
+        with open(path, 'w') as f:
+            f.write(self.records[-1] + '\n')
+        index = self.open(path)
+        self.assertEqual(len(index), 1)
+        last = len(self.records) - 1
+        for id, number in self.expected.iteritems():
+            self.assertEqual(index.get(id),
+                             self.records[last] if number == last else None)
+
+class test_uniprot_index(index_test, unittest.TestCase):
+    filename = 'uniprot.dat'
+    format = 'uniprot'
+    expected = {'ADH1_YEAST': 0, 'P00330': 0, 'D6VZT4': 0, 'Q03503': 0,
+                'ADH2_YEAST': 1, 'P00331': 1, 'D6VXP1': 1,
+                'ADH3_YEAST': 2, 'P07246': 2}
+
+class test_genbank_index(index_test, unittest.TestCase):
+    filename = 'genbank.gpff'
+    format = 'genbank'
+    expected = {'WP_003240137': 0, 'WP_003240137.1': 0, '489341256': 0,
+                'WP_000000001': 1, 'WP_000000001.1': 1, '1': 1}
+
+if __name__ == '__main__':
+    unittest.main()
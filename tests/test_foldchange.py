@@ -0,0 +1,60 @@
+import unittest, os, itertools
+import numpy
+from ontology_oracle.utils import fold_change, fold_changes
+from ontology_oracle.ontology_table import ontology_table
+
+table_csv = os.path.join(os.path.dirname(__file__), 'data', 'table.csv')
+
+values = [0.0, -0.01, 0.01, 0.5, 1.0, 3.25, 1000.0, 123456.789]
+
+class test_fold_changes(unittest.TestCase):
+    def test_against_fold_change(self):
+        for log2 in (True, False):
+            for round_values in (0.01, 0.0):
+                # the values can't be negative once rounded
+                pairs = [(a, b) for a, b in itertools.product(values, values)
+                         if a + round_values >= 0 and b + round_values >= 0]
+                frm = [a for a, b in pairs]
+                to = [b for a, b in pairs]
+                expected = [fold_change(a, b, log2, round_values)
+                            for a, b in pairs]
+                changes = fold_changes(frm, to, log2, round_values)
+                # infinities must match exactly
+                numpy.testing.assert_allclose(changes, expected,
+                                              rtol=1e-12)
+
+    def test_missing(self):
+        changes = fold_changes([numpy.nan, 1.0], [2.0, numpy.nan])
+        self.assertTrue(numpy.isnan(changes).all())
+
+    def test_all_pairs(self):
+        matrix = numpy.array([values[:3], values[3:6], values[5:8]])
+        changes = fold_changes(matrix, matrix, all_pairs=True)
+        self.assertEqual(changes.shape, (3, 3, 3))
+        for row in range(3):
+            for i in range(3):
+                for j in range(3):
+                    self.assertAlmostEqual(changes[row, i, j],
+                            fold_change(matrix[row, i], matrix[row, j]))
+
+class test_table_fold_changes(unittest.TestCase):
+    def test_calc_foldchange(self):
+        table = ontology_table(filename=table_csv)
+        table.calc_foldchange('b', 'a')
+        table.calc_foldchanges(all_pairs=True, log2=False)
+        a = table.data['expr:a'].values
+        b = table.data['expr:b'].values
+        for row in range(len(table)):
+            stored = table.data['foldchange:b:a'].values[row]
+            if a[row] != a[row] or b[row] != b[row]:
+                self.assertTrue(stored != stored)
+                continue
+            self.assertAlmostEqual(stored, fold_change(b[row], a[row]))
+            # the fold change loaded from the file was written with str()
+            self.assertAlmostEqual(table.data['foldchange:a:b'].values[row],
+                                   fold_change(a[row], b[row]), places=9)
+        # calc_foldchanges skips a:b and b:a, which are already there
+        self.assertEqual(table.foldchanges, ['a:b', 'b:a'])
+
+if __name__ == '__main__':
+    unittest.main()
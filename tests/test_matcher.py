@@ -0,0 +1,59 @@
+import unittest, re, random
+from ontology_oracle.matcher import pattern_matcher
+
+def re_find(patterns, text, ignore_case=False, whole_words=False):
+    # the indexes of the patterns found by the re module
+    flags = re.IGNORECASE if ignore_case else 0
+    found = []
+    for index, pattern in enumerate(patterns):
+        if len(pattern) == 0:
+            continue
+        expression = re.escape(pattern)
+        if whole_words:
+            if re.match(r'\w', pattern[0]):
+                expression = r'\b' + expression
+            if re.match(r'\w', pattern[-1]):
+                expression = expression + r'\b'
+        if re.search(expression, text, flags):
+            found.append(index)
+    return found
+
+class test_pattern_matcher(unittest.TestCase):
+    patterns = ['dehydrogenase', 'hydrogen', 'DNA polymerase', 'kinase',
+                'ase', 'ATP-binding', 'he', 'she', 'his', 'hers', '']
+
+    def test_overlapping(self):
+        matcher = pattern_matcher(['he', 'she', 'his', 'hers'])
+        self.assertEqual(sorted(matcher.matches('ushers')),
+                         [(1, 1), (2, 0), (2, 3)])
+
+    def test_against_re(self):
+        texts = ['alcohol dehydrogenase', 'DNA polymerase III subunit',
+                 'ATP-binding protein', 'histidine kinase', 'ushers',
+                 'Kinase, dna Polymerase', '', 'hypothetical protein']
+        for text in texts:
+            for ignore_case in (False, True):
+                for whole_words in (False, True):
+                    matcher = pattern_matcher(self.patterns, ignore_case,
+                                              whole_words)
+                    self.assertEqual(matcher.find(text),
+                                     re_find(self.patterns, text,
+                                             ignore_case, whole_words),
+                                     (text, ignore_case, whole_words))
+
+    def test_random_against_re(self):
+        rand = random.Random(1)
+        words = lambda n: ' '.join(''.join(rand.choice('abc')
+                                           for i in range(rand.randint(1, 4)))
+                                   for j in range(n))
+        patterns = [words(rand.randint(1, 2)) for i in range(40)]
+        for i in range(200):
+            text = words(12)
+            for whole_words in (False, True):
+                matcher = pattern_matcher(patterns, whole_words=whole_words)
+                self.assertEqual(matcher.find(text),
+                                 re_find(patterns, text,
+                                         whole_words=whole_words), text)
+
+if __name__ == '__main__':
+    unittest.main()
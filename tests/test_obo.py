@@ -0,0 +1,57 @@
+import unittest, os, shutil, tempfile
+from ontology_oracle import ontology, utils
+from ontology_oracle.obo import obo_ontology
+
+go_obo = os.path.join(os.path.dirname(__file__), 'data', 'go.obo')
+
+generic = ['GO:0005198', 'GO:0016491', 'GO:0016301', 'GO:0016779',
+           'GO:0043167']
+
+class test_subsets(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.loaded = (ontology.go_ontology, ontology.cache_go_slims,
+                       ontology.cache_go)
+        self.offline = utils.offline
+        # nothing is downloaded
+        utils.set_offline()
+
+    def tearDown(self):
+        ontology.go_ontology, ontology.cache_go_slims, ontology.cache_go = \
+                    self.loaded
+        utils.set_offline(self.offline)
+        shutil.rmtree(self.directory)
+
+    def test_parse(self):
+        with open(go_obo) as f:
+            ont = obo_ontology.parse(f)
+        self.assertEqual(ont.subset('goslim_generic'), generic)
+        self.assertEqual(ont.subset('goslim_yeast'), ['GO:0000166'])
+        self.assertEqual(ont.subset('goslim_plant'), [])
+        self.assertEqual(ont.term('GO:0016301').subsets, ['goslim_generic'])
+        self.assertEqual(ont.term('GO:0005524').subsets, [])
+
+    def copy(self):
+        # (loading writes the precompiled form alongside the OBO file)
+        filename = os.path.join(self.directory, 'go.obo')
+        shutil.copy(go_obo, filename)
+        return filename
+
+    def test_compiled(self):
+        filename = self.copy()
+        obo_ontology.load(filename)
+        self.assertTrue(os.path.exists('%s.pkl' % filename))
+        ont = obo_ontology.load_compiled('%s.pkl' % filename)
+        self.assertEqual(ont.subset('goslim_generic'), generic)
+
+    def test_slims_from_loaded_ontology(self):
+        ontology.cache_go_slims = []
+        ontology.load_go(self.copy())
+        self.assertEqual(ontology.cache_go_slims, generic)
+        # the yeast slim is not among the mapped slims of ATP binding
+        self.assertEqual(ontology.map_to_slims(['GO:0005524', 'GO:0003735',
+                                                'GO:0003674']),
+                         [['GO:0043167'], ['GO:0005198'], []])
+
+if __name__ == '__main__':
+    unittest.main()
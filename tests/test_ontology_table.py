@@ -0,0 +1,101 @@
+import unittest, os, shutil, tempfile
+import numpy
+from ontology_oracle.ontology_table import ontology_table
+
+table_csv = os.path.join(os.path.dirname(__file__), 'data', 'table.csv')
+
+class test_round_trip(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(table_csv) as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def dumped(self, table):
+        filename = os.path.join(self.directory, 'dumped.csv')
+        table.dump(filename)
+        with open(filename) as f:
+            return f.read()
+
+    def test_csv(self):
+        # the numbers are written back with str(), as they were read
+        table = ontology_table(filename=table_csv)
+        self.assertEqual(len(table), 40)
+        self.assertEqual(self.dumped(table), self.text)
+
+    def test_csv_columns(self):
+        table = ontology_table(filename=table_csv,
+                               columns=['foldchange:a:b'])
+        self.assertEqual(table.foldchanges, ['a:b'])
+        self.assertEqual(table.expression_labels, [])
+        full = ontology_table(filename=table_csv)
+        numpy.testing.assert_array_equal(table.data['foldchange:a:b'].values,
+                                         full.data['foldchange:a:b'].values)
+
+    def binary(self, format, module=None):
+        if module is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                self.skipTest('%s is not installed' % module)
+        table = ontology_table(filename=table_csv)
+        filename = os.path.join(self.directory, 'table.%s' % format)
+        table.dump(filename, format=format)
+
+        loaded = ontology_table(filename=filename)
+        self.assertEqual(self.dumped(loaded), self.text)
+        for kind in table.terms:
+            self.assertEqual(loaded.terms[kind].tolists(),
+                             table.terms[kind].tolists())
+
+        loaded = ontology_table(filename=filename,
+                                columns=['foldchange:a:b', 'pfam'])
+        self.assertEqual(loaded.foldchanges, ['a:b'])
+        self.assertEqual(loaded.expression_labels, [])
+        self.assertEqual(loaded.terms['pfam'].tolists(),
+                         table.terms['pfam'].tolists())
+        numpy.testing.assert_array_equal(loaded.data['foldchange:a:b'].values,
+                                         table.data['foldchange:a:b'].values)
+
+    def test_npz(self):
+        self.binary('npz')
+
+    def test_parquet(self):
+        self.binary('parquet', 'pyarrow')
+
+    def test_hdf5(self):
+        self.binary('hdf5', 'h5py')
+
+    def test_unicode(self):
+        table = ontology_table(filename=table_csv)
+        table.data['description'].values[0] = u'\u03b2-lactamase'
+        filename = os.path.join(self.directory, 'table.npz')
+        table.dump(filename, format='npz')
+        loaded = ontology_table(filename=filename)
+        self.assertEqual(loaded.data['description'].values[0],
+                         '\xce\xb2-lactamase')
+        self.assertTrue(self.dumped(table).split('\n')[1].startswith(
+                        'genea0,TPR_0000,"\xce\xb2-lactamase",'))
+
+class test_incidence(unittest.TestCase):
+    def test_cache(self):
+        table = ontology_table(filename=table_csv)
+        matrix, features, terms = table.incidence('pfam')
+        self.assertTrue(table.incidence('pfam')[0] is matrix)
+        self.assertEqual(matrix.shape, (40, len(terms)))
+        for row in range(len(table)):
+            self.assertEqual(sorted(terms[c] for c in matrix[row].indices),
+                             sorted(table.terms['pfam'][row]))
+
+        # changing a row or its terms rebuilds the matrix
+        table.feat_rows[0].feature = 'RENAMED'
+        self.assertEqual(table.incidence('pfam')[1][0], 'RENAMED')
+        table.feat_rows[1].pfam = ['pfam99999']
+        matrix, features, terms = table.incidence('pfam')
+        self.assertEqual([terms[c] for c in matrix[1].indices],
+                         ['pfam99999'])
+
+if __name__ == '__main__':
+    unittest.main()